@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+PER_PROCESS_CACHES = [
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+]
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Cached recipe details, feed rankings and unread counts are shared between requests, so with
+    several workers the cache has to be shared too, or each worker serves and evicts its own copy.
+    """
+    if settings.CACHES["default"]["BACKEND"] not in PER_PROCESS_CACHES:
+        return []
+    return [
+        Warning(
+            "The default cache is not shared between processes.",
+            hint="Set CACHE_BACKEND and CACHE_LOCATION to a shared cache (e.g. Redis) when running several workers.",
+            id="core.W001",
+        )
+    ]
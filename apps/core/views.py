@@ -6,8 +6,11 @@ from rest_framework.views import APIView
 from rest_framework.exceptions import NotFound, APIException
 from rest_framework.pagination import PageNumberPagination
 from django.db.models import Case, When, Value, IntegerField
+from django.db import transaction
 from django.utils import timezone
 
+from apps.feed.services import backfill_timeline, prune_timeline
+
 from .models import Follow, UserProfile, TermsOfServiceVersion
 from .serializers import UserSearchSerializer, TermsOfServiceVersionSerializer
 
@@ -299,7 +302,9 @@ class FollowToggleView(APIView):
         if Follow.objects.filter(follower=follower, followed=user_to_follow).exists():
             return Response({"detail": "You are already following this user."}, status=status.HTTP_400_BAD_REQUEST)
 
-        Follow.objects.create(follower=follower, followed=user_to_follow)
+        with transaction.atomic():
+            Follow.objects.create(follower=follower, followed=user_to_follow)
+            backfill_timeline(follower, user_to_follow)
         return Response({"detail": f"Successfully followed {user_to_follow.username}."}, status=status.HTTP_201_CREATED)
 
     def delete(self, request, pk, format=None):
@@ -313,7 +318,9 @@ class FollowToggleView(APIView):
 
         try:
             follow_instance = Follow.objects.get(follower=follower, followed=user_to_unfollow)
-            follow_instance.delete()
+            with transaction.atomic():
+                follow_instance.delete()
+                prune_timeline(follower, user_to_unfollow)
             return Response(
                 {"detail": f"Successfully unfollowed {user_to_unfollow.username}."}, status=status.HTTP_204_NO_CONTENT
             )
@@ -0,0 +1,163 @@
+"""
+Push notifications for home timelines, streamed to clients as Server-Sent Events.
+
+Events are small hints ("an author you follow published" or edited, "the counters of an item changed")
+so clients refetch the feed only when something changed. They are published on the channel
+of the item's author; a client's stream listens to the channels of the users it follows and
+its own, so publishing does not depend on the number of followers.
+
+The broker is set by FEED_EVENT_BROKER. InProcessBroker only reaches streams served by the
+same process; PostgresNotifyBroker (the default) relays events through Postgres LISTEN/NOTIFY
+so every worker process receives them.
+
+Streams need the ASGI app (foodplanner.asgi); under WSGI the events endpoint only answers with
+a heartbeat, so a request does not hold a worker for the length of a stream.
+"""
+
+import asyncio
+import json
+import logging
+import select
+import threading
+from functools import lru_cache
+
+import psycopg2
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 100
+
+
+def author_channel(user_id) -> str:
+    return f"author:{user_id}"
+
+
+class Subscription:
+    """Events of a set of channels, read by one stream from its event loop."""
+
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = set(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def offer(self, event) -> None:
+        """Queues an event, from any thread. Events are hints, so a full queue drops them."""
+
+        def put():
+            try:
+                self.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                pass
+
+        try:
+            self.loop.call_soon_threadsafe(put)
+        except RuntimeError:  # The stream's event loop is closed
+            self.broker.unsubscribe(self)
+
+    async def get(self, timeout):
+        """Returns the next event, or None if there was none within the timeout (seconds)."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self) -> None:
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """Delivers events to the streams served by this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}  # Channel -> set of subscriptions
+
+    def subscribe(self, channels) -> Subscription:
+        """Must be called from the event loop of the stream that reads the subscription."""
+        subscription = Subscription(self, channels)
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscriptions.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription) -> None:
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscriptions.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[channel]
+
+    def deliver(self, channel, event) -> None:
+        """Hands an event to the local subscribers of a channel."""
+        with self._lock:
+            subscribers = list(self._subscriptions.get(channel, ()))
+        for subscription in subscribers:
+            subscription.offer(event)
+
+    def publish(self, channel, event) -> None:
+        self.deliver(channel, event)
+
+
+class PostgresNotifyBroker(InProcessBroker):
+    """
+    Relays events between worker processes with Postgres NOTIFY. Each process listens on a
+    dedicated connection from a background thread, started with its first subscription.
+    """
+
+    pg_channel = "feed_events"
+    poll_interval = 5  # Seconds between checks of the listening connection
+
+    def __init__(self):
+        super().__init__()
+        self._listener = None
+
+    def subscribe(self, channels) -> Subscription:
+        with self._lock:
+            if self._listener is None or not self._listener.is_alive():
+                self._listener = threading.Thread(target=self._listen, name="feed-events-listener", daemon=True)
+                self._listener.start()
+        return super().subscribe(channels)
+
+    def publish(self, channel, event) -> None:
+        # NOTIFY payloads are limited to 8000 bytes, events are much smaller
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_notify(%s, %s)", [self.pg_channel, json.dumps({"channel": channel, "event": event})]
+            )
+
+    def _listen(self) -> None:
+        while True:
+            listener = None
+            try:
+                listener = psycopg2.connect(**connections["default"].get_connection_params())
+                listener.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with listener.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.pg_channel}")
+                while True:
+                    if select.select([listener], [], [], self.poll_interval) == ([], [], []):
+                        continue
+                    listener.poll()
+                    while listener.notifies:
+                        message = json.loads(listener.notifies.pop(0).payload)
+                        self.deliver(message["channel"], message["event"])
+            except (psycopg2.Error, OSError):
+                logger.exception("Feed event listener lost its connection, reconnecting")
+                if listener is not None:
+                    listener.close()
+                threading.Event().wait(self.poll_interval)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.FEED_EVENT_BROKER)()
+
+
+def publish_event(author_id, event) -> None:
+    """Publishes an event on an author's channel once the current transaction commits."""
+    transaction.on_commit(lambda: get_broker().publish(author_channel(author_id), event))
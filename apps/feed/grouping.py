@@ -0,0 +1,95 @@
+"""
+Collapsing of related feed events into one card.
+
+Ratings of the same recipe within the same FEED_GROUP_WINDOW_HOURS time bucket (fixed buckets
+counted from the epoch) form one group; every other item is a group of its own. Groups are
+computed by the database in one grouped query per page, each with its latest item, the item
+ids and the distinct actors, so only one item per card is loaded and serialized.
+
+Pages are read by keyset, like the plain timeline: each page groups only the newest
+FEED_GROUP_CANDIDATES items older than the cursor (plus the rest of their buckets, so the
+groups shown are complete), and skips the groups shown on earlier pages. There is no total
+count, so the cost of a page does not grow with the length of the timeline.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db.models import Case, CharField, Count, F, IntegerField, Max, Q, Value, When
+from django.db.models.functions import Cast, Concat, Extract, Floor
+
+from .models import FeedItem
+
+GROUPED_EVENT_TYPES = [FeedItem.EventType.NEW_RATING, FeedItem.EventType.UPDATE_RATING]
+MAX_GROUP_ACTORS = 10  # Usernames listed per card, the count covers all of them
+
+
+def _group_key():
+    bucket = Cast(
+        Floor(Extract("timeline_created_on", "epoch") / (settings.FEED_GROUP_WINDOW_HOURS * 3600)), IntegerField()
+    )
+    return Case(
+        When(
+            event_type__in=GROUPED_EVENT_TYPES,
+            recipe__isnull=False,
+            then=Concat(Value("recipe:"), Cast("recipe_id", CharField()), Value(":"), Cast(bucket, CharField())),
+        ),
+        default=Concat(Value("item:"), Cast("id", CharField())),
+        output_field=CharField(),
+    )
+
+
+def older_than(created_on, feed_item_id):
+    """Filter for timeline rows after the key (created_on, feed item id) in newest first order."""
+    return Q(timeline_created_on__lt=created_on) | Q(timeline_created_on=created_on, timeline_id__lt=feed_item_id)
+
+
+def group_timeline(timeline, limit, before=None):
+    """
+    Groups a timeline queryset (annotated with its sort key) into up to `limit` cards, newest
+    first, starting below the `before` key (created_on, feed item id) of the last card of the
+    previous page. Returns the cards and the key to pass as `before` for the next page, or None
+    on the last page. Cards are {"group_key", "latest_created_on", "feed_item_ids" (newest
+    first, so the first is the card's own key with latest_created_on), "actors", "count"}.
+    """
+    candidates = settings.FEED_GROUP_CANDIDATES
+    window = timedelta(hours=settings.FEED_GROUP_WINDOW_HOURS)
+    timeline = timeline.annotate(group_key=_group_key())
+    if before is not None:
+        created_on, feed_item_id = before
+        # Groups shown on earlier pages: their older items are within one bucket of the cursor
+        shown = timeline.filter(
+            ~older_than(created_on, feed_item_id), timeline_created_on__lte=created_on + window
+        ).values("group_key")
+        timeline = timeline.filter(older_than(created_on, feed_item_id)).exclude(group_key__in=shown)
+
+    # Only groups whose latest item is among the newest candidates are returned; reading one
+    # bucket further down gives them all their items
+    boundary = (
+        timeline.order_by("-timeline_created_on", "-timeline_id")
+        .values_list("timeline_created_on", flat=True)[candidates - 1 : candidates]
+        .first()
+    )
+    groups = timeline
+    if boundary is not None:
+        groups = groups.filter(timeline_created_on__gte=boundary - window)
+    groups = (
+        groups.values("group_key")
+        .annotate(
+            latest_created_on=Max("timeline_created_on"),
+            feed_item_ids=ArrayAgg("id", ordering=(F("timeline_created_on").desc(), F("id").desc())),
+            actors=ArrayAgg("user__username", distinct=True, ordering="user__username"),
+            count=Count("id"),
+        )
+        .order_by("-latest_created_on", "-feed_item_ids")  # Arrays compare by their first (latest) id
+    )
+    if boundary is not None:
+        groups = groups.filter(latest_created_on__gte=boundary)
+
+    cards = list(groups[: limit + 1])
+    # Older items may remain past a full page, or past the candidates when they were all read
+    if len(cards) > limit or (boundary is not None and cards):
+        cards = cards[:limit]
+        return cards, (cards[-1]["latest_created_on"], cards[-1]["feed_item_ids"][0])
+    return cards, None
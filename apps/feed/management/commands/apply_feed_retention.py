@@ -0,0 +1,38 @@
+from argparse import BooleanOptionalAction
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.feed.retention import drop_timeline_partitions, ensure_timeline_partitions, prune_feed_items
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates the upcoming monthly timeline partitions, then drops the partitions and deletes the "
+        "feed items older than FEED_RETENTION_DAYS. "
+        "Run it daily, so partitions always exist before their month starts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--keep-commented",
+            action=BooleanOptionalAction,
+            default=settings.FEED_RETENTION_KEEP_COMMENTED,
+            help="Keep old feed items that have comments",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000, help="Feed items deleted per transaction")
+
+    def handle(self, *args, **options):
+        created = ensure_timeline_partitions()
+        if created:
+            self.stdout.write(f"Created partitions: {', '.join(created)}")
+
+        before = timezone.now() - timedelta(days=settings.FEED_RETENTION_DAYS)
+        dropped = drop_timeline_partitions(before, keep_commented=options["keep_commented"])
+        if dropped:
+            self.stdout.write(f"Dropped partitions: {', '.join(dropped)}")
+
+        deleted = prune_feed_items(before, keep_commented=options["keep_commented"], batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} feed items"))
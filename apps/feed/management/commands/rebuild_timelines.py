@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from apps.feed.services import rebuild_timelines
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuilds the materialized home timelines from feed items and follows, "
+        "e.g. after deploying timelines or changing FEED_CELEBRITY_FOLLOWER_THRESHOLD."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, nargs="+", dest="user_ids", help="Only rebuild these users' timelines")
+
+    def handle(self, *args, **options):
+        written = rebuild_timelines(options["user_ids"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} timeline entries"))
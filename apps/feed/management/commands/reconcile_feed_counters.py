@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from apps.feed.services import reconcile_feed_counters
+
+
+class Command(BaseCommand):
+    help = "Recounts the stored like and comment counts of feed items and fixes any that drifted."
+
+    def handle(self, *args, **options):
+        fixed = reconcile_feed_counters()
+        self.stdout.write(self.style.SUCCESS(f"Fixed the counters of {fixed} feed items"))
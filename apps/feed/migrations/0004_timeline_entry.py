@@ -0,0 +1,95 @@
+# Generated by Django 4.2.20 on 2026-10-19 10:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+BACKFILL_TIMELINES = """
+    INSERT INTO {timeline} (user_id, feed_item_id, author_id, created_on)
+    SELECT timeline.user_id, item.id, item.user_id, item.created_on
+    FROM {feed_item} AS item
+    JOIN (
+        SELECT id AS user_id, id AS author_id FROM {user}
+        UNION ALL
+        SELECT follower_id, followed_id
+        FROM {follow}
+        WHERE followed_id NOT IN (
+            SELECT followed_id FROM {follow} GROUP BY followed_id HAVING COUNT(*) >= %s
+        )
+    ) AS timeline ON timeline.author_id = item.user_id
+    ON CONFLICT DO NOTHING
+"""
+
+
+def backfill_timelines(apps, schema_editor):
+    """Fills the timelines from the existing feed items and follows, like services.rebuild_timelines."""
+    tables = {
+        "timeline": apps.get_model("feed", "TimelineEntry")._meta.db_table,
+        "feed_item": apps.get_model("feed", "FeedItem")._meta.db_table,
+        "user": apps.get_model(settings.AUTH_USER_MODEL)._meta.db_table,
+        "follow": apps.get_model("core", "Follow")._meta.db_table,
+    }
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(BACKFILL_TIMELINES.format(**tables), [settings.FEED_CELEBRITY_FOLLOWER_THRESHOLD])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("core", "0001_initial"),
+        ("feed", "0003_feeditemcomment_feeditemlike"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TimelineEntry",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_on", models.DateTimeField()),
+                (
+                    "author",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "feed_item",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="timeline_entries",
+                        to="feed.feeditem",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="timeline_entries",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["user", "-created_on", "-feed_item"],
+                        name="timeline_user_created_idx",
+                    ),
+                    models.Index(fields=["user", "author"], name="timeline_user_author_idx"),
+                ],
+                "unique_together": {("user", "feed_item")},
+            },
+        ),
+        migrations.RunPython(backfill_timelines, reverse_code=migrations.RunPython.noop),
+    ]
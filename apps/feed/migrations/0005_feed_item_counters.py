@@ -0,0 +1,30 @@
+# Generated by Django 4.2.20 on 2026-10-19 11:02
+
+from django.db import migrations, models
+
+BACKFILL_COUNTERS = """
+    UPDATE feed_feeditem AS item SET
+        like_count = (SELECT COUNT(*) FROM feed_feeditemlike WHERE feed_item_id = item.id),
+        comment_count = (SELECT COUNT(*) FROM feed_feeditemcomment WHERE feed_item_id = item.id)
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("feed", "0004_timeline_entry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="feeditem",
+            name="comment_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="feeditem",
+            name="like_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunSQL(BACKFILL_COUNTERS, reverse_sql=migrations.RunSQL.noop),
+    ]
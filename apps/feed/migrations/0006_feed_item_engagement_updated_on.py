@@ -0,0 +1,24 @@
+# Generated by Django 4.2.20 on 2026-10-19 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("feed", "0005_feed_item_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="feeditem",
+            name="engagement_updated_on",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="feeditem",
+            index=models.Index(
+                fields=["engagement_updated_on"], name="feeditem_engagement_idx"
+            ),
+        ),
+    ]
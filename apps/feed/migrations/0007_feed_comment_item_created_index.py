@@ -0,0 +1,20 @@
+# Generated by Django 4.2.20 on 2026-10-19 11:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("feed", "0006_feed_item_engagement_updated_on"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="feeditemcomment",
+            index=models.Index(
+                fields=["feed_item", "created_at", "id"],
+                name="feedcomment_item_created_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,144 @@
+# Generated by Django 4.2.20 on 2026-10-19 11:08
+
+from datetime import date
+
+from django.conf import settings
+from django.db import migrations
+
+TABLE = "feed_timelineentry"
+OLD_TABLE = f"{TABLE}_old"
+
+CREATE_TABLE = f"""
+    CREATE SEQUENCE {TABLE}_id_seq;
+    CREATE TABLE {TABLE} (
+        id bigint NOT NULL DEFAULT nextval('{TABLE}_id_seq'),
+        created_on timestamp with time zone NOT NULL,
+        author_id integer NOT NULL,
+        feed_item_id bigint NOT NULL,
+        user_id integer NOT NULL,
+        CONSTRAINT {TABLE}_pkey PRIMARY KEY (id, created_on),
+        CONSTRAINT {{unique_name}} UNIQUE (user_id, feed_item_id, created_on)
+    ) PARTITION BY RANGE (created_on);
+    ALTER SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id;
+    CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT;
+"""
+
+CREATE_UNPARTITIONED_TABLE = f"""
+    CREATE TABLE {TABLE} (
+        id bigint NOT NULL GENERATED BY DEFAULT AS IDENTITY,
+        created_on timestamp with time zone NOT NULL,
+        author_id integer NOT NULL,
+        feed_item_id bigint NOT NULL,
+        user_id integer NOT NULL,
+        CONSTRAINT {TABLE}_pkey PRIMARY KEY (id),
+        CONSTRAINT {{unique_name}} UNIQUE (user_id, feed_item_id)
+    );
+"""
+
+COPY_ROWS = f"""
+    INSERT INTO {TABLE} (id, created_on, author_id, feed_item_id, user_id)
+    SELECT id, created_on, author_id, feed_item_id, user_id FROM {OLD_TABLE}
+    ON CONFLICT DO NOTHING;
+    SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), COALESCE((SELECT MAX(id) FROM {TABLE}), 0) + 1, false);
+    SET CONSTRAINTS ALL IMMEDIATE;  -- Indexes cannot be created with deferred checks pending
+    DROP TABLE {OLD_TABLE};
+"""
+
+
+def _next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _unique_name(schema_editor, columns):
+    return schema_editor._create_index_name(TABLE, columns, suffix="_uniq")
+
+
+def _move_aside(cursor):
+    """
+    Renames the table, its sequence and the indexes backing its constraints out of the way, and
+    returns the definitions of its other indexes and its foreign keys, to be recreated on the new
+    table. Names are read from the schema, as they depend on how the table was created.
+    """
+    cursor.execute(
+        """
+        SELECT indexname, indexdef FROM pg_indexes
+        WHERE schemaname = current_schema() AND tablename = %s
+            AND indexname NOT IN (SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)
+        """,
+        [TABLE, TABLE],
+    )
+    indexes = [indexdef.replace(" ON ONLY ", " ON ") for _, indexdef in cursor.fetchall()]
+    cursor.execute(
+        "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass",
+        [TABLE],
+    )
+    constraints = cursor.fetchall()
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+    (sequence,) = cursor.fetchone()
+
+    cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {OLD_TABLE}")
+    for name, kind, _ in constraints:
+        if kind in ("p", "u"):
+            cursor.execute(f'ALTER TABLE {OLD_TABLE} RENAME CONSTRAINT "{name}" TO "{name[:59]}_old"')
+    cursor.execute(f"ALTER SEQUENCE {sequence} RENAME TO {OLD_TABLE}_id_seq")
+    foreign_keys = [(name, definition) for name, kind, definition in constraints if kind == "f"]
+    return indexes, foreign_keys
+
+
+def _recreate(cursor, indexes, foreign_keys):
+    for indexdef in indexes:
+        cursor.execute(indexdef)
+    for name, definition in foreign_keys:
+        cursor.execute(f'ALTER TABLE {TABLE} ADD CONSTRAINT "{name}" {definition}')
+
+
+def partition_timeline(apps, schema_editor):
+    """Recreates the timeline as a table partitioned by month, with partitions from its oldest entry to next month."""
+    with schema_editor.connection.cursor() as cursor:
+        indexes, foreign_keys = _move_aside(cursor)
+        cursor.execute(
+            CREATE_TABLE.format(unique_name=_unique_name(schema_editor, ["user_id", "feed_item_id", "created_on"]))
+        )
+        cursor.execute(f"SELECT MIN(created_on), NOW() FROM {OLD_TABLE}")
+        oldest, now = cursor.fetchone()
+        month = (oldest or now).date().replace(day=1)
+        last = _next_month(now.date().replace(day=1))
+        while month <= last:
+            cursor.execute(
+                f"CREATE TABLE {TABLE}_p{month:%Y%m} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)",
+                [month, _next_month(month)],
+            )
+            month = _next_month(month)
+        cursor.execute(COPY_ROWS)
+        _recreate(cursor, indexes, foreign_keys)
+
+
+def unpartition_timeline(apps, schema_editor):
+    """Recreates the timeline as a plain table, unique per user and feed item again."""
+    with schema_editor.connection.cursor() as cursor:
+        indexes, foreign_keys = _move_aside(cursor)
+        cursor.execute(
+            CREATE_UNPARTITIONED_TABLE.format(unique_name=_unique_name(schema_editor, ["user_id", "feed_item_id"]))
+        )
+        cursor.execute(COPY_ROWS)  # Also drops the partitions
+        _recreate(cursor, indexes, foreign_keys)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("feed", "0008_feed_read_marker"),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunPython(partition_timeline, reverse_code=unpartition_timeline)],
+            state_operations=[
+                migrations.AlterUniqueTogether(
+                    name="timelineentry",
+                    unique_together={("user", "feed_item", "created_on")},
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-19 11:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("feed", "0009_partition_timeline"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="feeditem",
+            name="updated_on",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
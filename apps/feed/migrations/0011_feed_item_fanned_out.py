@@ -0,0 +1,43 @@
+# Generated by Django 4.2.20 on 2026-10-19 11:48
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def mark_celebrity_items(apps, schema_editor):
+    """Items of current celebrities were not fanned out (see 0004); they are read from the authors' items."""
+    Follow = apps.get_model("core", "Follow")
+    FeedItem = apps.get_model("feed", "FeedItem")
+    celebrity_ids = (
+        Follow.objects.values("followed")
+        .annotate(followers=Count("id"))
+        .filter(followers__gte=settings.FEED_CELEBRITY_FOLLOWER_THRESHOLD)
+        .values("followed")
+    )
+    FeedItem.objects.filter(user_id__in=celebrity_ids).update(fanned_out=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0001_initial"),
+        ("feed", "0010_feed_item_updated_on"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="feeditem",
+            name="fanned_out",
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddIndex(
+            model_name="feeditem",
+            index=models.Index(
+                condition=models.Q(("fanned_out", False)),
+                fields=["user", "-created_on", "-id"],
+                name="feeditem_direct_idx",
+            ),
+        ),
+        migrations.RunPython(mark_celebrity_items, reverse_code=migrations.RunPython.noop),
+    ]
@@ -1,5 +1,6 @@
 from django.conf import settings
 from django.db import models
+from django.db.models import Q
 from django.utils.translation import gettext_lazy as _
 
 from apps.recipes.models import Recipe, RecipeRating
@@ -20,14 +21,65 @@ class FeedItem(models.Model):
     created_on = models.DateTimeField(auto_now_add=True)
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, null=True, blank=True)
     rating = models.ForeignKey(RecipeRating, on_delete=models.CASCADE, null=True, blank=True)
+    # Denormalized engagement counters, kept in step by services.py (reconcile_feed_counters fixes drift)
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    engagement_updated_on = models.DateTimeField(null=True, blank=True)  # Last change of the counters
+    updated_on = models.DateTimeField(null=True, blank=True)  # Last edit of the recipe or rating, see services.py
+    # False for items of celebrities, which are read from the author's items instead of the followers' timelines
+    fanned_out = models.BooleanField(default=True)
 
     class Meta:
         ordering = ["-created_on"]
+        indexes = [
+            models.Index(fields=["engagement_updated_on"], name="feeditem_engagement_idx"),
+            models.Index(
+                fields=["user", "-created_on", "-id"], condition=Q(fanned_out=False), name="feeditem_direct_idx"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.get_event_type_display()} - {self.created_on.strftime('%Y-%m-%d')}"
 
 
+class TimelineEntry(models.Model):
+    """
+    A feed item in a user's home timeline, written when the item is published (fan-out on write)
+    so reading the timeline is a range scan over (user, created_on). See services.py.
+
+    The table is partitioned by month of created_on (see retention.py), so Postgres requires
+    the partition key in unique constraints: the primary key is (id, created_on) in the database.
+    All entries of a feed item share its created_on, so (user, feed_item) stays unique.
+    """
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="timeline_entries")
+    feed_item = models.ForeignKey(FeedItem, on_delete=models.CASCADE, related_name="timeline_entries")
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    created_on = models.DateTimeField()  # Copy of the feed item's, for the timeline index
+
+    class Meta:
+        unique_together = ("user", "feed_item", "created_on")
+        indexes = [
+            models.Index(fields=["user", "-created_on", "-feed_item"], name="timeline_user_created_idx"),
+            models.Index(fields=["user", "author"], name="timeline_user_author_idx"),
+        ]
+
+    def __str__(self):
+        return f"FeedItem {self.feed_item_id} in timeline of user {self.user_id}"
+
+
+class FeedReadMarker(models.Model):
+    """How far a user has read their home timeline: the timeline key of the newest item they saw."""
+
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="feed_read_marker")
+    last_seen_created_on = models.DateTimeField()
+    last_seen_id = models.BigIntegerField()
+    updated_on = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"User {self.user_id} read the feed up to FeedItem {self.last_seen_id}"
+
+
 class FeedItemLike(models.Model):
     """Represents a user liking a specific feed item."""
 
@@ -57,6 +109,7 @@ class FeedItemComment(models.Model):
 
     class Meta:
         ordering = ["created_at"]
+        indexes = [models.Index(fields=["feed_item", "created_at", "id"], name="feedcomment_item_created_idx")]
         verbose_name = "Feed Item Comment"
         verbose_name_plural = "Feed Item Comments"
 
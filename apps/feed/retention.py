@@ -0,0 +1,141 @@
+"""
+Retention of feed data.
+
+Timeline entries live in a table partitioned by month of created_on (migration 0009), plus a
+default partition for entries outside the monthly partitions. Monthly partitions are created
+ahead of time, and those entirely older than FEED_RETENTION_DAYS are detached and dropped,
+which removes a month of entries without a large DELETE; feed reads only touch the recent
+partitions left.
+
+Feed items themselves cannot be partitioned the same way (likes, comments and timeline entries
+reference them, which Postgres only allows to a partitioned table through keys that include
+the partition key), so items older than FEED_RETENTION_DAYS are deleted in batches, together
+with their likes, comments and timeline entries. Items with comments can be kept: their
+timeline entries are then moved to the default partition before their month is dropped, so
+they stay reachable from the feed.
+"""
+
+import re
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import FeedItem, FeedItemComment, FeedItemLike, TimelineEntry
+
+TIMELINE_TABLE = TimelineEntry._meta.db_table
+DEFAULT_PARTITION = f"{TIMELINE_TABLE}_default"
+PARTITION_NAME = re.compile(rf"^{TIMELINE_TABLE}_p(\d{{4}})(\d{{2}})$")
+
+
+def add_months(month, months) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=dt_timezone.utc)
+
+
+def month_start(moment) -> datetime:
+    return datetime(moment.year, moment.month, 1, tzinfo=dt_timezone.utc)
+
+
+def timeline_partitions() -> dict:
+    """Returns {first day of the month: partition name} of the monthly timeline partitions."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = %s::regclass", [TIMELINE_TABLE]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    partitions = {}
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions[datetime(int(match[1]), int(match[2]), 1, tzinfo=dt_timezone.utc)] = name
+    return partitions
+
+
+def create_timeline_partition(month) -> str:
+    """
+    Creates the partition of a month. Entries of that month already in the default partition
+    are moved into it first, as attaching the partition requires the default one not to have any.
+    """
+    name = f"{TIMELINE_TABLE}_p{month:%Y%m}"
+    bounds = [month, add_months(month, 1)]
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"CREATE TABLE {name} (LIKE {TIMELINE_TABLE} INCLUDING DEFAULTS)")
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION} WHERE created_on >= %s AND created_on < %s RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+            """,
+            bounds,
+        )
+        cursor.execute(f"ALTER TABLE {TIMELINE_TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", bounds)
+    return name
+
+
+def ensure_timeline_partitions(months_ahead=2) -> list:
+    """Creates the missing partitions from the current month to `months_ahead` months later."""
+    existing = timeline_partitions()
+    current = month_start(timezone.now())
+    months = [add_months(current, offset) for offset in range(months_ahead + 1)]
+    return [create_timeline_partition(month) for month in months if month not in existing]
+
+
+def drop_timeline_partitions(before, keep_commented=True) -> list:
+    """
+    Detaches and drops the monthly partitions that end before the given time, and deletes the
+    entries of the default partition older than it. With keep_commented, entries of items with
+    comments (which prune_feed_items keeps) are moved to the default partition instead.
+    Returns the names of the dropped partitions.
+    """
+    commented = f"EXISTS (SELECT 1 FROM {FeedItemComment._meta.db_table} WHERE feed_item_id = entry.feed_item_id)"
+    dropped = []
+    for month, name in sorted(timeline_partitions().items()):
+        if add_months(month, 1) <= before:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(f"ALTER TABLE {TIMELINE_TABLE} DETACH PARTITION {name}")
+                if keep_commented:
+                    # The month has no partition anymore, so the entries land in the default one
+                    cursor.execute(f"""
+                        INSERT INTO {TIMELINE_TABLE} (id, created_on, author_id, feed_item_id, user_id)
+                        SELECT id, created_on, author_id, feed_item_id, user_id FROM {name} AS entry
+                        WHERE {commented}
+                        """)
+                cursor.execute(f"DROP TABLE {name}")
+            dropped.append(name)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {DEFAULT_PARTITION} AS entry WHERE created_on < %s AND NOT (%s AND {commented})",
+            [before, keep_commented],
+        )
+    return dropped
+
+
+def prune_feed_items(before, keep_commented=True, batch_size=1000) -> int:
+    """
+    Deletes the feed items created before the given time, with their likes, comments and
+    timeline entries, one batch per transaction. Returns the number of items deleted.
+    """
+    select_batch = f"""
+        SELECT item.id FROM {FeedItem._meta.db_table} AS item
+        WHERE item.created_on < %(before)s
+            AND NOT (
+                %(keep_commented)s
+                AND EXISTS (SELECT 1 FROM {FeedItemComment._meta.db_table} WHERE feed_item_id = item.id)
+            )
+        ORDER BY item.id
+        LIMIT %(batch_size)s
+    """
+    params = {"before": before, "keep_commented": keep_commented, "batch_size": batch_size}
+    deleted = 0
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(select_batch, params)
+            feed_item_ids = [row[0] for row in cursor.fetchall()]
+            if not feed_item_ids:
+                return deleted
+            for model in (FeedItemLike, FeedItemComment, TimelineEntry):
+                cursor.execute(f"DELETE FROM {model._meta.db_table} WHERE feed_item_id = ANY(%s)", [feed_item_ids])
+            cursor.execute(f"DELETE FROM {FeedItem._meta.db_table} WHERE id = ANY(%s)", [feed_item_ids])
+            deleted += len(feed_item_ids)
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import FeedItem, FeedItemComment, FeedItemLike
+from .services import latest_comments
 
 from apps.recipes.serializers import SimpleRecipeSerializer, RecipeRatingSerializer
 
@@ -25,34 +26,58 @@ class FeedItemCommentSerializer(serializers.ModelSerializer):
     # you might need to override create to set user and feed_item from context.
 
 
+class FeedItemListSerializer(serializers.ListSerializer):
+    """Fetches the comment previews of all serialized feed items at once."""
+
+    def to_representation(self, data):
+        feed_items = list(data.all() if hasattr(data, "all") else data)
+        for feed_item_id, comments in latest_comments(feed_items).items():
+            self.child.comment_previews[feed_item_id] = comments
+        return super().to_representation(feed_items)
+
+
 class FeedItemSerializer(serializers.ModelSerializer):
     user_username = serializers.CharField(source="user.username", read_only=True)
     recipe = SimpleRecipeSerializer(read_only=True)
     rating = RecipeRatingSerializer(read_only=True)
 
-    like_count = serializers.IntegerField(read_only=True)
     is_liked_by_user = serializers.BooleanField(read_only=True)
-
-    comment_count = serializers.SerializerMethodField()
+    latest_comments = serializers.SerializerMethodField()
 
     class Meta:
         # TODO limit the number of fields returned for efficiency
         model = FeedItem
+        list_serializer_class = FeedItemListSerializer
         fields = [
             "id",
             "user_username",
             "event_type",
             "created_on",
+            "updated_on",
             "recipe",
             "rating",
             "like_count",
             "is_liked_by_user",
             "comment_count",
+            "latest_comments",
         ]
-        read_only_fields = ["created_on", "user_username", "recipe", "rating", "like_count", "is_liked_by_user"]
+        read_only_fields = [
+            "created_on",
+            "updated_on",
+            "user_username",
+            "recipe",
+            "rating",
+            "like_count",
+            "is_liked_by_user",
+            "comment_count",
+        ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.comment_previews = {}  # Filled for a whole page by FeedItemListSerializer
 
-    def get_comment_count(self, obj):
-        """Calculates the comment count. Assumes related 'comments' are prefetched if nested."""
-        if hasattr(obj, "comments"):
-            return obj.comments.count()
-        return getattr(obj, "comment_count", 0)
+    def get_latest_comments(self, obj):
+        """The latest comments of the item, oldest first, as a preview of the thread."""
+        if obj.id not in self.comment_previews:
+            self.comment_previews.update(latest_comments([obj]))
+        return FeedItemCommentSerializer(self.comment_previews[obj.id], many=True, context=self.context).data
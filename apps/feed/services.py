@@ -0,0 +1,266 @@
+"""
+Home timelines, materialized with fan-out on write.
+
+Publishing a feed item inserts a TimelineEntry for its author, and once committed for each
+of their followers, in batches. Following someone backfills their recent items, unfollowing prunes them.
+Items of authors with more followers than FEED_CELEBRITY_FOLLOWER_THRESHOLD are not fanned out
+(FeedItem.fanned_out is False): they are merged into the timelines of their followers when read
+(fan-out on read), also after the author drops below the threshold.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from apps.core.models import Follow
+
+from .events import author_channel, get_broker, publish_event
+from .models import FeedItem, FeedItemComment, FeedItemLike, FeedReadMarker, TimelineEntry
+
+CELEBRITY_CACHE_KEY = "feed-celebrity-ids"
+
+
+def unread_count_cache_key(user_id, stamp, marker) -> str:
+    """Key of a cached unread count: stale as soon as the timeline gets a newer item or the read marker moves."""
+    seen = f"{int(marker.last_seen_created_on.timestamp() * 1_000_000)}.{marker.last_seen_id}" if marker else "0"
+    return f"feed-unread:{user_id}:{stamp}:{seen}"
+
+
+def timeline_stamp(timeline) -> str:
+    """
+    Key of the newest item of a timeline queryset (see FeedItemViewSet.get_timeline), one index
+    probe. Cache keys that include it change as soon as any worker adds an item to the timeline,
+    without having to invalidate caches that other processes may hold.
+    """
+    newest = timeline.order_by("-timeline_created_on", "-timeline_id").values_list(
+        "timeline_created_on", "timeline_id"
+    )[:1]
+    for created_on, feed_item_id in newest:
+        return f"{int(created_on.timestamp() * 1_000_000)}.{feed_item_id}"
+    return "0"
+
+
+def get_celebrity_ids() -> frozenset:
+    """Ids of users with too many followers to fan out to. Cached, as follower counts change slowly."""
+    celebrity_ids = cache.get(CELEBRITY_CACHE_KEY)
+    if celebrity_ids is None:
+        celebrity_ids = frozenset(
+            Follow.objects.values("followed")
+            .annotate(followers=Count("id"))
+            .filter(followers__gte=settings.FEED_CELEBRITY_FOLLOWER_THRESHOLD)
+            .values_list("followed", flat=True)
+        )
+        cache.set(CELEBRITY_CACHE_KEY, celebrity_ids, settings.FEED_CELEBRITY_CACHE_TIMEOUT)
+    return celebrity_ids
+
+
+def _timeline_entry(user_id, feed_item):
+    return TimelineEntry(
+        user_id=user_id, feed_item=feed_item, author_id=feed_item.user_id, created_on=feed_item.created_on
+    )
+
+
+def fan_out_feed_item(feed_item) -> None:
+    """
+    Adds a feed item to the timelines of its author's followers, unless it is not to be fanned
+    out (its author was a celebrity when it was published), one batch of FEED_FANOUT_BATCH_SIZE
+    followers per transaction. Run after the item is committed.
+    """
+    if not feed_item.fanned_out:
+        return
+    batch_size = settings.FEED_FANOUT_BATCH_SIZE
+    follower_ids = Follow.objects.filter(followed_id=feed_item.user_id).values_list("follower_id", flat=True)
+    entries = []
+    for follower_id in follower_ids.iterator(chunk_size=batch_size):
+        entries.append(_timeline_entry(follower_id, feed_item))
+        if len(entries) >= batch_size:
+            _add_timeline_entries(entries)
+            entries = []
+    if entries:
+        _add_timeline_entries(entries)
+
+
+def _add_timeline_entries(entries) -> None:
+    """Inserts timeline entries."""
+    with transaction.atomic():
+        TimelineEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+
+def publish_feed_item(user, event_type, recipe=None, rating=None) -> FeedItem:
+    """
+    Creates a feed item and adds it to its author's timeline. Fanning it out to the followers'
+    timelines is deferred until the transaction commits, so it does not hold up the request's.
+    """
+    with transaction.atomic():
+        feed_item = FeedItem.objects.create(
+            user=user,
+            event_type=event_type,
+            recipe=recipe,
+            rating=rating,
+            fanned_out=user.id not in get_celebrity_ids(),
+        )
+        _add_timeline_entries([_timeline_entry(user.id, feed_item)])
+        transaction.on_commit(lambda: _fan_out_and_notify(feed_item))
+    return feed_item
+
+
+def _fan_out_and_notify(feed_item) -> None:
+    fan_out_feed_item(feed_item)
+    publish_event(feed_item.user_id, {"type": "new_items", "feed_item": feed_item.id})
+
+
+def record_feed_item_update(user, event_type, recipe=None, rating=None) -> FeedItem:
+    """
+    Records an edit of a recipe or rating. Edits within FEED_COALESCE_WINDOW_SECONDS of the last
+    change of its latest feed item update that item in place: the event type and updated_on
+    change, while created_on (its position in timelines and the key of feed cursors), likes and
+    comments are kept. Later edits, or edits without an item, publish a new item to followers.
+    """
+    items = FeedItem.objects.filter(user=user)
+    if rating is not None:
+        items = items.filter(rating=rating)
+    else:
+        items = items.filter(recipe=recipe, rating__isnull=True)
+    with transaction.atomic():
+        feed_item = items.select_for_update().order_by("-created_on", "-id").first()
+        window_start = timezone.now() - timedelta(seconds=settings.FEED_COALESCE_WINDOW_SECONDS)
+        if feed_item is None or (feed_item.updated_on or feed_item.created_on) < window_start:
+            return publish_feed_item(user, event_type, recipe=recipe, rating=rating)
+        feed_item.event_type = event_type
+        feed_item.updated_on = timezone.now()
+        feed_item.save(update_fields=["event_type", "updated_on"])
+        publish_event(user.id, {"type": "updated", "feed_item": feed_item.id})
+    return feed_item
+
+
+def backfill_timeline(follower, followed) -> None:
+    """Adds the recent fanned out items of a newly followed user to the follower's timeline (the others are read directly)."""
+    recent_items = FeedItem.objects.filter(user=followed, fanned_out=True).order_by("-created_on")[
+        : settings.FEED_BACKFILL_LIMIT
+    ]
+    TimelineEntry.objects.bulk_create(
+        [_timeline_entry(follower.id, feed_item) for feed_item in recent_items], ignore_conflicts=True
+    )
+
+
+def mark_feed_read(user, created_on, feed_item_id) -> FeedReadMarker:
+    """Moves the user's read marker forward to the given timeline key; it never moves back."""
+    with transaction.atomic():
+        marker, created = FeedReadMarker.objects.select_for_update().get_or_create(
+            user=user, defaults={"last_seen_created_on": created_on, "last_seen_id": feed_item_id}
+        )
+        if not created and (created_on, feed_item_id) > (marker.last_seen_created_on, marker.last_seen_id):
+            marker.last_seen_created_on, marker.last_seen_id = created_on, feed_item_id
+            marker.save(update_fields=["last_seen_created_on", "last_seen_id", "updated_on"])
+    return marker
+
+
+def prune_timeline(follower, unfollowed) -> None:
+    """Removes the items of an unfollowed user from the follower's timeline."""
+    TimelineEntry.objects.filter(user=follower, author=unfollowed).delete()
+
+
+REBUILD_TIMELINES_SQL = f"""
+    INSERT INTO {TimelineEntry._meta.db_table} (user_id, feed_item_id, author_id, created_on)
+    SELECT timeline.user_id, item.id, item.user_id, item.created_on
+    FROM {FeedItem._meta.db_table} AS item
+    JOIN (
+        SELECT id AS user_id, id AS author_id FROM {get_user_model()._meta.db_table}
+        UNION ALL
+        SELECT follower_id, followed_id FROM {Follow._meta.db_table}
+    ) AS timeline ON timeline.author_id = item.user_id
+    WHERE (item.fanned_out OR timeline.user_id = item.user_id)
+        AND (%(user_ids)s::bigint[] IS NULL OR timeline.user_id = ANY(%(user_ids)s::bigint[]))
+    ON CONFLICT (user_id, feed_item_id, created_on) DO NOTHING
+"""
+
+
+def rebuild_timelines(user_ids=None) -> int:
+    """
+    Rebuilds the timelines of the given users (all users by default) from feed items and follows,
+    in one INSERT ... SELECT. Returns the number of entries written.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        entries = TimelineEntry.objects.all()
+        if user_ids is not None:
+            entries = entries.filter(user_id__in=user_ids)
+        entries.delete()
+        cursor.execute(
+            REBUILD_TIMELINES_SQL,
+            {"user_ids": list(user_ids) if user_ids is not None else None},
+        )
+        return cursor.rowcount
+
+
+def latest_comments(feed_items, size=None) -> dict:
+    """
+    Returns {feed item id: its latest `size` comments, oldest first} for the given feed items,
+    in one windowed query. Items without comments are skipped without querying.
+    """
+    size = settings.FEED_COMMENT_PREVIEW_SIZE if size is None else size
+    feed_item_ids = [feed_item.id for feed_item in feed_items if feed_item.comment_count]
+    previews = {feed_item.id: [] for feed_item in feed_items}
+    if not feed_item_ids or size <= 0:
+        return previews
+    comments = (
+        FeedItemComment.objects.filter(feed_item_id__in=feed_item_ids)
+        .annotate(
+            position=Window(
+                RowNumber(), partition_by=F("feed_item_id"), order_by=[F("created_at").desc(), F("id").desc()]
+            )
+        )
+        .filter(position__lte=size)
+        .select_related("user")
+        .order_by("feed_item_id", "created_at", "id")
+    )
+    for comment in comments:
+        previews[comment.feed_item_id].append(comment)
+    return previews
+
+
+def adjust_feed_counters(feed_item_id, likes=0, comments=0) -> None:
+    """Atomically adds to the stored like and comment counts of a feed item."""
+    FeedItem.objects.filter(pk=feed_item_id).update(
+        like_count=F("like_count") + likes,
+        comment_count=F("comment_count") + comments,
+        engagement_updated_on=timezone.now(),
+    )
+    transaction.on_commit(lambda: _publish_counters(feed_item_id))
+
+
+def _publish_counters(feed_item_id) -> None:
+    counters = FeedItem.objects.filter(pk=feed_item_id).values("user_id", "like_count", "comment_count").first()
+    if counters is not None:
+        author_id = counters.pop("user_id")
+        get_broker().publish(author_channel(author_id), {"type": "counters", "feed_item": feed_item_id, **counters})
+
+
+RECONCILE_COUNTERS_SQL = f"""
+    UPDATE {FeedItem._meta.db_table} AS item
+    SET like_count = counts.like_count, comment_count = counts.comment_count, engagement_updated_on = NOW()
+    FROM (
+        SELECT
+            item.id,
+            (SELECT COUNT(*) FROM {FeedItemLike._meta.db_table} WHERE feed_item_id = item.id) AS like_count,
+            (SELECT COUNT(*) FROM {FeedItemComment._meta.db_table} WHERE feed_item_id = item.id) AS comment_count
+        FROM {FeedItem._meta.db_table} AS item
+    ) AS counts
+    WHERE item.id = counts.id
+        AND (item.like_count <> counts.like_count OR item.comment_count <> counts.comment_count)
+"""
+
+
+def reconcile_feed_counters() -> int:
+    """
+    Recounts the likes and comments of all feed items, fixing drifted counters. Fixed items are marked as changed so
+    that polling clients pick up the corrected counters. Returns the number fixed.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(RECONCILE_COUNTERS_SQL)
+        return cursor.rowcount
@@ -1,3 +1,465 @@
-from django.test import TestCase
+from datetime import timedelta
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from apps.core.models import Follow
+from apps.recipes.models import Recipe, RecipeRating
+
+from .models import FeedItem, FeedItemComment, FeedItemLike, TimelineEntry
+from .retention import (
+    create_timeline_partition,
+    drop_timeline_partitions,
+    month_start,
+    prune_feed_items,
+    timeline_partitions,
+)
+from .services import publish_feed_item, reconcile_feed_counters, record_feed_item_update
+
+User = get_user_model()
+
+
+class FeedTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="author", password="secret")
+        self.follower = User.objects.create_user(username="follower", password="secret")
+        Follow.objects.create(follower=self.follower, followed=self.author)
+        self.recipe = Recipe.objects.create(title="Soup", slug="soup", author=self.author, content="Boil.")
+
+    def publish(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return publish_feed_item(self.author, FeedItem.EventType.NEW_RECIPE, recipe=self.recipe, **kwargs)
+
+
+class FanOutTests(FeedTestCase):
+    def test_fan_out_waits_for_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            feed_item = publish_feed_item(self.author, FeedItem.EventType.NEW_RECIPE, recipe=self.recipe)
+            self.assertEqual(
+                list(TimelineEntry.objects.filter(feed_item=feed_item).values_list("user_id", flat=True)),
+                [self.author.id],
+            )
+        for callback in callbacks:
+            callback()
+
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(feed_item=feed_item).values_list("user_id", flat=True)),
+            {self.author.id, self.follower.id},
+        )
+
+    @override_settings(FEED_FANOUT_BATCH_SIZE=2)
+    def test_fan_out_in_batches(self):
+        followers = [User.objects.create_user(username=f"reader{index}", password="secret") for index in range(5)]
+        Follow.objects.bulk_create([Follow(follower=follower, followed=self.author) for follower in followers])
+
+        feed_item = self.publish()
+
+        self.assertEqual(TimelineEntry.objects.filter(feed_item=feed_item).count(), 7)
+
+    @override_settings(FEED_CELEBRITY_FOLLOWER_THRESHOLD=1)
+    def test_celebrities_are_not_fanned_out(self):
+        feed_item = self.publish()
+
+        self.assertEqual(
+            list(TimelineEntry.objects.filter(feed_item=feed_item).values_list("user_id", flat=True)),
+            [self.author.id],
+        )
+
+    def test_migration_backfills_timelines(self):
+        feed_item = self.publish()
+        TimelineEntry.objects.all().delete()
+
+        migration = import_module("apps.feed.migrations.0004_timeline_entry")
+        migration.backfill_timelines(apps, connection.schema_editor())
+
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(feed_item=feed_item).values_list("user_id", flat=True)),
+            {self.author.id, self.follower.id},
+        )
+
+
+class FollowTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="author", password="secret")
+        self.reader = User.objects.create_user(username="reader", password="secret")
+        self.recipe = Recipe.objects.create(title="Soup", slug="soup", author=self.author, content="Boil.")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.feed_item = publish_feed_item(self.author, FeedItem.EventType.NEW_RECIPE, recipe=self.recipe)
+        self.client.force_authenticate(self.reader)
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        response = self.client.post(f"/api/users/{self.author.id}/follow/")
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(TimelineEntry.objects.filter(user=self.reader, feed_item=self.feed_item).exists())
+
+        response = self.client.delete(f"/api/users/{self.author.id}/follow/")
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader).exists())
+
+
+class FeedItemUpdateTests(FeedTestCase):
+    def test_update_keeps_item_likes_and_comments(self):
+        feed_item = self.publish()
+        FeedItemLike.objects.create(feed_item=feed_item, user=self.follower)
+        FeedItemComment.objects.create(feed_item=feed_item, user=self.follower, text="Nice")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            updated = record_feed_item_update(self.author, FeedItem.EventType.UPDATE_RECIPE, recipe=self.recipe)
+
+        self.assertEqual(updated.id, feed_item.id)
+        updated.refresh_from_db()
+        self.assertEqual(updated.event_type, FeedItem.EventType.UPDATE_RECIPE)
+        self.assertEqual(updated.created_on, feed_item.created_on)
+        self.assertIsNotNone(updated.updated_on)
+        self.assertEqual(FeedItemLike.objects.filter(feed_item=feed_item).count(), 1)
+        self.assertEqual(FeedItemComment.objects.filter(feed_item=feed_item).count(), 1)
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(feed_item=feed_item).values_list("created_on", flat=True)),
+            {feed_item.created_on},
+        )
+
+    def test_update_after_the_window_publishes_a_new_item(self):
+        feed_item = self.publish()
+        FeedItem.objects.filter(id=feed_item.id).update(
+            created_on=timezone.now() - timedelta(seconds=settings.FEED_COALESCE_WINDOW_SECONDS + 60)
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            updated = record_feed_item_update(self.author, FeedItem.EventType.UPDATE_RECIPE, recipe=self.recipe)
+
+        self.assertNotEqual(updated.id, feed_item.id)
+        self.assertEqual(FeedItem.objects.count(), 2)
+        self.assertTrue(TimelineEntry.objects.filter(user=self.follower, feed_item=updated).exists())
+
+    def test_window_counts_from_the_last_update(self):
+        feed_item = self.publish()
+        long_ago = timezone.now() - timedelta(days=1)
+        FeedItem.objects.filter(id=feed_item.id).update(created_on=long_ago, updated_on=timezone.now())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            updated = record_feed_item_update(self.author, FeedItem.EventType.UPDATE_RECIPE, recipe=self.recipe)
+
+        self.assertEqual(updated.id, feed_item.id)
+
+    def test_update_without_item_publishes_one(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            feed_item = record_feed_item_update(self.author, FeedItem.EventType.UPDATE_RECIPE, recipe=self.recipe)
+
+        self.assertEqual(FeedItem.objects.get().id, feed_item.id)
+        self.assertTrue(TimelineEntry.objects.filter(user=self.follower, feed_item=feed_item).exists())
+
+
+class RetentionTests(FeedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.old = timezone.now() - timedelta(days=400)
+        self.before = timezone.now() - timedelta(days=365)
+        self.commented = self.publish_old()
+        FeedItemComment.objects.create(feed_item=self.commented, user=self.follower, text="Still good")
+        self.uncommented = self.publish_old()
+        self.recent = self.publish()
+        self.old_month = month_start(self.old)
+        if self.old_month not in timeline_partitions():
+            create_timeline_partition(self.old_month)
+
+    def publish_old(self):
+        feed_item = self.publish()
+        FeedItem.objects.filter(id=feed_item.id).update(created_on=self.old)
+        TimelineEntry.objects.filter(feed_item=feed_item).update(created_on=self.old)
+        return feed_item
+
+    def test_commented_items_stay_in_timelines(self):
+        dropped = drop_timeline_partitions(self.before, keep_commented=True)
+        deleted = prune_feed_items(self.before, keep_commented=True)
+
+        self.assertNotIn(self.old_month, timeline_partitions())
+        self.assertIn(f"{TimelineEntry._meta.db_table}_p{self.old_month:%Y%m}", dropped)
+        self.assertEqual(deleted, 1)
+        self.assertEqual(set(FeedItem.objects.values_list("id", flat=True)), {self.commented.id, self.recent.id})
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(user=self.follower).values_list("feed_item_id", flat=True)),
+            {self.commented.id, self.recent.id},
+        )
+
+    def test_without_keeping_commented_items(self):
+        drop_timeline_partitions(self.before, keep_commented=False)
+        prune_feed_items(self.before, keep_commented=False)
+
+        self.assertEqual(list(FeedItem.objects.values_list("id", flat=True)), [self.recent.id])
+        self.assertEqual(
+            set(TimelineEntry.objects.values_list("feed_item_id", flat=True)),
+            {self.recent.id},
+        )
+
+    def test_recent_partitions_are_kept(self):
+        drop_timeline_partitions(self.before)
+
+        self.assertIn(month_start(timezone.now()), timeline_partitions())
+        self.assertTrue(TimelineEntry.objects.filter(feed_item=self.recent).exists())
+
+
+class FeedViewTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="author", password="secret")
+        self.follower = User.objects.create_user(username="follower", password="secret")
+        Follow.objects.create(follower=self.follower, followed=self.author)
+        self.recipe = Recipe.objects.create(title="Soup", slug="soup", author=self.author, content="Boil.")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.feed_item = publish_feed_item(self.author, FeedItem.EventType.NEW_RECIPE, recipe=self.recipe)
+        self.client.force_login(self.follower)
+
+    def test_recipes_carry_the_viewer_state(self):
+        response = self.client.get("/api/feed/items/")
+
+        recipe = response.data["results"][0]["recipe"]
+        self.assertEqual((recipe["my_rating"], recipe["in_my_lists"], recipe["follows_author"]), (None, False, True))
+
+    def test_polling_without_changes(self):
+        cursor = self.client.get("/api/feed/items/").data["cursor"]
+
+        self.assertEqual(self.client.get("/api/feed/items/", {"since": cursor}).status_code, 204)
+
+    def test_polling_returns_new_items(self):
+        cursor = self.client.get("/api/feed/items/").data["cursor"]
+        recipe = Recipe.objects.create(title="Stew", slug="stew", author=self.author, content="Simmer.")
+        with self.captureOnCommitCallbacks(execute=True):
+            feed_item = publish_feed_item(self.author, FeedItem.EventType.NEW_RECIPE, recipe=recipe)
+
+        response = self.client.get("/api/feed/items/", {"since": cursor})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item["id"] for item in response.data["items"]], [feed_item.id])
+        self.assertEqual(response.data["counters"], [])
+
+    def test_reconciled_counters_are_polled(self):
+        cursor = self.client.get("/api/feed/items/").data["cursor"]
+        FeedItemLike.objects.create(feed_item=self.feed_item, user=self.follower)  # Without adjusting the counter
+
+        self.assertEqual(reconcile_feed_counters(), 1)
+        response = self.client.get("/api/feed/items/", {"since": cursor})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["counters"], [{"id": self.feed_item.id, "like_count": 1, "comment_count": 0}])
+
+    def counters(self):
+        self.feed_item.refresh_from_db()
+        return self.feed_item.like_count, self.feed_item.comment_count
+
+    def test_counters_follow_likes_and_comments(self):
+        like_url = f"/api/feed/items/{self.feed_item.id}/like/"
+        comments_url = f"/api/feed/items/{self.feed_item.id}/comments/"
+
+        self.assertEqual(self.client.post(like_url).status_code, 201)
+        self.assertEqual(self.client.post(like_url).status_code, 200)  # Liking twice counts once
+        first = self.client.post(comments_url, {"text": "Yum"}).data["id"]
+        self.client.post(comments_url, {"text": "Again"})
+        self.assertEqual(self.counters(), (1, 2))
+
+        self.assertEqual(self.client.delete(like_url).status_code, 204)
+        self.assertEqual(self.client.delete(like_url).status_code, 404)
+        self.assertEqual(self.client.delete(f"/api/feed/comments/{first}/").status_code, 204)
+        self.assertEqual(self.counters(), (0, 1))
+
+    def test_reconcile_repairs_drifted_counters(self):
+        FeedItemComment.objects.create(feed_item=self.feed_item, user=self.follower, text="Yum")
+        FeedItem.objects.filter(id=self.feed_item.id).update(like_count=7, comment_count=0)
+
+        self.assertEqual(reconcile_feed_counters(), 1)
+        self.assertEqual(self.counters(), (0, 1))
+        self.assertEqual(reconcile_feed_counters(), 0)
+
+    def comment(self, *texts):
+        url = f"/api/feed/items/{self.feed_item.id}/comments/"
+        return [self.client.post(url, {"text": text}).data["id"] for text in texts]
+
+    def test_comments_are_paged_oldest_first(self):
+        comment_ids = self.comment("First", "Second", "Third")
+        url = f"/api/feed/items/{self.feed_item.id}/comments/"
+
+        first = self.client.get(url, {"page_size": 2}).data
+        second = self.client.get(first["next"]).data
+
+        self.assertEqual([comment["id"] for comment in first["results"]], comment_ids[:2])
+        self.assertEqual([comment["id"] for comment in second["results"]], comment_ids[2:])
+        self.assertIsNone(second["next"])
+
+    @override_settings(FEED_COMMENT_PREVIEW_SIZE=2)
+    def test_items_preview_their_latest_comments(self):
+        comment_ids = self.comment("First", "Second", "Third")
+        quiet = self.publish_recipe("Stew")
+
+        results = {item["id"]: item for item in self.client.get("/api/feed/items/").data["results"]}
+
+        self.assertEqual([comment["id"] for comment in results[self.feed_item.id]["latest_comments"]], comment_ids[1:])
+        self.assertEqual(results[quiet.id]["latest_comments"], [])
+
+    def publish_recipe(self, title):
+        recipe = Recipe.objects.create(title=title, slug=title.lower(), author=self.author, content="Cook.")
+        with self.captureOnCommitCallbacks(execute=True):
+            return publish_feed_item(self.author, FeedItem.EventType.NEW_RECIPE, recipe=recipe)
+
+    def test_top_order_includes_new_items_despite_the_cache(self):
+        self.client.get("/api/feed/items/", {"order": "top"})
+        feed_item = self.publish_recipe("Stew")  # Nothing drops the ranked ids cached by the first request
+
+        response = self.client.get("/api/feed/items/", {"order": "top"})
+
+        self.assertIn(feed_item.id, [item["id"] for item in response.data["results"]])
+
+    def test_top_order_is_cached_until_the_timeline_changes(self):
+        self.client.get("/api/feed/items/", {"order": "top"})
+
+        with mock.patch("apps.feed.ranking.rank_feed_items") as rank:
+            self.client.get("/api/feed/items/", {"order": "top"})
+
+        rank.assert_not_called()
+
+    def test_unread_count_follows_the_timeline_and_the_read_marker(self):
+        self.assertEqual(self.client.get("/api/feed/items/unread/").data["count"], 1)
+
+        self.assertEqual(self.client.post("/api/feed/items/mark-read/").data["count"], 0)
+        self.assertEqual(self.client.get("/api/feed/items/unread/").data["count"], 0)
+
+        self.publish_recipe("Stew")
+        self.assertEqual(self.client.get("/api/feed/items/unread/").data["count"], 1)
+
+    def test_unread_count_is_cached(self):
+        self.client.get("/api/feed/items/unread/")
+
+        # Session, user, followed authors read directly, read marker and the newest timeline item; no count
+        with self.assertNumQueries(5):
+            self.assertEqual(self.client.get("/api/feed/items/unread/").data["count"], 1)
+
+
+class GroupedFeedTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.viewer = User.objects.create_user(username="viewer", password="secret")
+        self.recipe = Recipe.objects.create(title="Soup", slug="soup", author=self.viewer, content="Boil.")
+        self.base = month_start(timezone.now()) + timedelta(hours=1)  # Well inside a grouping bucket
+        # Newest first: a recipe, a rating, a recipe, two more ratings of the same recipe, a recipe
+        self.plain = []
+        self.ratings = []
+        for minutes, kind in [(10, "plain"), (9, "rating"), (8, "plain"), (7, "rating"), (6, "rating"), (5, "plain")]:
+            user = User.objects.create_user(username=f"user{minutes}", password="secret")
+            Follow.objects.create(follower=self.viewer, followed=user)
+            if kind == "plain":
+                recipe = Recipe.objects.create(
+                    title=f"Dish {minutes}", slug=f"dish-{minutes}", author=user, content="."
+                )
+                feed_item = self.publish(user, FeedItem.EventType.NEW_RECIPE, recipe=recipe)
+                self.plain.append(feed_item)
+            else:
+                rating = RecipeRating.objects.create(author=user, recipe=self.recipe, rating=8)
+                feed_item = self.publish(user, FeedItem.EventType.NEW_RATING, recipe=self.recipe, rating=rating)
+                self.ratings.append(feed_item)
+            moment = self.base + timedelta(minutes=minutes)
+            FeedItem.objects.filter(id=feed_item.id).update(created_on=moment)
+            TimelineEntry.objects.filter(feed_item=feed_item).update(created_on=moment)
+        self.client.force_login(self.viewer)
+
+    def publish(self, user, event_type, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return publish_feed_item(user, event_type, **kwargs)
+
+    def pages(self, page_size):
+        url = f"/api/feed/items/?group=true&page_size={page_size}"
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([(card["id"], card["group"]["count"]) for card in response.data["results"]])
+            url = response.data["next"]
+        return pages
+
+    def test_every_group_once_across_pages(self):
+        expected = [(self.plain[0].id, 1), (self.ratings[0].id, 3), (self.plain[1].id, 1), (self.plain[2].id, 1)]
+
+        self.assertEqual(self.pages(10), [expected])
+        self.assertEqual(self.pages(2), [expected[:2], expected[2:]])
+        self.assertEqual(sum(self.pages(1), []), expected)
+
+    @override_settings(FEED_GROUP_CANDIDATES=2)
+    def test_groups_past_the_candidates_are_complete(self):
+        pages = self.pages(10)
+
+        self.assertEqual(pages[0], [(self.plain[0].id, 1), (self.ratings[0].id, 3)])
+        self.assertEqual(
+            sum(pages, []),
+            [(self.plain[0].id, 1), (self.ratings[0].id, 3), (self.plain[1].id, 1), (self.plain[2].id, 1)],
+        )
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get("/api/feed/items/", {"group": "true", "before": "soon"}).status_code, 400)
+
+
+class FeedEventsTests(TestCase):
+    def test_wsgi_answers_with_a_heartbeat(self):
+        self.client.force_login(User.objects.create_user(username="reader", password="secret"))
+
+        response = self.client.get("/api/feed/events/")
+
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(
+            b"".join(response.streaming_content).decode(),
+            f"retry: {settings.FEED_EVENTS_HEARTBEAT_SECONDS * 1000}\n\n: keep-alive\n\n",
+        )
+
+    def test_anonymous(self):
+        self.assertEqual(self.client.get("/api/feed/events/").status_code, 403)
+
+
+class TimelinePagingTests(FeedTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.follower)
+
+    def publish_recipe(self, title, author=None):
+        author = author or self.author
+        recipe = Recipe.objects.create(title=title, slug=title.lower(), author=author, content="Cook.")
+        with self.captureOnCommitCallbacks(execute=True):
+            return publish_feed_item(author, FeedItem.EventType.NEW_RECIPE, recipe=recipe)
+
+    def read_feed(self, page_size):
+        url = f"/api/feed/items/?page_size={page_size}"
+        ids = []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertFalse([query for query in queries if "COUNT(" in query["sql"]])
+            ids.extend(item["id"] for item in response.data["results"])
+            url = response.data["next"]
+        return ids
+
+    def test_keyset_pages(self):
+        feed_items = [self.publish_recipe(f"Dish{index}") for index in range(5)]
+
+        self.assertEqual(self.read_feed(2), [feed_item.id for feed_item in reversed(feed_items)])
+        self.assertIn("cursor", self.client.get("/api/feed/items/").data)
+
+    def test_items_of_former_celebrities_stay_in_the_feed(self):
+        other = User.objects.create_user(username="other", password="secret")
+        Follow.objects.create(follower=self.follower, followed=other)
+        first = self.publish_recipe("Stew", author=other)
+        with override_settings(FEED_CELEBRITY_FOLLOWER_THRESHOLD=1):
+            cache.clear()
+            celebrity_item = self.publish_recipe("Soup2")
+        cache.clear()  # The author is no celebrity anymore
+        last = self.publish_recipe("Pie", author=other)
+
+        self.assertFalse(celebrity_item.fanned_out)
+        self.assertFalse(TimelineEntry.objects.filter(user=self.follower, feed_item=celebrity_item).exists())
+        self.assertEqual(self.read_feed(1), [last.id, celebrity_item.id, first.id])
+        self.assertEqual(self.read_feed(10), [last.id, celebrity_item.id, first.id])
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import SimpleRouter
-from .views import FeedItemViewSet, FeedItemLikeToggleView, FeedItemCommentViewSet
+from .views import FeedItemViewSet, FeedItemLikeToggleView, FeedItemCommentViewSet, feed_events
 
 app_name = "feed"
 
@@ -18,4 +18,5 @@ urlpatterns = [
     path("comments/<int:pk>/", comment_detail, name="comment-detail"),
     path("comments/<int:pk>/", comment_detail, name="comment-detail"),
     path("items/<int:pk>/like/", FeedItemLikeToggleView.as_view(), name="feeditem-like-toggle"),
+    path("events/", feed_events, name="feed-events"),
 ]
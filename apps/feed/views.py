@@ -1,16 +1,45 @@
-from django.db.models import Count, Exists, OuterRef, Q
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Prefetch, Q
+from django.http import HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
 from rest_framework import permissions, status, viewsets
 from rest_framework.authentication import SessionAuthentication
-from rest_framework.exceptions import NotFound
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from rest_framework.views import APIView
 
 from apps.core.models import Follow
+from apps.recipes.models import Recipe
+from apps.recipes.services import viewer_annotations
 
-from .models import FeedItem, FeedItemComment, FeedItemLike
+from .events import author_channel, get_broker
+from .grouping import MAX_GROUP_ACTORS, group_timeline, older_than
+from .models import FeedItem, FeedItemComment, FeedItemLike, FeedReadMarker, TimelineEntry
 from .permissions import IsOwnerOrReadOnly
+from .ranking import ranked_feed_ids
 from .serializers import FeedItemCommentSerializer, FeedItemSerializer
+from .services import (
+    adjust_feed_counters,
+    mark_feed_read,
+    timeline_stamp,
+    unread_count_cache_key,
+)
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+# Counter changes are re-sent for a while, so changes committed late are not missed
+FEED_CHANGES_OVERLAP = timedelta(seconds=10)
 
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -19,6 +48,46 @@ class StandardResultsSetPagination(PageNumberPagination):
     max_page_size = 100
 
 
+def _timestamp(moment) -> int:
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+
+def encode_feed_cursor(created_on, feed_item_id, checked_at) -> str:
+    """Cursor of a feed client: the newest item it has and when it last checked for changes."""
+    return f"{_timestamp(created_on)}.{feed_item_id}.{_timestamp(checked_at)}"
+
+
+def decode_feed_cursor(cursor):
+    """Returns (created_on, feed item id, checked_at) of a cursor. Raises ValidationError if it is invalid."""
+    try:
+        created_on, feed_item_id, checked_at = (int(part) for part in cursor.split("."))
+        return (
+            EPOCH + timedelta(microseconds=created_on),
+            feed_item_id,
+            EPOCH + timedelta(microseconds=checked_at),
+        )
+    except (ValueError, OverflowError):
+        raise ValidationError({"since": "Invalid cursor."})
+
+
+def decode_before_cursor(cursor):
+    """Returns the (created_on, feed item id) of a ?before= page cursor. Raises ValidationError if it is invalid."""
+    try:
+        created_on, feed_item_id = (int(part) for part in cursor.split("."))
+        return EPOCH + timedelta(microseconds=created_on), feed_item_id
+    except (ValueError, OverflowError):
+        raise ValidationError({"before": "Invalid cursor."})
+
+
+class CommentCursorPagination(CursorPagination):
+    """Keyset paging through a comment thread, oldest first; cost per page does not grow with the thread."""
+
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = ("created_at", "id")
+
+
 class FeedItemViewSet(viewsets.ReadOnlyModelViewSet):
     """
     API endpoint that allows feed items to be viewed.
@@ -27,6 +96,15 @@ class FeedItemViewSet(viewsets.ReadOnlyModelViewSet):
     Supports excluding specific event types via the 'exclude_event_types' query parameter
     (e.g., ?exclude_event_types=update_recipe,update_rating).
     It's read-only for now.
+
+    Pages are read by keyset: {"next": <url with ?before=<cursor>>, "results": [...]}, without a
+    count. The first page includes a "cursor". Polling with ?since=<cursor> returns only what changed
+    since: newer items, and the counters of older items that were liked or commented on, with
+    the next cursor. It returns 204 No Content when nothing changed.
+
+    ?order=top ranks the recent items by engagement, affinity to the author and recency instead.
+    ?group=true collapses ratings of the same recipe made close together into one card, paged the same way.
+    unread/ returns the (bounded) number of unread items, mark-read/ advances the read marker.
     """
 
     authentication_classes = [SessionAuthentication]
@@ -34,40 +112,251 @@ class FeedItemViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = FeedItemSerializer
     pagination_class = StandardResultsSetPagination
 
-    def get_queryset(self):
-        """
-        Return feed items for the current user and users they follow,
-        ordered by creation date.
-        Annotates like/comment counts and user's like status.
-        Efficiently fetches related data.
-        """
-        user = self.request.user
-
+    def _excluded_event_types(self):
         excluded_types_str = self.request.query_params.get("exclude_event_types", None)
         excluded_types = []
         if excluded_types_str:
             excluded_types = [item.strip() for item in excluded_types_str.split(",") if item.strip()]
             # Optional: Validate against FeedItem.EventType.values if needed
+        return excluded_types
+
+    def get_timeline_sources(self):
+        """
+        The querysets the current user's timeline is read from, annotated with its sort key
+        (timeline_created_on, timeline_id): the materialized timeline, and, when the user follows
+        authors with items that were not fanned out (see services.py), those items read directly.
+        Each is served by its own index, (user, -created_on) of the timeline or of the items.
+        """
+        user = self.request.user
+        queryset = FeedItem.objects.all()
+        excluded_types = self._excluded_event_types()
+        if excluded_types:
+            queryset = queryset.exclude(event_type__in=excluded_types)
 
-        followed_user_ids = Follow.objects.filter(follower=user).values_list("followed_id", flat=True)
-
-        queryset = FeedItem.objects.annotate(
-            like_count=Count("likes", distinct=True),
-            comment_count=Count("comments", distinct=True),
-            is_liked_by_user=Exists(FeedItemLike.objects.filter(feed_item=OuterRef("pk"), user=user)),
-        ).select_related(
-            "user",
-            "recipe__author",
-            "rating__author",
-            "rating__recipe",
+        # Range scan over the timeline index, joined to the feed items
+        sources = [
+            queryset.filter(timeline_entries__user=user).annotate(
+                timeline_created_on=F("timeline_entries__created_on"),
+                timeline_id=F("timeline_entries__feed_item_id"),
+            )
+        ]
+        direct_author_ids = list(
+            Follow.objects.filter(follower=user, followed__feed_items__fanned_out=False)
+            .values_list("followed_id", flat=True)
+            .distinct()
         )
+        if direct_author_ids:
+            sources.append(
+                queryset.filter(user_id__in=direct_author_ids, fanned_out=False).annotate(
+                    timeline_created_on=F("created_on"), timeline_id=F("id")
+                )
+            )
+        return sources
 
-        queryset = queryset.filter(Q(user=user) | Q(user_id__in=list(followed_user_ids)))
+    def get_timeline(self):
+        """
+        Return feed items for the current user and users they follow as one queryset, read from
+        the user's materialized timeline, with the items that were not fanned out merged in.
+        Annotates the sort key of the timeline as (timeline_created_on, timeline_id).
+        """
+        sources = self.get_timeline_sources()
+        if len(sources) == 1:
+            return sources[0]
+        timeline, direct = sources
+        return FeedItem.objects.filter(Q(id__in=timeline.values("id")) | Q(id__in=direct.values("id"))).annotate(
+            timeline_created_on=F("created_on"), timeline_id=F("id")
+        )
 
-        if excluded_types:
-            queryset = queryset.exclude(event_type__in=excluded_types)
+    def with_details(self, timeline):
+        """
+        Annotates the user's like status on a timeline queryset, newest first; like/comment counts
+        are stored on the items. Recipes are prefetched with the viewer's state
+        (see recipes.services.viewer_annotations).
+        """
+        recipes = Recipe.objects.select_related("author").annotate(**viewer_annotations(self.request.user))
+        return (
+            timeline.annotate(
+                is_liked_by_user=Exists(FeedItemLike.objects.filter(feed_item=OuterRef("pk"), user=self.request.user))
+            )
+            .select_related("user", "rating__author")
+            .prefetch_related(Prefetch("recipe", queryset=recipes))
+            .order_by("-timeline_created_on", "-timeline_id")
+        )
 
-        return queryset.order_by("-created_on")
+    def get_queryset(self):
+        """Return the timeline ordered by creation date, newest first (see with_details)."""
+        return self.with_details(self.get_timeline())
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get("order") == "top":
+            return self.list_top()
+        if request.query_params.get("group") == "true":
+            return self.list_grouped()
+        if "since" in request.query_params:
+            return self.changes_since(request.query_params["since"])
+        return self.list_recent()
+
+    def list_recent(self):
+        """
+        Pages through the timeline by keyset: each source is read with a range scan below the
+        ?before=<cursor> key and limited to one page, and the pages are merged.
+        """
+        checked_at = timezone.now()
+        before = self.request.query_params.get("before")
+        before = decode_before_cursor(before) if before else None
+        page_size = self.paginator.get_page_size(self.request)
+
+        feed_items = {}
+        for source in self.get_timeline_sources():
+            if before is not None:
+                source = source.filter(older_than(*before))
+            for feed_item in self.with_details(source)[: page_size + 1]:
+                feed_items.setdefault(feed_item.id, feed_item)  # An item can be in both sources
+        page = sorted(feed_items.values(), key=lambda item: (item.timeline_created_on, item.timeline_id), reverse=True)
+        has_more, page = len(page) > page_size, page[:page_size]
+
+        data = {"next": None, "results": self.get_serializer(page, many=True).data}
+        if has_more:
+            last = page[-1]
+            data["next"] = replace_query_param(
+                self.request.build_absolute_uri(),
+                "before",
+                f"{_timestamp(last.timeline_created_on)}.{last.timeline_id}",
+            )
+        if before is None:
+            newest = page[0] if page else None
+            data["cursor"] = encode_feed_cursor(
+                newest.timeline_created_on if newest else EPOCH, newest.timeline_id if newest else 0, checked_at
+            )
+        return Response(data)
+
+    @action(detail=False, methods=["get"])
+    def unread(self, request):
+        """
+        Number of items in the timeline newer than the read marker, from others, counted up to
+        FEED_UNREAD_COUNT_LIMIT + 1 over the timeline index: {"count": 10, "display": "9+"}.
+        Cached under the newest item of the timeline and the read marker, so a new item or marking
+        the feed read shows on the next request, whichever worker serves it.
+        """
+        limit = settings.FEED_UNREAD_COUNT_LIMIT
+        timeline = self.get_timeline()
+        marker = FeedReadMarker.objects.filter(user=request.user).first()
+        key = unread_count_cache_key(request.user.id, timeline_stamp(timeline), marker)
+        count = cache.get(key)
+        if count is None:
+            unread = timeline.exclude(user=request.user)
+            if marker is not None:
+                unread = unread.filter(
+                    Q(timeline_created_on__gt=marker.last_seen_created_on)
+                    | Q(timeline_created_on=marker.last_seen_created_on, timeline_id__gt=marker.last_seen_id)
+                )
+            count = unread.order_by()[: limit + 1].count()
+            cache.set(key, count, settings.FEED_UNREAD_CACHE_SECONDS)
+        return Response({"count": count, "display": f"{limit}+" if count > limit else str(count)})
+
+    @action(detail=False, methods=["post"], url_path="mark-read")
+    def mark_read(self, request):
+        """
+        Advances the read marker to the given item ({"feed_item": id}) or, by default, to the
+        newest item of the timeline.
+        """
+        timeline = self.get_timeline().order_by("-timeline_created_on", "-timeline_id")
+        feed_item_id = request.data.get("feed_item")
+        if feed_item_id is not None:
+            try:
+                timeline = timeline.filter(id=int(feed_item_id))
+            except (TypeError, ValueError):
+                raise ValidationError({"feed_item": "A valid integer is required."})
+        newest = timeline.values_list("timeline_created_on", "timeline_id").first()
+        if newest is None:
+            if feed_item_id is not None:
+                raise NotFound("Feed item not found.")
+            return Response({"count": 0, "display": "0"})
+        mark_feed_read(request.user, *newest)
+        return self.unread(request)
+
+    def list_top(self):
+        """Pages through the recent timeline ranked by relevance (see ranking.py)."""
+        ranked_ids = ranked_feed_ids(
+            self.request.user, self.get_timeline(), variant=self.request.query_params.get("exclude_event_types", "")
+        )
+        page_ids = self.paginate_queryset(ranked_ids)
+        feed_items = self.get_queryset().in_bulk(page_ids)
+        # Items deleted since they were ranked are skipped
+        page = [feed_items[feed_item_id] for feed_item_id in page_ids if feed_item_id in feed_items]
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
+    def list_grouped(self):
+        """Pages through the timeline with ratings of the same recipe collapsed into one card (see grouping.py)."""
+        before = self.request.query_params.get("before")
+        before = decode_before_cursor(before) if before else None
+        groups, next_before = group_timeline(
+            self.get_timeline(), self.paginator.get_page_size(self.request), before=before
+        )
+
+        feed_items = self.get_queryset().in_bulk([group["feed_item_ids"][0] for group in groups])
+        cards = []
+        for group in groups:
+            feed_item = feed_items.get(group["feed_item_ids"][0])
+            if feed_item is None:  # Deleted in the meantime
+                continue
+            feed_item.group = {
+                "count": group["count"],
+                "actors": group["actors"][:MAX_GROUP_ACTORS],
+                "actor_count": len(group["actors"]),
+                "feed_item_ids": group["feed_item_ids"],
+            }
+            cards.append(feed_item)
+        data = self.get_serializer(cards, many=True).data
+        for card, feed_item in zip(data, cards):
+            card["group"] = feed_item.group
+
+        next_url = None
+        if next_before is not None:
+            created_on, feed_item_id = next_before
+            next_url = replace_query_param(
+                self.request.build_absolute_uri(), "before", f"{_timestamp(created_on)}.{feed_item_id}"
+            )
+        return Response({"next": next_url, "results": data})
+
+    def changes_since(self, cursor):
+        """Items newer than the cursor and counter updates of older ones, or 204 if nothing changed."""
+        created_on, feed_item_id, checked_at = decode_feed_cursor(cursor)
+        changed_since = checked_at - FEED_CHANGES_OVERLAP
+        now = timezone.now()
+
+        is_new = Q(timeline_created_on__gt=created_on) | Q(timeline_created_on=created_on, timeline_id__gt=feed_item_id)
+        timeline = self.get_timeline()
+        # Two probes rather than one OR: the conditions are on different tables, and each is then served by its own
+        # index (the timeline keyset, feed item engagement_updated_on)
+        if (
+            not timeline.filter(is_new).exists()
+            and not timeline.filter(engagement_updated_on__gt=changed_since).exists()
+        ):
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        limit = self.paginator.max_page_size
+        new_items = list(self.get_queryset().filter(is_new)[: limit + 1])
+        counters = list(
+            timeline.filter(engagement_updated_on__gt=changed_since)
+            .exclude(is_new)
+            .order_by("-engagement_updated_on")
+            .values("id", "like_count", "comment_count")[:limit]
+        )
+        newest = new_items[0] if new_items else None
+        return Response(
+            {
+                "cursor": encode_feed_cursor(
+                    newest.timeline_created_on if newest else created_on,
+                    newest.timeline_id if newest else feed_item_id,
+                    now,
+                ),
+                # More new items than fit in one response: the client should reload the feed
+                "has_more": len(new_items) > limit,
+                "items": self.get_serializer(new_items[:limit], many=True).data,
+                "counters": counters,
+            }
+        )
 
 
 class FeedItemLikeToggleView(APIView):
@@ -88,7 +377,10 @@ class FeedItemLikeToggleView(APIView):
             raise NotFound("Feed item not found.")
 
         # Use get_or_create to handle potential race conditions and prevent duplicates
-        like, created = FeedItemLike.objects.get_or_create(user=request.user, feed_item=feed_item)
+        with transaction.atomic():
+            like, created = FeedItemLike.objects.get_or_create(user=request.user, feed_item=feed_item)
+            if created:
+                adjust_feed_counters(feed_item.id, likes=1)
 
         if created:
             return Response({"detail": "Feed item liked."}, status=status.HTTP_201_CREATED)
@@ -104,10 +396,13 @@ class FeedItemLikeToggleView(APIView):
 
         try:
             like_instance = FeedItemLike.objects.get(user=request.user, feed_item=feed_item)
-            like_instance.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
         except FeedItemLike.DoesNotExist:
             raise NotFound("Like not found.")
+        with transaction.atomic():
+            deleted, _ = FeedItemLike.objects.filter(pk=like_instance.pk).delete()
+            if deleted:  # A concurrent unlike may have won
+                adjust_feed_counters(feed_item.id, likes=-1)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 class FeedItemCommentViewSet(viewsets.ModelViewSet):
@@ -119,6 +414,7 @@ class FeedItemCommentViewSet(viewsets.ModelViewSet):
     serializer_class = FeedItemCommentSerializer
     authentication_classes = [SessionAuthentication]
     permission_classes = [permissions.IsAuthenticated, IsOwnerOrReadOnly]
+    pagination_class = CommentCursorPagination
 
     def get_queryset(self):
         """
@@ -144,4 +440,67 @@ class FeedItemCommentViewSet(viewsets.ModelViewSet):
             feed_item = FeedItem.objects.get(pk=feed_item_pk)
         except FeedItem.DoesNotExist:
             raise NotFound("Feed item not found.")
-        serializer.save(user=self.request.user, feed_item=feed_item)
+        with transaction.atomic():
+            serializer.save(user=self.request.user, feed_item=feed_item)
+            adjust_feed_counters(feed_item.id, comments=1)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            deleted, _ = FeedItemComment.objects.filter(pk=instance.pk).delete()
+            if deleted:
+                adjust_feed_counters(instance.feed_item_id, comments=-1)
+
+
+async def _event_stream(channels):
+    """Server-Sent Events for the given channels, with heartbeats, until FEED_EVENTS_STREAM_SECONDS."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + settings.FEED_EVENTS_STREAM_SECONDS
+    subscription = get_broker().subscribe(channels)
+    try:
+        yield f"retry: {settings.FEED_EVENTS_HEARTBEAT_SECONDS * 1000}\n\n"
+        while (remaining := deadline - loop.time()) > 0:
+            event = await subscription.get(min(settings.FEED_EVENTS_HEARTBEAT_SECONDS, remaining))
+            if event is None:
+                yield ": keep-alive\n\n"  # Keeps proxies from closing an idle connection
+            else:
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    finally:
+        subscription.close()
+
+
+def _short_event_stream():
+    """
+    The stream served under WSGI, where Django would collect an async stream into one response
+    while holding a worker: a heartbeat, then the connection closes. EventSource reconnects after
+    `retry`, so clients fall back to polling the feed with ?since=<cursor>.
+    """
+    yield f"retry: {settings.FEED_EVENTS_HEARTBEAT_SECONDS * 1000}\n\n"
+    yield ": keep-alive\n\n"
+
+
+async def feed_events(request):
+    """
+    Streams notifications for the current user's timeline as Server-Sent Events:
+    "new_items" when they or someone they follow publishes, "counters" when the like or
+    comment count of such an item changes. Clients refetch the feed when notified.
+    Streams only when served by the ASGI app (foodplanner.asgi); under WSGI the response is a
+    heartbeat that closes at once (see _short_event_stream).
+    """
+    if request.method != "GET":
+        return HttpResponseNotAllowed(["GET"])
+    user = await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=403)
+
+    if isinstance(request, ASGIRequest):
+        followed_ids = await sync_to_async(list)(
+            Follow.objects.filter(follower=user).values_list("followed_id", flat=True)
+        )
+        channels = [author_channel(user_id) for user_id in [user.id, *followed_ids]]
+        stream = _event_stream(channels)
+    else:
+        stream = _short_event_stream()
+    response = StreamingHttpResponse(stream, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # Disables proxy buffering (nginx)
+    return response
@@ -0,0 +1,134 @@
+"""
+Meal-plan optimizer: picks recipes that share ingredients, so the shopping list stays short.
+
+Recipes are rows of a sparse binary recipe x ingredient matrix built from their denormalized
+`ingredient_ids`. A plan is grown one recipe at a time with a beam search: for every plan in
+the beam, the number of ingredients each candidate recipe would add is one sparse
+matrix-vector product, and the best few extensions are kept. Only the
+MEAL_PLAN_OPTIMIZER_MAX_CANDIDATES best scored recipes (plus the required ones) are loaded.
+The time budget covers loading them; when it runs out the remaining meals are filled greedily
+from the best plan so far.
+"""
+
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+from django.conf import settings
+from scipy import sparse
+
+from apps.recipes.models import Recipe
+
+
+@dataclass
+class MealPlan:
+    recipe_ids: list  # Chosen recipes, in the order they were picked
+    new_ingredient_ids: list  # Distinct ingredients to buy that were not already available
+    complete: bool = True  # False when the time budget cut the beam search short
+
+
+@dataclass
+class _Candidate:
+    cost: int  # Ingredients added so far
+    rating: float  # Summed rating of the chosen recipes, breaks ties
+    rows: tuple
+    covered: np.ndarray = field(repr=False)
+
+
+def _load_candidates(required_recipe_ids, excluded_recipe_ids, min_rating, max_candidates):
+    """
+    Returns (recipe ids, ratings, ingredient ids per column, binary recipe x ingredient CSR matrix)
+    of the required recipes and up to `max_candidates` others, best Bayesian score first.
+    """
+    fields = ("id", "average_rating", "ingredient_ids")
+    queryset = Recipe.objects.exclude(ingredient_ids=[]).exclude(id__in=excluded_recipe_ids)
+    if min_rating:
+        queryset = queryset.filter(average_rating__gte=min_rating)
+    queryset = queryset.exclude(id__in=required_recipe_ids).order_by("-bayesian_score", "-id")
+    rows = list(Recipe.objects.filter(id__in=required_recipe_ids).values_list(*fields))
+    rows += list(queryset.values_list(*fields)[:max_candidates])
+
+    recipe_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    ratings = np.array([row[1] for row in rows], dtype=np.float64)
+    sizes = np.array([len(row[2]) for row in rows], dtype=np.int64)
+    flat = np.array([ingredient_id for row in rows for ingredient_id in row[2]], dtype=np.int64)
+    ingredient_ids, columns = np.unique(flat, return_inverse=True)
+    indptr = np.concatenate(([0], np.cumsum(sizes)))
+    matrix = sparse.csr_matrix(
+        (np.ones(len(flat), dtype=np.float32), columns, indptr), shape=(len(rows), len(ingredient_ids))
+    )
+    return recipe_ids, ratings, ingredient_ids, matrix
+
+
+def _extend(candidate, row, matrix, rating):
+    """Returns the candidate plan with the recipe of the given matrix row added."""
+    columns = matrix.indices[matrix.indptr[row] : matrix.indptr[row + 1]]
+    covered = candidate.covered.copy()
+    covered[columns] = True
+    new_count = int(np.count_nonzero(~candidate.covered[columns]))
+    return _Candidate(candidate.cost + new_count, candidate.rating + rating, candidate.rows + (row,), covered)
+
+
+def optimize_meal_plan(
+    meals,
+    available_ingredient_ids=(),
+    required_recipe_ids=(),
+    excluded_recipe_ids=(),
+    min_rating=None,
+    beam_width=None,
+    time_budget=None,
+    max_candidates=None,
+):
+    """
+    Picks `meals` recipes (including the required ones, which callers validate) minimizing the
+    number of distinct ingredients to buy. Ingredients already available (pantry, existing list)
+    are free. Ties are broken by higher average rating. `min_rating` is on the stored 0-10 scale.
+    """
+    beam_width = beam_width or settings.MEAL_PLAN_OPTIMIZER_BEAM_WIDTH
+    time_budget = settings.MEAL_PLAN_OPTIMIZER_TIME_BUDGET if time_budget is None else time_budget
+    max_candidates = max_candidates or settings.MEAL_PLAN_OPTIMIZER_MAX_CANDIDATES
+    deadline = time.monotonic() + time_budget  # Loading the candidates counts against the budget
+
+    recipe_ids, ratings, ingredient_ids, matrix = _load_candidates(
+        required_recipe_ids, excluded_recipe_ids, min_rating, max_candidates
+    )
+    sizes = np.diff(matrix.indptr)
+    # Rating only breaks ties: the largest rating difference (10) is worth less than one ingredient
+    tie_breaks = ratings / 100
+
+    available = np.isin(ingredient_ids, list(available_ingredient_ids))
+    start = _Candidate(0, 0.0, (), available)
+    for row in np.flatnonzero(np.isin(recipe_ids, list(required_recipe_ids))).tolist():
+        start = _extend(start, row, matrix, ratings[row])
+
+    beam = [start]
+    complete = True
+    for _ in range(min(meals, len(recipe_ids)) - len(start.rows)):
+        width = beam_width
+        if time.monotonic() > deadline:
+            complete, width, beam = False, 1, beam[:1]
+
+        extensions = {}
+        for index, candidate in enumerate(beam):
+            new_counts = sizes - matrix @ candidate.covered.astype(np.float32)
+            keys = new_counts - tie_breaks
+            keys[list(candidate.rows)] = np.inf
+            best = np.argpartition(keys, min(width, len(keys) - 1))[:width]
+            for row in best[np.isfinite(keys[best])].tolist():
+                plan_key = frozenset(candidate.rows + (row,))
+                cost = candidate.cost + int(new_counts[row])
+                rating = candidate.rating + ratings[row]
+                if plan_key not in extensions or (cost, -rating) < extensions[plan_key][:2]:
+                    extensions[plan_key] = (cost, -rating, index, row)
+        if not extensions:
+            break
+
+        survivors = sorted(extensions.values())[:width]
+        beam = [_extend(beam[index], row, matrix, ratings[row]) for _, _, index, row in survivors]
+
+    best = beam[0]
+    return MealPlan(
+        recipe_ids=recipe_ids[list(best.rows)].tolist(),
+        new_ingredient_ids=ingredient_ids[best.covered & ~available].tolist(),
+        complete=complete,
+    )
@@ -119,3 +119,42 @@ class GroceryListItemSerializer(serializers.ModelSerializer):
             "quantity",
             "updated_at",
         ]
+
+
+class MealPlanOptimizeSerializer(serializers.Serializer):
+    """
+    Input of the meal-plan optimizer. 'guests' holds one count for all meals or one per meal,
+    'min_rating' uses the same 0-5 scale as the recipe's average_rating.
+    Pass the grocery list as 'grocery_list' in the context to reject recipes already planned on it.
+    """
+
+    meals = serializers.IntegerField(min_value=1, max_value=31)
+    guests = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, default=[1])
+    start_date = serializers.DateField(required=False)
+    required_recipe_ids = serializers.ListField(child=serializers.IntegerField(), default=list)
+    excluded_recipe_ids = serializers.ListField(child=serializers.IntegerField(), default=list)
+    pantry_ingredient_ids = serializers.ListField(child=serializers.IntegerField(), default=list)
+    min_rating = serializers.FloatField(min_value=0, max_value=5, required=False)
+    apply = serializers.BooleanField(default=False)
+
+    def validate(self, data):
+        if len(data["guests"]) not in (1, data["meals"]):
+            raise serializers.ValidationError({"guests": "Provide one guest count, or one per meal."})
+        required_ids = set(data["required_recipe_ids"])
+        if len(required_ids) > data["meals"]:
+            raise serializers.ValidationError({"required_recipe_ids": "More required recipes than meals."})
+        unknown_ids = required_ids - set(Recipe.objects.filter(id__in=required_ids).values_list("id", flat=True))
+        if unknown_ids:
+            raise serializers.ValidationError({"required_recipe_ids": f"Unknown recipes: {sorted(unknown_ids)}."})
+        if required_ids & set(data["excluded_recipe_ids"]):
+            raise serializers.ValidationError({"required_recipe_ids": "Recipes cannot be both required and excluded."})
+        grocery_list = self.context.get("grocery_list")
+        if grocery_list is not None:
+            planned_ids = set(
+                grocery_list.plannedrecipes.filter(recipe_id__in=required_ids).values_list("recipe_id", flat=True)
+            )
+            if planned_ids:
+                raise serializers.ValidationError(
+                    {"required_recipe_ids": f"Already planned on this list: {sorted(planned_ids)}."}
+                )
+        return data
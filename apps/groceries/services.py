@@ -14,34 +14,13 @@ from apps.ingredients.models import Ingredient, IngredientUnit
 User = get_user_model()
 
 
-@transaction.atomic  # Ensure the whole process is atomic
-def update_grocery_list_items(grocery_list_id: int, user: User) -> None:
+def aggregate_grocery_items(planned_recipes, planned_extras) -> dict:
     """
-    Recalculates and saves all GroceryListItem objects for a given grocery list
-    based on its PlannedRecipe and PlannedExtra items. Aggregates by ingredient AND unit.
-
-    Ensures the user owns the grocery list.
+    Aggregates the ingredients of planned recipes (scaled by guests) and planned extras
+    by ingredient AND unit. Works on saved or unsaved PlannedRecipe/PlannedExtra objects,
+    so a plan can be previewed before it is stored.
+    Recipe ingredients, ingredients and units should be prefetched.
     """
-    try:
-        # Ensure the user owns the list
-        grocery_list = GroceryList.objects.get(id=grocery_list_id, user=user)
-    except GroceryList.DoesNotExist:
-        # Or raise PermissionDenied - depends on how you want to handle errors
-        print(f"Error: GroceryList ID {grocery_list_id} not found or not owned by user {user.id}")
-        return  # Exit if list not found or not owned by the user
-
-    # Fetch related items efficiently, including units
-    planned_recipes = (
-        grocery_list.plannedrecipes.select_related("recipe")
-        .prefetch_related(
-            "recipe__recipeingredient_set__ingredient",  # Prefetch ingredient
-            "recipe__recipeingredient_set__unit",  # Prefetch unit for recipe ingredients
-        )
-        .all()
-    )
-    # Select related ingredient and unit for planned extras
-    planned_extras = grocery_list.plannedextras.select_related("ingredient", "unit").all()
-
     # Use defaultdict for aggregation
     # Key: (ingredient_id, unit_id), Value: {'quantity': float, 'sources': list(), 'ingredient_obj': Ingredient, 'unit_obj': IngredientUnit}
     aggregated_items = defaultdict(lambda: {"quantity": 0.0, "sources": [], "ingredient_obj": None, "unit_obj": None})
@@ -89,6 +68,55 @@ def update_grocery_list_items(grocery_list_id: int, user: User) -> None:
             aggregated_items[agg_key]["ingredient_obj"] = ingredient
             aggregated_items[agg_key]["unit_obj"] = unit
 
+    return aggregated_items
+
+
+def preview_grocery_list_items(grocery_list, planned_recipes, planned_extras) -> list:
+    """Returns the unsaved GroceryListItem objects the given plan would produce, by ingredient name."""
+    items = [
+        GroceryListItem(
+            grocery_list=grocery_list,
+            ingredient=data["ingredient_obj"],
+            unit=data["unit_obj"],
+            quantity=round(data["quantity"], 2),
+            from_recipes=" & ".join(sorted(set(data["sources"]))),
+        )
+        for data in aggregate_grocery_items(planned_recipes, planned_extras).values()
+        if data["ingredient_obj"] and data["unit_obj"]
+    ]
+    return sorted(items, key=lambda item: item.ingredient.name)
+
+
+@transaction.atomic  # Ensure the whole process is atomic
+def update_grocery_list_items(grocery_list_id: int, user: User) -> None:
+    """
+    Recalculates and saves all GroceryListItem objects for a given grocery list
+    based on its PlannedRecipe and PlannedExtra items. Aggregates by ingredient AND unit.
+
+    Ensures the user owns the grocery list.
+    """
+    try:
+        # Ensure the user owns the list
+        grocery_list = GroceryList.objects.get(id=grocery_list_id, user=user)
+    except GroceryList.DoesNotExist:
+        # Or raise PermissionDenied - depends on how you want to handle errors
+        print(f"Error: GroceryList ID {grocery_list_id} not found or not owned by user {user.id}")
+        return  # Exit if list not found or not owned by the user
+
+    # Fetch related items efficiently, including units
+    planned_recipes = (
+        grocery_list.plannedrecipes.select_related("recipe")
+        .prefetch_related(
+            "recipe__recipeingredient_set__ingredient",  # Prefetch ingredient
+            "recipe__recipeingredient_set__unit",  # Prefetch unit for recipe ingredients
+        )
+        .all()
+    )
+    # Select related ingredient and unit for planned extras
+    planned_extras = grocery_list.plannedextras.select_related("ingredient", "unit").all()
+
+    aggregated_items = aggregate_grocery_items(planned_recipes, planned_extras)
+
     # --- Create/Update/Delete GroceryListItem objects ---
     # Key existing items by (ingredient_id, unit_id) for quick lookup
     existing_items = {(item.ingredient_id, item.unit_id): item for item in grocery_list.grocerylistitems.all()}
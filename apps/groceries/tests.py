@@ -1,3 +1,130 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from rest_framework.test import APITestCase
+
+from apps.ingredients.models import Ingredient, IngredientUnit
+from apps.recipes.models import Recipe, RecipeIngredient
+from apps.recipes.services import recipe_ingredients_changed
+
+from .models import GroceryList, PlannedRecipe
+from .optimizer import optimize_meal_plan
+
+User = get_user_model()
+
+
+class OptimizerTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="cook", password="secret")
+        self.unit = IngredientUnit.objects.create(name="gram", grams=1)
+        self.ingredients = {
+            name: Ingredient.objects.create(name=name, fdc_id=index)
+            for index, name in enumerate(["onion", "carrot", "leek", "potato", "rice", "tofu", "lime"])
+        }
+        self.soup = self.create_recipe("Soup", ["onion", "carrot", "leek"], score=6)
+        self.stew = self.create_recipe("Stew", ["onion", "carrot", "potato"], score=5)
+        self.curry = self.create_recipe("Curry", ["rice", "tofu", "lime"], score=9)
+
+    def create_recipe(self, title, ingredient_names, score=0):
+        recipe = Recipe.objects.create(
+            title=title, slug=title.lower(), author=self.user, content="Cook.", bayesian_score=score
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=self.ingredients[name], unit=self.unit, quantity=100)
+            for name in ingredient_names
+        )
+        recipe_ingredients_changed([recipe.id])
+        return recipe
+
+
+class OptimizerTests(OptimizerTestCase):
+    def test_prefers_shared_ingredients(self):
+        plan = optimize_meal_plan(2)
+
+        self.assertEqual(sorted(plan.recipe_ids), sorted([self.soup.id, self.stew.id]))
+        self.assertEqual(len(plan.new_ingredient_ids), 4)
+        self.assertTrue(plan.complete)
+
+    def test_available_ingredients_are_free(self):
+        available = [self.ingredients[name].id for name in ("rice", "tofu", "lime")]
+
+        plan = optimize_meal_plan(1, available_ingredient_ids=available)
+
+        self.assertEqual(plan.recipe_ids, [self.curry.id])
+        self.assertEqual(plan.new_ingredient_ids, [])
+
+    def test_exhausted_budget_still_fills_every_meal(self):
+        plan = optimize_meal_plan(3, time_budget=0)
+
+        self.assertEqual(len(plan.recipe_ids), 3)
+        self.assertFalse(plan.complete)
+
+    def test_candidates_are_capped_but_required_recipes_kept(self):
+        plan = optimize_meal_plan(2, required_recipe_ids=[self.stew.id], max_candidates=1)
+
+        # Only the best scored other recipe (curry) is loaded next to the required stew
+        self.assertEqual(plan.recipe_ids, [self.stew.id, self.curry.id])
+
+    def test_required_recipes_ignore_the_rating_filter(self):
+        plan = optimize_meal_plan(1, required_recipe_ids=[self.stew.id], min_rating=8)
+
+        self.assertEqual(plan.recipe_ids, [self.stew.id])
+
+
+class OptimizeViewTests(APITestCase, OptimizerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.grocery_list = GroceryList.objects.create(name="Week", user=self.user)
+        self.url = f"/api/groceries/lists/{self.grocery_list.id}/optimize/"
+        self.client.force_login(self.user)
+
+    def test_plan(self):
+        response = self.client.post(self.url, {"meals": 2}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(planned["recipe"]["id"] for planned in response.data["planned_recipes"]),
+            sorted([self.soup.id, self.stew.id]),
+        )
+
+    def test_unknown_required_recipes_are_rejected(self):
+        response = self.client.post(self.url, {"meals": 2, "required_recipe_ids": [999999]}, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("required_recipe_ids", response.data)
+
+    def test_required_and_excluded_recipes_are_rejected(self):
+        response = self.client.post(
+            self.url,
+            {"meals": 2, "required_recipe_ids": [self.soup.id], "excluded_recipe_ids": [self.soup.id]},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_already_planned_required_recipes_are_rejected(self):
+        PlannedRecipe.objects.create(grocery_list=self.grocery_list, recipe=self.soup, guests=2)
+
+        response = self.client.post(self.url, {"meals": 2, "required_recipe_ids": [self.soup.id]}, format="json")
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_recipes_deleted_while_planning_are_skipped(self):
+        def plan_then_delete(*args, **kwargs):
+            plan = optimize_meal_plan(*args, **kwargs)
+            Recipe.objects.filter(id=plan.recipe_ids[0]).delete()
+            return plan
+
+        with mock.patch("apps.groceries.views.optimize_meal_plan", plan_then_delete):
+            response = self.client.post(self.url, {"meals": 2}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["planned_recipes"]), 1)
+
+    @override_settings(MEAL_PLAN_OPTIMIZER_MAX_CANDIDATES=1)
+    def test_candidate_cap_setting(self):
+        response = self.client.post(self.url, {"meals": 2}, format="json")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["planned_recipes"]), 1)
@@ -1,4 +1,8 @@
+from datetime import timedelta
+
+from django.db import transaction
 from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.authentication import SessionAuthentication  # Or TokenAuthentication
@@ -10,9 +14,15 @@ from .serializers import (
     PlannedRecipeSerializer,
     PlannedExtraSerializer,
     GroceryListItemSerializer,
+    MealPlanOptimizeSerializer,
 )
 
-from .services import update_grocery_list_items
+from .optimizer import optimize_meal_plan
+from .services import preview_grocery_list_items, update_grocery_list_items
+from apps.ingredients.nutrition import nutrition_for_items
+from apps.recipes.models import Recipe
+
+RECIPE_INGREDIENT_PREFETCH = ["recipe__recipeingredient_set__ingredient", "recipe__recipeingredient_set__unit"]
 
 
 class GroceryListViewSet(viewsets.ModelViewSet):
@@ -31,6 +41,79 @@ class GroceryListViewSet(viewsets.ModelViewSet):
         """Associate the new grocery list with the current logged-in user."""
         serializer.save(user=self.request.user)
 
+    @action(detail=True, methods=["get"])
+    def nutrition(self, request, pk=None):
+        """Returns nutrient totals of all items in the grocery list (planned recipes and extras)."""
+        grocery_list = self.get_object()
+        items = grocery_list.grocerylistitems.select_related("ingredient", "unit")
+        return Response(nutrition_for_items(items))
+
+    @action(detail=True, methods=["post"])
+    def optimize(self, request, pk=None):
+        """
+        Proposes recipes for a number of meals that share ingredients with each other and with
+        what is already on the list (or in the pantry), so few distinct ingredients must be bought.
+        Returns the proposed planned recipes and the resulting grocery items. With "apply": true
+        the proposal is added to the list.
+        Example body: {"meals": 5, "guests": [2], "start_date": "2025-06-02", "apply": false}
+        """
+        grocery_list = self.get_object()
+        serializer = MealPlanOptimizeSerializer(data=request.data, context={"grocery_list": grocery_list})
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        planned_recipes = list(
+            grocery_list.plannedrecipes.select_related("recipe").prefetch_related(*RECIPE_INGREDIENT_PREFETCH)
+        )
+        planned_extras = list(grocery_list.plannedextras.select_related("ingredient", "unit"))
+        available_ids = set(params["pantry_ingredient_ids"])
+        available_ids.update(extra.ingredient_id for extra in planned_extras)
+        for planned in planned_recipes:
+            available_ids.update(planned.recipe.ingredient_ids)
+
+        plan = optimize_meal_plan(
+            params["meals"],
+            available_ingredient_ids=available_ids,
+            required_recipe_ids=params["required_recipe_ids"],
+            excluded_recipe_ids=params["excluded_recipe_ids"] + [planned.recipe_id for planned in planned_recipes],
+            min_rating=params["min_rating"] * 2 if params.get("min_rating") else None,  # Stored on a 0-10 scale
+        )
+
+        recipes = Recipe.objects.select_related("author").prefetch_related(
+            "recipeingredient_set__ingredient", "recipeingredient_set__unit"
+        )
+        recipes = recipes.in_bulk(plan.recipe_ids)
+        guests = params["guests"] * params["meals"] if len(params["guests"]) == 1 else params["guests"]
+        start_date = params.get("start_date")
+        proposed = [
+            PlannedRecipe(
+                grocery_list=grocery_list,
+                recipe=recipes[recipe_id],
+                guests=guests[index],
+                planned_on=start_date + timedelta(days=index) if start_date else None,
+            )
+            for index, recipe_id in enumerate(plan.recipe_ids)
+            if recipe_id in recipes  # Skips recipes deleted since they were planned
+        ]
+
+        if params["apply"]:
+            with transaction.atomic():
+                PlannedRecipe.objects.bulk_create(proposed)
+                update_grocery_list_items(grocery_list_id=grocery_list.id, user=request.user)
+            items = grocery_list.grocerylistitems.select_related("ingredient", "unit").order_by("ingredient__name")
+        else:
+            items = preview_grocery_list_items(grocery_list, planned_recipes + proposed, planned_extras)
+
+        return Response(
+            {
+                "planned_recipes": PlannedRecipeSerializer(proposed, many=True, context={"request": request}).data,
+                "new_ingredient_count": len(plan.new_ingredient_ids),
+                "complete": plan.complete,
+                "items": GroceryListItemSerializer(items, many=True).data,
+            },
+            status=status.HTTP_201_CREATED if params["apply"] else status.HTTP_200_OK,
+        )
+
 
 class PlannedRecipeViewSet(viewsets.ModelViewSet):
     """
@@ -0,0 +1,100 @@
+"""
+Versioned ingredient and unit catalog for clients to cache and search locally.
+
+The catalog is serialized column-wise (one array per field) as compact JSON and stored
+gzipped in the cache, keyed on a cheap fingerprint of the tables (latest change and row
+counts), so it is rebuilt only after the catalog changed. Its version is
+"<latest change in microseconds>.<content hash>": the hash makes it a strong validator,
+the timestamp lets a client ask for the changes since the version it has.
+"""
+
+import gzip
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from .models import CatalogDeletion, Ingredient, IngredientUnit
+
+CATALOG_CACHE_KEY = "ingredient-catalog"
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+# Deltas re-send rows changed shortly before the client's version, so rows committed late
+# with an older timestamp (long transactions) are not missed. Re-sent rows are harmless upserts.
+DELTA_OVERLAP = timedelta(minutes=5)
+
+
+def _dumps(data) -> bytes:
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+def _ingredient_columns(queryset):
+    rows = list(queryset.order_by("id").values_list("id", "name", "fdc_id", "priority"))
+    ids, names, fdc_ids, priorities = (list(column) for column in zip(*rows)) if rows else ([], [], [], [])
+    return {"id": ids, "name": names, "fdc_id": fdc_ids, "priority": priorities}
+
+
+def _unit_columns(queryset):
+    rows = list(queryset.order_by("id").values_list("id", "name", "grams"))
+    ids, names, grams = (list(column) for column in zip(*rows)) if rows else ([], [], [])
+    return {"id": ids, "name": names, "grams": grams}
+
+
+def catalog_state():
+    """Returns (time of the latest catalog change, fingerprint that changes with any change)."""
+    ingredients = Ingredient.objects.aggregate(changed=Max("updated_at"), count=Count("id"))
+    units = IngredientUnit.objects.aggregate(changed=Max("updated_at"), count=Count("id"))
+    deleted = CatalogDeletion.objects.aggregate(changed=Max("deleted_at"))["changed"]
+    changes = [changed for changed in (ingredients["changed"], units["changed"], deleted) if changed]
+    latest = max(changes, default=EPOCH)
+    fingerprint = f"{latest.isoformat()}:{ingredients['count']}:{units['count']}"
+    return latest, fingerprint
+
+
+def _timestamp(moment) -> int:
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+
+def parse_version(version) -> datetime | None:
+    """Returns the change time encoded in a catalog version, or None if it is not a valid version."""
+    try:
+        return EPOCH + timedelta(microseconds=int(version.split(".", 1)[0]))
+    except (AttributeError, ValueError, OverflowError, OSError):
+        return None
+
+
+def get_catalog() -> dict:
+    """Returns the current catalog as {"version", "body" (JSON bytes), "gzip" (compressed body)}."""
+    latest, fingerprint = catalog_state()
+    entry = cache.get(CATALOG_CACHE_KEY)
+    if entry is not None and entry["fingerprint"] == fingerprint:
+        return entry
+
+    content = {"ingredients": _ingredient_columns(Ingredient.objects), "units": _unit_columns(IngredientUnit.objects)}
+    version = f"{_timestamp(latest)}.{hashlib.md5(_dumps(content)).hexdigest()[:16]}"
+    body = _dumps({"version": version, **content})
+    entry = {"fingerprint": fingerprint, "version": version, "body": body, "gzip": gzip.compress(body)}
+    cache.set(CATALOG_CACHE_KEY, entry, None)
+    return entry
+
+
+def get_catalog_delta(since: datetime) -> dict:
+    """Returns the rows changed and the ids deleted after the given time, with the current version."""
+    catalog = get_catalog()
+    since = since - DELTA_OVERLAP
+    deletions = CatalogDeletion.objects.filter(deleted_at__gt=since)
+    return {
+        "version": catalog["version"],
+        "ingredients": _ingredient_columns(Ingredient.objects.filter(updated_at__gt=since)),
+        "units": _unit_columns(IngredientUnit.objects.filter(updated_at__gt=since)),
+        "deleted": {
+            "ingredients": sorted(
+                deletions.filter(kind=CatalogDeletion.Kind.INGREDIENT).values_list("object_id", flat=True)
+            ),
+            "units": sorted(deletions.filter(kind=CatalogDeletion.Kind.UNIT).values_list("object_id", flat=True)),
+        },
+        # Lets clients check their copy against the server's and fall back to a full download
+        "counts": {"ingredients": Ingredient.objects.count(), "units": IngredientUnit.objects.count()},
+    }
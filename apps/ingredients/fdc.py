@@ -0,0 +1,277 @@
+"""
+Streaming importer for USDA FoodData Central (FDC) dumps.
+
+Rows are read lazily from the CSV or JSON files, written in batches to temporary
+staging tables with Postgres COPY and merged into the FDC tables with
+INSERT ... ON CONFLICT. Each batch is committed together with its checkpoint,
+so an interrupted import resumes where it stopped and re-running it is harmless.
+"""
+
+import csv
+import io
+import json
+import os
+import time
+from datetime import datetime
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import FdcFood, FdcFoodNutrient, FdcImportCheckpoint, Nutrient
+
+CSV_FILES = ["nutrient.csv", "food.csv", "food_nutrient.csv"]
+JSON_READ_SIZE = 1 << 20
+
+
+# --- Staging tables and merge statements ---------------------------------------------------
+
+STAGING_TABLES = {
+    "nutrient": "id integer, name text, unit_name text, nutrient_nbr text, rank integer",
+    "food": "fdc_id integer, data_type text, description text, food_category_id integer, publication_date date",
+    "food_nutrient": "fdc_id integer, nutrient_id integer, amount double precision",
+}
+
+MERGE_SQL = {
+    "nutrient": f"""
+        INSERT INTO {Nutrient._meta.db_table} (id, name, unit_name, nutrient_nbr, rank)
+        SELECT DISTINCT ON (id) id, COALESCE(name, ''), COALESCE(unit_name, ''), COALESCE(nutrient_nbr, ''), rank
+        FROM fdc_stage_nutrient
+        WHERE id IS NOT NULL
+        ORDER BY id
+        ON CONFLICT (id) DO UPDATE SET
+            name = EXCLUDED.name,
+            unit_name = EXCLUDED.unit_name,
+            nutrient_nbr = EXCLUDED.nutrient_nbr,
+            rank = EXCLUDED.rank
+        WHERE ({Nutrient._meta.db_table}.name, {Nutrient._meta.db_table}.unit_name,
+               {Nutrient._meta.db_table}.nutrient_nbr, {Nutrient._meta.db_table}.rank)
+            IS DISTINCT FROM (EXCLUDED.name, EXCLUDED.unit_name, EXCLUDED.nutrient_nbr, EXCLUDED.rank)
+    """,
+    "food": f"""
+        INSERT INTO {FdcFood._meta.db_table} (fdc_id, data_type, description, food_category_id, publication_date)
+        SELECT DISTINCT ON (fdc_id) fdc_id, COALESCE(data_type, ''), COALESCE(description, ''),
+            food_category_id, publication_date
+        FROM fdc_stage_food
+        WHERE fdc_id IS NOT NULL
+        ORDER BY fdc_id
+        ON CONFLICT (fdc_id) DO UPDATE SET
+            data_type = EXCLUDED.data_type,
+            description = EXCLUDED.description,
+            food_category_id = EXCLUDED.food_category_id,
+            publication_date = EXCLUDED.publication_date
+        WHERE ({FdcFood._meta.db_table}.data_type, {FdcFood._meta.db_table}.description,
+               {FdcFood._meta.db_table}.food_category_id, {FdcFood._meta.db_table}.publication_date)
+            IS DISTINCT FROM (EXCLUDED.data_type, EXCLUDED.description,
+                              EXCLUDED.food_category_id, EXCLUDED.publication_date)
+    """,
+    # Rows pointing to unknown foods or nutrients are skipped rather than failing the batch
+    "food_nutrient": f"""
+        INSERT INTO {FdcFoodNutrient._meta.db_table} (food_id, nutrient_id, amount)
+        SELECT DISTINCT ON (s.fdc_id, s.nutrient_id) s.fdc_id, s.nutrient_id, s.amount
+        FROM fdc_stage_food_nutrient s
+        JOIN {FdcFood._meta.db_table} f ON f.fdc_id = s.fdc_id
+        JOIN {Nutrient._meta.db_table} n ON n.id = s.nutrient_id
+        WHERE s.amount IS NOT NULL
+        ORDER BY s.fdc_id, s.nutrient_id
+        ON CONFLICT (food_id, nutrient_id) DO UPDATE SET amount = EXCLUDED.amount
+        WHERE {FdcFoodNutrient._meta.db_table}.amount IS DISTINCT FROM EXCLUDED.amount
+    """,
+}
+
+
+def _create_staging_tables(cursor):
+    for name, columns in STAGING_TABLES.items():
+        cursor.execute(f"CREATE TEMPORARY TABLE IF NOT EXISTS fdc_stage_{name} ({columns}) ON COMMIT DELETE ROWS")
+
+
+def _copy_rows(cursor, table, rows):
+    """Bulk loads rows into a staging table with COPY."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY fdc_stage_{table} FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+# --- Source readers --------------------------------------------------------------------------
+
+
+def _null_if_blank(value):
+    return value if value not in ("", None) else None
+
+
+def _parse_fdc_date(value):
+    """FDC CSV dumps use ISO dates, the JSON dumps use M/D/YYYY."""
+    value = _null_if_blank(value)
+    if value is None or "/" not in value:
+        return value
+    return datetime.strptime(value, "%m/%d/%Y").date().isoformat()
+
+
+def read_csv_rows(path):
+    """Yields the staging rows of one FDC CSV file as {table: [row, ...]} dicts, one per line."""
+    table = os.path.basename(path)[: -len(".csv")]
+    with open(path, newline="", encoding="utf-8") as source:
+        for record in csv.DictReader(source):
+            if table == "nutrient":
+                row = [
+                    record["id"],
+                    record["name"],
+                    record["unit_name"],
+                    record.get("nutrient_nbr"),
+                    record.get("rank"),
+                ]
+            elif table == "food":
+                row = [
+                    record["fdc_id"],
+                    record.get("data_type"),
+                    record.get("description"),
+                    _null_if_blank(record.get("food_category_id")),
+                    _parse_fdc_date(record.get("publication_date")),
+                ]
+            else:
+                row = [record["fdc_id"], record["nutrient_id"], _null_if_blank(record.get("amount"))]
+            yield {table: [[_null_if_blank(value) for value in row]]}
+
+
+def iter_json_array(source, read_size=JSON_READ_SIZE):
+    """
+    Lazily yields the elements of the first JSON array in a file, e.g. the foods in
+    {"FoundationFoods": [...]}, without loading the whole document.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    while "[" not in buffer:
+        chunk = source.read(read_size)
+        if not chunk:
+            return
+        buffer += chunk
+    position = buffer.index("[") + 1
+
+    while True:
+        while position < len(buffer) and buffer[position] in " \t\r\n,":
+            position += 1
+        if position < len(buffer) and buffer[position] == "]":
+            return
+        try:
+            element, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = source.read(read_size)
+            if not chunk:
+                raise
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        yield element
+        if position > read_size:
+            buffer = buffer[position:]
+            position = 0
+
+
+def read_json_rows(path):
+    """Yields the staging rows of one food from an FDC JSON dump, as {table: [row, ...]} dicts."""
+    seen_nutrients = set()  # Every food repeats the nutrient definitions, stage each one once
+    with open(path, encoding="utf-8") as source:
+        for food in iter_json_array(source):
+            category = food.get("foodCategory") or {}
+            rows = {
+                "food": [
+                    [
+                        food["fdcId"],
+                        food.get("dataType"),
+                        food.get("description"),
+                        category.get("id"),
+                        _parse_fdc_date(food.get("publicationDate")),
+                    ]
+                ],
+                "nutrient": [],
+                "food_nutrient": [],
+            }
+            for food_nutrient in food.get("foodNutrients", []):
+                nutrient = food_nutrient.get("nutrient") or {}
+                if "id" not in nutrient:
+                    continue
+                if nutrient["id"] not in seen_nutrients:
+                    seen_nutrients.add(nutrient["id"])
+                    rows["nutrient"].append(
+                        [
+                            nutrient["id"],
+                            nutrient.get("name"),
+                            nutrient.get("unitName"),
+                            nutrient.get("number"),
+                            nutrient.get("rank"),
+                        ]
+                    )
+                rows["food_nutrient"].append([food["fdcId"], nutrient["id"], food_nutrient.get("amount")])
+            yield rows
+
+
+# --- Import driver -------------------------------------------------------------------------
+
+
+def source_signature(path):
+    """Identifies a source file, so a newer dump with the same name starts a fresh import."""
+    stat = os.stat(path)
+    return f"{os.path.basename(path)}:{stat.st_size}:{int(stat.st_mtime)}"
+
+
+def discover_sources(path):
+    """Returns the files to import, in dependency order, for a dump directory or a single file."""
+    if os.path.isdir(path):
+        sources = [os.path.join(path, name) for name in CSV_FILES if os.path.exists(os.path.join(path, name))]
+        sources += sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".json"))
+        return sources
+    return [path]
+
+
+def import_source(path, batch_size=50_000, restart=False, progress=None):
+    """
+    Imports one FDC file. Batches of `batch_size` source rows are merged in their own
+    transaction together with the checkpoint. Returns the number of rows processed.
+    """
+    reader = read_json_rows if path.endswith(".json") else read_csv_rows
+    checkpoint, _ = FdcImportCheckpoint.objects.get_or_create(source=source_signature(path))
+    if restart:
+        checkpoint.rows_done = 0
+        checkpoint.completed_at = None
+        checkpoint.save()
+    if checkpoint.completed_at is not None:
+        return 0
+
+    skip = checkpoint.rows_done
+    started = time.monotonic()
+    processed = 0
+    batch = {table: [] for table in STAGING_TABLES}
+    batch_rows = 0
+
+    def flush():
+        nonlocal batch, batch_rows
+        with transaction.atomic(), connection.cursor() as cursor:
+            _create_staging_tables(cursor)
+            # Dependency order: foods and nutrients must exist before their amounts are merged
+            for table in ["nutrient", "food", "food_nutrient"]:
+                if batch[table]:
+                    _copy_rows(cursor, table, batch[table])
+                    cursor.execute(MERGE_SQL[table])
+            checkpoint.rows_done += batch_rows
+            checkpoint.save(update_fields=["rows_done", "updated_at"])
+        batch = {table: [] for table in STAGING_TABLES}
+        batch_rows = 0
+        if progress:
+            elapsed = time.monotonic() - started
+            progress(os.path.basename(path), checkpoint.rows_done, processed / elapsed if elapsed else 0.0)
+
+    for index, rows in enumerate(reader(path)):
+        if index < skip:
+            continue
+        for table, table_rows in rows.items():
+            batch[table].extend(table_rows)
+        batch_rows += 1
+        processed += 1
+        if batch_rows >= batch_size:
+            flush()
+    if batch_rows:
+        flush()
+
+    checkpoint.completed_at = timezone.now()
+    checkpoint.save(update_fields=["completed_at", "updated_at"])
+    return processed
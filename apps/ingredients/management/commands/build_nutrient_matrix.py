@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from apps.ingredients.nutrition import build_nutrient_matrix, nutrient_matrix_is_current
+
+
+class Command(BaseCommand):
+    help = (
+        "Regenerates the memory-mapped ingredient x nutrient matrix used for nutrition totals. "
+        "Run it after catalog changes, e.g. periodically with --if-changed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--if-changed",
+            action="store_true",
+            help="Only rebuild when the ingredient catalog changed since the last build (or it has no stored files)",
+        )
+
+    def handle(self, *args, **options):
+        if options["if_changed"] and nutrient_matrix_is_current():
+            self.stdout.write("Nutrient matrix is up to date")
+            return
+        version = build_nutrient_matrix()
+        self.stdout.write(self.style.SUCCESS(f"Built nutrient matrix version {version}"))
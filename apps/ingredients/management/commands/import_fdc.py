@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from apps.ingredients.fdc import discover_sources, import_source
+from apps.ingredients.nutrition import build_nutrient_matrix
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports USDA FoodData Central foods and nutrients from a CSV dump directory "
+        "(nutrient.csv, food.csv, food_nutrient.csv) or JSON dump files. "
+        "Interrupted imports resume from their last committed batch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", help="FDC CSV dump directories and/or JSON dump files.")
+        parser.add_argument("--batch-size", type=int, default=50_000, help="Source rows merged per transaction.")
+        parser.add_argument("--restart", action="store_true", help="Ignore checkpoints and import from the start.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            raise CommandError("The FDC import uses COPY and requires PostgreSQL.")
+
+        sources = [source for path in options["paths"] for source in discover_sources(path)]
+        if not sources:
+            raise CommandError("No FDC files found.")
+
+        imported_any = False
+        for source in sources:
+            processed = import_source(
+                source,
+                batch_size=options["batch_size"],
+                restart=options["restart"],
+                progress=self.report_progress,
+            )
+            if processed:
+                imported_any = True
+                self.stdout.write(self.style.SUCCESS(f"Imported {processed:,} rows from {source}"))
+            else:
+                self.stdout.write(f"Skipping {source}, already imported")
+
+        if imported_any:
+            version = build_nutrient_matrix()
+            self.stdout.write(f"Rebuilt nutrient matrix (version {version})")
+
+    def report_progress(self, source, rows_done, rows_per_second):
+        self.stdout.write(f"{source}: {rows_done:,} rows ({rows_per_second:,.0f} rows/s)")
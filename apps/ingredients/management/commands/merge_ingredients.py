@@ -0,0 +1,60 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.ingredients.merge import find_merge_candidates, merge_ingredients
+
+CSV_FIELDS = ["source_id", "source_name", "target_id", "target_name", "score", "reason"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Finds and merges duplicate ingredients. Use --find to write merge candidates to a CSV file for review, "
+        "then --apply with the reviewed file (rows with source_id and target_id) to merge them."
+    )
+
+    def add_arguments(self, parser):
+        group = parser.add_mutually_exclusive_group(required=True)
+        group.add_argument("--find", metavar="CSV", help="Write merge candidates to this file ('-' for stdout).")
+        group.add_argument("--apply", metavar="CSV", help="Merge the source_id -> target_id rows of this file.")
+        parser.add_argument(
+            "--threshold", type=float, default=0.7, help="Minimum trigram similarity of candidates (default 0.7)."
+        )
+
+    def handle(self, *args, **options):
+        if options["find"]:
+            self.find(options["find"], options["threshold"])
+        else:
+            self.apply(options["apply"])
+
+    def find(self, path, threshold):
+        candidates = find_merge_candidates(threshold)
+        if path == "-":
+            self.write_candidates(self.stdout, candidates)
+        else:
+            with open(path, "w", newline="") as output:
+                self.write_candidates(output, candidates)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {len(candidates)} merge candidates to {path}"))
+
+    def write_candidates(self, output, candidates):
+        writer = csv.DictWriter(output, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        writer.writerows(candidates)
+
+    def apply(self, path):
+        try:
+            with open(path, newline="") as source:
+                merges = {int(row["source_id"]): int(row["target_id"]) for row in csv.DictReader(source)}
+        except (OSError, KeyError, ValueError) as error:
+            raise CommandError(f"Could not read merges from {path}: {error}")
+
+        try:
+            result = merge_ingredients(merges)
+        except ValueError as error:
+            raise CommandError(str(error))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Merged {result['merged']} ingredients, updated {result['recipes']} recipes and "
+                f"{result['grocery_lists']} grocery lists ({result['collapsed_items']} duplicate items collapsed)"
+            )
+        )
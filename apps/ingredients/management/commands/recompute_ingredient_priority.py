@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from apps.ingredients.priority import recompute_ingredient_priorities
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes Ingredient.priority (autocomplete ordering) from usage in recipes, "
+        "planned extras and grocery lists, with recent usage weighing more. Meant to run periodically."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--half-life-days", type=float, help="Age in days at which a use counts for half (default from settings)."
+        )
+
+    def handle(self, *args, **options):
+        changed = recompute_ingredient_priorities(options["half_life_days"])
+        self.stdout.write(self.style.SUCCESS(f"Updated the priority of {changed} ingredients"))
@@ -0,0 +1,223 @@
+"""
+Detection and merging of duplicate ingredients.
+
+Candidates are found two ways: names equal after normalization (case, accents, punctuation,
+plural endings), and names with a high trigram similarity (the Jaccard index of their
+pg_trgm-style trigram sets, computed for all names at once with a sparse matrix product).
+
+Merging repoints every foreign key to the merged ingredients with one set-based UPDATE per
+table through a temporary source -> target mapping table, all in one transaction. Grocery list
+items that end up duplicated are collapsed, and only the affected lists are recomputed.
+"""
+
+import re
+import unicodedata
+from collections import defaultdict
+
+import numpy as np
+from django.db import connection, transaction
+from scipy import sparse
+
+from apps.groceries.models import GroceryList, GroceryListItem, PlannedExtra
+from apps.groceries.services import update_grocery_list_items
+from apps.recipes.cache import invalidate_recipe_detail
+from apps.recipes.models import RecipeIngredient
+from apps.recipes.services import recipe_ingredients_changed
+
+from .models import Ingredient
+
+SIMILARITY_BLOCK_SIZE = 1000
+
+# Plural endings, tried in order on the last word of a name
+PLURAL_RULES = [
+    (re.compile(r"ies$"), "y"),
+    (re.compile(r"oes$"), "o"),
+    (re.compile(r"(ch|sh|ss|x|z)es$"), r"\1"),
+    (re.compile(r"([^s])s$"), r"\1"),
+]
+
+
+def normalize_name(name) -> str:
+    """Lowercase name without accents, punctuation or a plural ending, e.g. "Tomatoes," -> "tomato"."""
+    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode()
+    words = re.sub(r"[^a-z0-9]+", " ", name.lower()).split()
+    if not words:
+        return ""
+    for pattern, replacement in PLURAL_RULES:
+        singular = pattern.sub(replacement, words[-1])
+        if singular != words[-1]:
+            words[-1] = singular
+            break
+    return " ".join(words)
+
+
+def trigrams(name) -> set:
+    """Trigrams of a name the way pg_trgm builds them: per word, padded with two spaces before and one after."""
+    result = set()
+    for word in re.sub(r"[^a-z0-9]+", " ", name.lower()).split():
+        padded = f"  {word} "
+        result.update(padded[i : i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def _preferred(first, second):
+    """Returns (target, source) of two ingredients rows (id, name, priority): keep the most used, then the oldest."""
+    if (-first[2], first[0]) <= (-second[2], second[0]):
+        return first, second
+    return second, first
+
+
+def find_merge_candidates(threshold=0.7):
+    """
+    Returns merge candidates as [{"source_id", "source_name", "target_id", "target_name", "score", "reason"}],
+    best first. The target of a pair is the ingredient with the highest priority (usage).
+    """
+    rows = list(Ingredient.objects.order_by("id").values_list("id", "name", "priority"))
+    candidates = {}
+
+    def add(first, second, score, reason):
+        target, source = _preferred(first, second)
+        key = (source[0], target[0])
+        if key not in candidates or candidates[key]["score"] < score:
+            candidates[key] = {
+                "source_id": source[0],
+                "source_name": source[1],
+                "target_id": target[0],
+                "target_name": target[1],
+                "score": round(score, 3),
+                "reason": reason,
+            }
+
+    groups = defaultdict(list)
+    for row in rows:
+        groups[normalize_name(row[1])].append(row)
+    for group in groups.values():
+        target = min(group, key=lambda row: (-row[2], row[0]))
+        for row in group:
+            if row is not target:
+                add(target, row, 1.0, "normalized name")
+
+    vocabulary = {}
+    indices, indptr = [], [0]
+    for row in rows:
+        indices.extend(vocabulary.setdefault(trigram, len(vocabulary)) for trigram in trigrams(row[1]))
+        indptr.append(len(indices))
+    matrix = sparse.csr_matrix(
+        (np.ones(len(indices), dtype=np.float32), indices, indptr), shape=(len(rows), len(vocabulary))
+    )
+    sizes = np.diff(matrix.indptr)
+    for start in range(0, len(rows), SIMILARITY_BLOCK_SIZE):
+        shared = (matrix[start : start + SIMILARITY_BLOCK_SIZE] @ matrix.T).tocoo()
+        first = shared.row + start
+        scores = shared.data / (sizes[first] + sizes[shared.col] - shared.data)
+        keep = (first < shared.col) & (scores >= threshold)
+        for i, j, score in zip(first[keep].tolist(), shared.col[keep].tolist(), scores[keep].tolist()):
+            add(rows[i], rows[j], score, "trigram similarity")
+
+    return sorted(candidates.values(), key=lambda candidate: (-candidate["score"], candidate["source_id"]))
+
+
+def resolve_merges(merges) -> dict:
+    """
+    Validates a {source id: target id} mapping and follows chains (a -> b, b -> c becomes
+    a -> c, b -> c). Raises ValueError on cycles or ingredients merged into themselves.
+    """
+    resolved = {}
+    for source in merges:
+        if merges[source] == source:
+            raise ValueError(f"Ingredient {source} cannot be merged into itself.")
+        target, seen = merges[source], {source}
+        while target in merges:
+            if target in seen:
+                raise ValueError(f"Merging ingredient {source} ends in a cycle.")
+            seen.add(target)
+            target = merges[target]
+        resolved[source] = target
+    return resolved
+
+
+def _collapse_grocery_items(cursor, list_ids):
+    """Deletes duplicate (list, ingredient, unit) items, keeping the oldest, checked only if all were."""
+    table = GroceryListItem._meta.db_table
+    duplicates = f"""
+        SELECT grocery_list_id, ingredient_id, unit_id, MIN(id) AS keep_id, BOOL_AND(is_checked) AS is_checked
+        FROM {table}
+        WHERE grocery_list_id = ANY(%(list_ids)s)
+        GROUP BY grocery_list_id, ingredient_id, unit_id
+        HAVING COUNT(*) > 1
+    """
+    cursor.execute(
+        f"""
+        UPDATE {table} AS item SET is_checked = duplicate.is_checked
+        FROM ({duplicates}) AS duplicate
+        WHERE item.id = duplicate.keep_id
+        """,
+        {"list_ids": list_ids},
+    )
+    cursor.execute(
+        f"""
+        DELETE FROM {table} AS item
+        USING ({duplicates}) AS duplicate
+        WHERE item.grocery_list_id = duplicate.grocery_list_id
+            AND item.ingredient_id = duplicate.ingredient_id
+            AND item.unit_id = duplicate.unit_id
+            AND item.id <> duplicate.keep_id
+        """,
+        {"list_ids": list_ids},
+    )
+    return cursor.rowcount
+
+
+def merge_ingredients(merges) -> dict:
+    """
+    Merges ingredients given as {source id: target id}: repoints recipe ingredients, planned
+    extras and grocery list items to the targets, collapses duplicated grocery items, deletes
+    the sources and refreshes what depends on them. Returns counts of what changed.
+    """
+    merges = resolve_merges(merges)
+    if not merges:
+        return {"merged": 0, "recipes": 0, "grocery_lists": 0, "collapsed_items": 0}
+    sources, targets = list(merges), [merges[source] for source in merges]
+    if Ingredient.objects.filter(id__in=set(sources) | set(targets)).count() != len(set(sources) | set(targets)):
+        raise ValueError("Unknown ingredient ids in merges.")
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("""
+            CREATE TEMP TABLE ingredient_merge (source_id bigint PRIMARY KEY, target_id bigint NOT NULL)
+            ON COMMIT DROP
+            """)
+        cursor.execute(
+            "INSERT INTO ingredient_merge SELECT * FROM UNNEST(%s::bigint[], %s::bigint[])", [sources, targets]
+        )
+
+        recipe_ids = list(
+            RecipeIngredient.objects.filter(ingredient_id__in=sources).values_list("recipe_id", flat=True).distinct()
+        )
+        list_ids = set(PlannedExtra.objects.filter(ingredient_id__in=sources).values_list("grocery_list_id", flat=True))
+        list_ids |= set(
+            GroceryListItem.objects.filter(ingredient_id__in=sources).values_list("grocery_list_id", flat=True)
+        )
+        list_ids = sorted(list_ids)
+
+        for model in (RecipeIngredient, PlannedExtra, GroceryListItem):
+            cursor.execute(f"""
+                UPDATE {model._meta.db_table} AS row SET ingredient_id = merge.target_id
+                FROM ingredient_merge AS merge
+                WHERE row.ingredient_id = merge.source_id
+                """)
+        collapsed = _collapse_grocery_items(cursor, list_ids)
+
+        Ingredient.objects.filter(id__in=sources).delete()  # Tombstones are recorded by the post_delete signal
+
+        recipe_ingredients_changed(recipe_ids)
+        for grocery_list in GroceryList.objects.filter(id__in=list_ids).select_related("user"):
+            update_grocery_list_items(grocery_list_id=grocery_list.id, user=grocery_list.user)
+
+        transaction.on_commit(lambda: invalidate_recipe_detail(recipe_ids))
+
+    return {
+        "merged": len(sources),
+        "recipes": len(recipe_ids),
+        "grocery_lists": len(list_ids),
+        "collapsed_items": collapsed,
+    }
@@ -0,0 +1,96 @@
+# Generated by Django 4.2.20 on 2026-10-19 10:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ingredients", "0004_ingredient_priority"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FdcFood",
+            fields=[
+                ("fdc_id", models.IntegerField(primary_key=True, serialize=False)),
+                ("data_type", models.CharField(blank=True, max_length=50)),
+                ("description", models.TextField()),
+                ("food_category_id", models.IntegerField(blank=True, null=True)),
+                ("publication_date", models.DateField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="FdcImportCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "source",
+                    models.CharField(
+                        help_text="File name, size and modification time.",
+                        max_length=255,
+                        unique=True,
+                    ),
+                ),
+                ("rows_done", models.BigIntegerField(default=0)),
+                ("completed_at", models.DateTimeField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="Nutrient",
+            fields=[
+                ("id", models.IntegerField(primary_key=True, serialize=False)),
+                ("name", models.CharField(max_length=255)),
+                ("unit_name", models.CharField(max_length=20)),
+                ("nutrient_nbr", models.CharField(blank=True, max_length=20)),
+                ("rank", models.IntegerField(blank=True, null=True)),
+            ],
+            options={
+                "ordering": ["rank", "id"],
+            },
+        ),
+        migrations.CreateModel(
+            name="FdcFoodNutrient",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("amount", models.FloatField()),
+                (
+                    "food",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="food_nutrients",
+                        to="ingredients.fdcfood",
+                    ),
+                ),
+                (
+                    "nutrient",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="food_nutrients",
+                        to="ingredients.nutrient",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("food", "nutrient")},
+            },
+        ),
+    ]
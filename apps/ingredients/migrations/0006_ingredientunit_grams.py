@@ -0,0 +1,47 @@
+# Generated by Django 4.2.20 on 2026-10-19 10:45
+
+from django.db import migrations, models
+
+# Weight in grams of common units, matched case-insensitively on the unit name
+UNIT_GRAMS = {
+    "g": 1,
+    "gr": 1,
+    "gram": 1,
+    "grams": 1,
+    "kg": 1000,
+    "mg": 0.001,
+    "ml": 1,
+    "cl": 10,
+    "dl": 100,
+    "l": 1000,
+}
+
+
+def set_known_unit_grams(apps, schema_editor):
+    IngredientUnit = apps.get_model("ingredients", "IngredientUnit")
+    db_alias = schema_editor.connection.alias
+    for unit in IngredientUnit.objects.using(db_alias).filter(grams__isnull=True):
+        grams = UNIT_GRAMS.get(unit.name.strip().lower())
+        if grams is not None:
+            unit.grams = grams
+            unit.save(update_fields=["grams"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ingredients", "0005_fdc_data"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="ingredientunit",
+            name="grams",
+            field=models.FloatField(
+                blank=True,
+                help_text="Weight in grams of one unit (volumes assume the density of water), used for nutrition. Leave empty for units without a fixed weight, e.g. 'piece'.",
+                null=True,
+            ),
+        ),
+        migrations.RunPython(set_known_unit_grams, reverse_code=migrations.RunPython.noop),
+    ]
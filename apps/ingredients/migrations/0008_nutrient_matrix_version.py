@@ -0,0 +1,31 @@
+# Generated by Django 4.2.20 on 2026-10-19 11:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ingredients", "0007_catalog_versioning"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="NutrientMatrixVersion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("version", models.CharField(max_length=32, unique=True)),
+                ("nutrients", models.JSONField()),
+                ("catalog_state", models.CharField(blank=True, max_length=100)),
+                ("built_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.20 on 2026-10-19 11:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("ingredients", "0008_nutrient_matrix_version"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="nutrientmatrixversion",
+            name="ingredient_ids_npy",
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name="nutrientmatrixversion",
+            name="matrix_npy",
+            field=models.BinaryField(null=True),
+        ),
+    ]
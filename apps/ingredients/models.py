@@ -5,6 +5,7 @@ class Ingredient(models.Model):
     name = models.CharField(max_length=100, unique=True)
     fdc_id = models.IntegerField(unique=True)
     priority = models.IntegerField(default=0, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.name
@@ -15,9 +16,101 @@ class Ingredient(models.Model):
 
 class IngredientUnit(models.Model):
     name = models.CharField(max_length=100, unique=True)
+    grams = models.FloatField(
+        null=True,
+        blank=True,
+        help_text="Weight in grams of one unit (volumes assume the density of water), used for nutrition. "
+        "Leave empty for units without a fixed weight, e.g. 'piece'.",
+    )
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.name
 
     class Meta:
         ordering = ["name"]
+
+
+class CatalogDeletion(models.Model):
+    """Tombstone of a deleted ingredient or unit, so catalog deltas can report deletions."""
+
+    class Kind(models.TextChoices):
+        INGREDIENT = "ingredient", "Ingredient"
+        UNIT = "unit", "Unit"
+
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} deleted at {self.deleted_at}"
+
+
+class Nutrient(models.Model):
+    """A nutrient as defined by USDA FoodData Central, keyed on its FDC nutrient id."""
+
+    id = models.IntegerField(primary_key=True)
+    name = models.CharField(max_length=255)
+    unit_name = models.CharField(max_length=20)
+    nutrient_nbr = models.CharField(max_length=20, blank=True)
+    rank = models.IntegerField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.unit_name})"
+
+    class Meta:
+        ordering = ["rank", "id"]
+
+
+class FdcFood(models.Model):
+    """A food from USDA FoodData Central. Ingredient.fdc_id refers to its fdc_id."""
+
+    fdc_id = models.IntegerField(primary_key=True)
+    data_type = models.CharField(max_length=50, blank=True)
+    description = models.TextField()
+    food_category_id = models.IntegerField(null=True, blank=True)
+    publication_date = models.DateField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.fdc_id} - {self.description}"
+
+
+class FdcFoodNutrient(models.Model):
+    """Amount of a nutrient in a FoodData Central food, per 100 g (or 100 ml) of food."""
+
+    food = models.ForeignKey(FdcFood, on_delete=models.CASCADE, related_name="food_nutrients")
+    nutrient = models.ForeignKey(Nutrient, on_delete=models.CASCADE, related_name="food_nutrients")
+    amount = models.FloatField()
+
+    class Meta:
+        unique_together = ("food", "nutrient")
+
+    def __str__(self):
+        return f"{self.food_id} - {self.nutrient_id}: {self.amount}"
+
+
+class FdcImportCheckpoint(models.Model):
+    """Tracks how far the import of a FoodData Central source file got, so it can be resumed."""
+
+    source = models.CharField(max_length=255, unique=True, help_text="File name, size and modification time.")
+    rows_done = models.BigIntegerField(default=0)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source}: {self.rows_done} rows{' (complete)' if self.completed_at else ''}"
+
+
+class NutrientMatrixVersion(models.Model):
+    """A published build of the nutrient matrix files (see nutrition.py). The latest one is current."""
+
+    version = models.CharField(max_length=32, unique=True)
+    nutrients = models.JSONField()  # [{"id", "name", "unit"}], one per matrix column
+    # Contents of the .npy files, from which every machine writes its local copy
+    ingredient_ids_npy = models.BinaryField(null=True)
+    matrix_npy = models.BinaryField(null=True)
+    catalog_state = models.CharField(max_length=100, blank=True)  # Catalog fingerprint it was built from
+    built_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.version} built at {self.built_at}"
@@ -0,0 +1,236 @@
+"""
+Nutrition totals backed by a dense ingredient x nutrient matrix.
+
+The matrix holds the amount of every nutrient per gram of each ingredient (float32),
+built from the imported FoodData Central data. It is written to NUTRIENT_MATRIX_DIR
+as .npy files and memory-mapped read-only, so all worker processes on a machine share
+the same pages. Totals are a dot product of an ingredient weight vector with the matrix.
+
+The matrix is only built by the build_nutrient_matrix command (and import_fdc), never while
+serving requests: a build reads the whole FDC nutrient table. Catalog changes are therefore
+picked up by running build_nutrient_matrix --if-changed periodically, not by the request that
+changed the catalog. Each build is published as a NutrientMatrixVersion row holding the file
+contents; workers compare it with the version they mapped and reload when it changed, writing
+the files from the row first when this machine does not have them (a fresh deploy wipes
+NUTRIENT_MATRIX_DIR, and other instances never had them). The files of the previous
+KEEP_VERSIONS builds are kept, so a worker that just read an older version can still map it.
+"""
+
+import io
+import logging
+import os
+import tempfile
+import threading
+import uuid
+from dataclasses import dataclass
+
+import numpy as np
+from django.conf import settings
+from django.db.models import BooleanField, ExpressionWrapper, Q, Subquery
+from rest_framework.exceptions import APIException
+
+from .catalog import catalog_state
+from .models import FdcFoodNutrient, Ingredient, Nutrient, NutrientMatrixVersion
+
+KEEP_VERSIONS = 3
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_loaded = None
+
+
+class NutrientMatrixUnavailable(APIException):
+    status_code = 503
+    default_detail = "Nutrition data is not available yet."
+    default_code = "nutrient_matrix_unavailable"
+
+
+@dataclass(frozen=True)
+class NutrientMatrix:
+    version: str
+    ingredient_ids: np.ndarray  # Sorted ingredient ids, one per matrix row
+    values: np.ndarray  # (ingredients x nutrients) amounts per gram
+    nutrients: list  # [{"id", "name", "unit"}], one per matrix column
+
+
+def _matrix_paths(version):
+    directory = settings.NUTRIENT_MATRIX_DIR
+    return (
+        os.path.join(directory, f"ingredients-{version}.npy"),
+        os.path.join(directory, f"matrix-{version}.npy"),
+    )
+
+
+def _npy_bytes(array) -> bytes:
+    output = io.BytesIO()
+    np.save(output, array)
+    return output.getvalue()
+
+
+def _write_file(path, data):
+    """Writes a file atomically, so readers never map a partial file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix=".npy", delete=False) as tmp:
+        tmp.write(data)
+    os.replace(tmp.name, path)
+
+
+def _restore_files(version) -> bool:
+    """Writes the files of a published version from the database. Returns False if it has no stored contents."""
+    row = NutrientMatrixVersion.objects.filter(version=version).values("ingredient_ids_npy", "matrix_npy").first()
+    if row is None or row["ingredient_ids_npy"] is None or row["matrix_npy"] is None:
+        return False
+    ingredients_path, matrix_path = _matrix_paths(version)
+    _write_file(ingredients_path, bytes(row["ingredient_ids_npy"]))
+    _write_file(matrix_path, bytes(row["matrix_npy"]))
+    logger.info("Wrote the files of nutrient matrix version %s to %s", version, settings.NUTRIENT_MATRIX_DIR)
+    return True
+
+
+def nutrient_matrix_is_current() -> bool:
+    """Whether the latest build was made from the current ingredient catalog and can be served by any machine."""
+    latest = (
+        NutrientMatrixVersion.objects.order_by("-id")
+        .values_list("catalog_state", ExpressionWrapper(Q(matrix_npy__isnull=False), output_field=BooleanField()))
+        .first()
+    )
+    return latest is not None and latest == (catalog_state()[1], True)
+
+
+def build_nutrient_matrix():
+    """
+    Regenerates the matrix files from the database and publishes them as a new version.
+    Workers pick up the new version on their next lookup.
+    """
+    state = catalog_state()[1]
+
+    ingredients = np.array(list(Ingredient.objects.order_by("id").values_list("id", "fdc_id")), dtype=np.int64)
+    ingredients = ingredients.reshape(-1, 2)
+    amounts = np.array(
+        list(
+            FdcFoodNutrient.objects.filter(food_id__in=Subquery(Ingredient.objects.values("fdc_id"))).values_list(
+                "food_id", "nutrient_id", "amount"
+            )
+        ),
+        dtype=np.float64,
+    ).reshape(-1, 3)
+
+    nutrient_ids = np.unique(amounts[:, 1]).astype(np.int64)
+    nutrients = [
+        {"id": nutrient.id, "name": nutrient.name, "unit": nutrient.unit_name}
+        for nutrient in Nutrient.objects.filter(id__in=nutrient_ids.tolist()).order_by("rank", "id")
+    ]
+    column_ids = np.array([nutrient["id"] for nutrient in nutrients], dtype=np.int64)
+
+    # Map FDC ids to matrix rows and nutrient ids to matrix columns
+    fdc_order = np.argsort(ingredients[:, 1])
+    rows = fdc_order[np.searchsorted(ingredients[:, 1], amounts[:, 0].astype(np.int64), sorter=fdc_order)]
+    column_order = np.argsort(column_ids)
+    columns = column_order[np.searchsorted(column_ids, amounts[:, 1].astype(np.int64), sorter=column_order)]
+
+    values = np.zeros((len(ingredients), len(column_ids)), dtype=np.float32)
+    values[rows, columns] = amounts[:, 2] / 100  # FDC amounts are per 100 g
+
+    # Only keep ingredients with nutrient data, the others are reported as missing
+    with_data = np.zeros(len(ingredients), dtype=bool)
+    with_data[rows] = True
+    ingredients, values = ingredients[with_data], values[with_data]
+
+    version = uuid.uuid4().hex
+    ingredient_ids_npy, matrix_npy = _npy_bytes(ingredients[:, 0].copy()), _npy_bytes(values)
+    ingredients_path, matrix_path = _matrix_paths(version)
+    _write_file(ingredients_path, ingredient_ids_npy)
+    _write_file(matrix_path, matrix_npy)
+    NutrientMatrixVersion.objects.create(
+        version=version,
+        nutrients=nutrients,
+        catalog_state=state,
+        ingredient_ids_npy=ingredient_ids_npy,
+        matrix_npy=matrix_npy,
+    )
+
+    # Older builds are dropped once KEEP_VERSIONS newer ones exist, no worker still reads them
+    outdated = NutrientMatrixVersion.objects.order_by("-id")[KEEP_VERSIONS:]
+    for outdated_version in outdated.values_list("version", flat=True):
+        for path in _matrix_paths(outdated_version):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    NutrientMatrixVersion.objects.filter(id__in=outdated.values("id")).delete()
+    return version
+
+
+def get_nutrient_matrix():
+    """
+    Returns the memory-mapped matrix, reloading it when a newer version was published and
+    writing its files from the database when they are missing on this machine.
+    Raises NutrientMatrixUnavailable when no matrix has been built or its files cannot be restored.
+    """
+    global _loaded
+    version = NutrientMatrixVersion.objects.order_by("-id").values_list("version", flat=True).first()
+    if version is None:
+        logger.error("No nutrient matrix has been built, run manage.py build_nutrient_matrix")
+        raise NutrientMatrixUnavailable()
+    if _loaded is not None and _loaded.version == version:
+        return _loaded
+
+    with _lock:
+        if _loaded is None or _loaded.version != version:
+            ingredients_path, matrix_path = _matrix_paths(version)
+            if not (os.path.exists(ingredients_path) and os.path.exists(matrix_path)) and not _restore_files(version):
+                logger.error(
+                    "Files of nutrient matrix version %s are missing in %s and not stored in the database, "
+                    "run manage.py build_nutrient_matrix",
+                    version,
+                    settings.NUTRIENT_MATRIX_DIR,
+                )
+                raise NutrientMatrixUnavailable()
+            ingredient_ids = np.load(ingredients_path)
+            values = np.load(matrix_path, mmap_mode="r")
+            _loaded = NutrientMatrix(
+                version=version,
+                ingredient_ids=ingredient_ids,
+                values=values,
+                nutrients=NutrientMatrixVersion.objects.values_list("nutrients", flat=True).get(version=version),
+            )
+    return _loaded
+
+
+def compute_nutrition(ingredient_ids, grams):
+    """
+    Sums the nutrients of the given ingredient weights (in grams).
+    Returns ([{"id", "name", "unit", "amount"}], ingredient ids without nutrient data).
+    """
+    matrix = get_nutrient_matrix()
+    ingredient_ids = np.asarray(ingredient_ids, dtype=np.int64)
+
+    if len(matrix.ingredient_ids):
+        positions = np.minimum(np.searchsorted(matrix.ingredient_ids, ingredient_ids), len(matrix.ingredient_ids) - 1)
+        known = matrix.ingredient_ids[positions] == ingredient_ids
+    else:
+        positions = np.zeros(len(ingredient_ids), dtype=np.int64)
+        known = np.zeros(len(ingredient_ids), dtype=bool)
+
+    totals = np.asarray(grams, dtype=np.float64)[known] @ matrix.values[positions[known]]
+    nutrients = [{**nutrient, "amount": round(float(amount), 2)} for nutrient, amount in zip(matrix.nutrients, totals)]
+    return nutrients, ingredient_ids[~known].tolist()
+
+
+def nutrition_for_items(items, scale=1):
+    """
+    Computes nutrition for (ingredient, unit, quantity) items such as RecipeIngredient
+    or GroceryListItem rows (ingredient and unit must be loaded).
+    Items whose unit has no weight, or whose ingredient has no nutrient data, are listed as missing.
+    """
+    weighted = [item for item in items if item.unit.grams is not None]
+    nutrients, missing_ids = compute_nutrition(
+        [item.ingredient_id for item in weighted],
+        [item.quantity * item.unit.grams * scale for item in weighted],
+    )
+    missing_ids = set(missing_ids)
+    missing = sorted(
+        {item.ingredient.name for item in items if item.unit.grams is None or item.ingredient_id in missing_ids}
+    )
+    return {"nutrients": nutrients, "missing_ingredients": missing}
@@ -0,0 +1,51 @@
+"""
+Usage-driven Ingredient.priority, which orders ingredient autocomplete.
+
+Every use of an ingredient (in a recipe, as a planned extra, on a grocery list) counts
+for 0.5 ** (age / half-life), so recent usage weighs more than old usage. All priorities
+are recomputed by a single UPDATE joined to the aggregated usage, which only writes the
+ingredients whose priority actually changed (and bumps their updated_at for catalog deltas).
+"""
+
+from django.conf import settings
+from django.db import connection
+
+from apps.groceries.models import GroceryListItem, PlannedExtra
+from apps.recipes.models import Recipe, RecipeIngredient
+
+from .models import Ingredient
+
+# A fully recent use is worth this many priority points, so decayed usage survives rounding
+PRIORITY_SCALE = 10
+
+UPDATE_PRIORITY_SQL = f"""
+    WITH usage AS (
+        SELECT uses.ingredient_id, SUM(POWER(0.5, EXTRACT(EPOCH FROM NOW() - uses.used_on) / %(half_life)s)) AS score
+        FROM (
+            SELECT recipe_ingredient.ingredient_id, recipe.updated_on AS used_on
+            FROM {RecipeIngredient._meta.db_table} AS recipe_ingredient
+            JOIN {Recipe._meta.db_table} AS recipe ON recipe.id = recipe_ingredient.recipe_id
+            UNION ALL
+            SELECT ingredient_id, created_at FROM {PlannedExtra._meta.db_table}
+            UNION ALL
+            SELECT ingredient_id, created_at FROM {GroceryListItem._meta.db_table}
+        ) AS uses
+        GROUP BY uses.ingredient_id
+    )
+    UPDATE {Ingredient._meta.db_table} AS ingredient
+    SET priority = computed.priority, updated_at = NOW()
+    FROM (
+        SELECT ingredient.id, COALESCE(ROUND(usage.score * %(scale)s), 0)::integer AS priority
+        FROM {Ingredient._meta.db_table} AS ingredient
+        LEFT JOIN usage ON usage.ingredient_id = ingredient.id
+    ) AS computed
+    WHERE computed.id = ingredient.id AND ingredient.priority <> computed.priority
+"""
+
+
+def recompute_ingredient_priorities(half_life_days=None) -> int:
+    """Recomputes the priority of all ingredients from their usage. Returns the number of ingredients changed."""
+    half_life_days = half_life_days or settings.INGREDIENT_PRIORITY_HALF_LIFE_DAYS
+    with connection.cursor() as cursor:
+        cursor.execute(UPDATE_PRIORITY_SQL, {"half_life": half_life_days * 24 * 60 * 60, "scale": PRIORITY_SCALE})
+        return cursor.rowcount
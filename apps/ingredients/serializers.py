@@ -11,4 +11,4 @@ class IngredientSerializer(serializers.ModelSerializer):
 class IngredientUnitSerializer(serializers.ModelSerializer):
     class Meta:
         model = IngredientUnit
-        fields = ["id", "name"]
+        fields = ["id", "name", "grams"]
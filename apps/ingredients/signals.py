@@ -0,0 +1,15 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import CatalogDeletion, Ingredient, IngredientUnit
+
+
+@receiver(post_delete, sender=Ingredient)
+def record_ingredient_deletion(sender, instance, **kwargs):
+    """Records a tombstone for catalog deltas, however the ingredient was deleted (API, admin, merge, shell)."""
+    CatalogDeletion.objects.create(kind=CatalogDeletion.Kind.INGREDIENT, object_id=instance.id)
+
+
+@receiver(post_delete, sender=IngredientUnit)
+def record_unit_deletion(sender, instance, **kwargs):
+    CatalogDeletion.objects.create(kind=CatalogDeletion.Kind.UNIT, object_id=instance.id)
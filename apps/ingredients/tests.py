@@ -1,3 +1,337 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from . import nutrition
+from apps.groceries.models import GroceryList, GroceryListItem, PlannedExtra
+from apps.groceries.services import update_grocery_list_items
+from apps.recipes.models import Recipe, RecipeIngredient
+from apps.recipes.services import recipe_ingredients_changed
+
+from .catalog import get_catalog, get_catalog_delta, parse_version
+from .fdc import import_source
+from .merge import find_merge_candidates, merge_ingredients, resolve_merges
+from .models import (
+    CatalogDeletion,
+    FdcFood,
+    FdcFoodNutrient,
+    FdcImportCheckpoint,
+    Ingredient,
+    IngredientUnit,
+    Nutrient,
+    NutrientMatrixVersion,
+)
+from .nutrition import NutrientMatrixUnavailable, build_nutrient_matrix, compute_nutrition
+from .priority import recompute_ingredient_priorities
+from .views import accepts_gzip
+
+
+class NutrientMatrixTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        settings_override = override_settings(NUTRIENT_MATRIX_DIR=self.directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        nutrition._loaded = None
+
+        self.protein = Nutrient.objects.create(id=1003, name="Protein", unit_name="G", rank=1)
+        self.energy = Nutrient.objects.create(id=1008, name="Energy", unit_name="KCAL", rank=2)
+        self.food = FdcFood.objects.create(fdc_id=900001, description="Lentils, raw")
+        FdcFoodNutrient.objects.create(food=self.food, nutrient=self.protein, amount=24)
+        FdcFoodNutrient.objects.create(food=self.food, nutrient=self.energy, amount=350)
+        self.lentils = Ingredient.objects.create(name="lentils", fdc_id=self.food.fdc_id)
+        self.salt = Ingredient.objects.create(name="salt", fdc_id=900002)
+
+    def amounts(self, nutrients):
+        return {nutrient["name"]: nutrient["amount"] for nutrient in nutrients}
+
+    def test_totals(self):
+        build_nutrient_matrix()
+
+        nutrients, missing = compute_nutrition([self.lentils.id, self.salt.id], [200, 5])
+
+        self.assertEqual(self.amounts(nutrients), {"Protein": 48.0, "Energy": 700.0})
+        self.assertEqual(missing, [self.salt.id])
+
+    def test_missing_matrix_raises(self):
+        with self.assertRaises(NutrientMatrixUnavailable), self.assertLogs(nutrition.logger, "ERROR"):
+            compute_nutrition([self.lentils.id], [100])
+
+    def test_workers_reload_new_versions(self):
+        build_nutrient_matrix()
+        compute_nutrition([self.lentils.id], [100])
+
+        FdcFoodNutrient.objects.filter(nutrient=self.protein).update(amount=25)
+        version = build_nutrient_matrix()
+        nutrients, _ = compute_nutrition([self.lentils.id], [100])
+
+        self.assertEqual(nutrition._loaded.version, version)
+        self.assertEqual(self.amounts(nutrients)["Protein"], 25.0)
+
+    def test_old_versions_are_removed(self):
+        versions = [build_nutrient_matrix() for _ in range(nutrition.KEEP_VERSIONS + 2)]
+
+        kept = versions[-nutrition.KEEP_VERSIONS :]
+        self.assertEqual(sorted(NutrientMatrixVersion.objects.values_list("version", flat=True)), sorted(kept))
+        self.assertEqual(
+            sorted(os.listdir(self.directory)),
+            sorted(f"{prefix}-{version}.npy" for version in kept for prefix in ("ingredients", "matrix")),
+        )
+
+    def test_requests_do_not_rebuild(self):
+        build_nutrient_matrix()
+
+        self.client.force_login(get_user_model().objects.create_user(username="cook", password="secret"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(
+                f"/api/ingredients/ingredients/{self.salt.id}/", {"fdc_id": 900003}, content_type="application/json"
+            )
+
+        self.assertEqual(NutrientMatrixVersion.objects.count(), 1)
+
+    def test_missing_files_are_restored_from_the_database(self):
+        version = build_nutrient_matrix()
+        shutil.rmtree(self.directory)  # As after a deploy, or on another instance
+
+        nutrients, _ = compute_nutrition([self.lentils.id], [100])
+
+        self.assertEqual(self.amounts(nutrients)["Protein"], 24.0)
+        self.assertEqual(nutrition._loaded.version, version)
+        self.assertTrue(all(os.path.exists(path) for path in nutrition._matrix_paths(version)))
+
+    def test_command_rebuilds_builds_without_stored_files(self):
+        build_nutrient_matrix()
+        NutrientMatrixVersion.objects.update(ingredient_ids_npy=None, matrix_npy=None)
+
+        call_command("build_nutrient_matrix", "--if-changed", stdout=StringIO())
+
+        self.assertEqual(NutrientMatrixVersion.objects.count(), 2)
+
+    def test_recipe_detail_includes_nutrition(self):
+        user = get_user_model().objects.create_user(username="cook", password="secret")
+        recipe = Recipe.objects.create(title="Dal", slug="dal", author=user, content="Simmer.")
+        RecipeIngredient.objects.create(
+            recipe=recipe,
+            ingredient=self.lentils,
+            unit=IngredientUnit.objects.create(name="gram", grams=1),
+            quantity=50,
+        )
+        url = f"/api/recipes/recipes/{recipe.id}/"
+        self.assertIsNone(self.client.get(url).data["nutrition"])
+
+        build_nutrient_matrix()  # A new version changes the cached detail's version
+        nutrition_data = self.client.get(url).data["nutrition"]
+
+        self.assertEqual(self.amounts(nutrition_data["nutrients"]), {"Protein": 12.0, "Energy": 175.0})
+        self.assertEqual(nutrition_data["missing_ingredients"], [])
+
+    def test_command_rebuilds_only_after_changes(self):
+        call_command("build_nutrient_matrix", "--if-changed", stdout=StringIO())
+        call_command("build_nutrient_matrix", "--if-changed", stdout=StringIO())
+        self.assertEqual(NutrientMatrixVersion.objects.count(), 1)
+
+        self.salt.fdc_id = 900003
+        self.salt.save()
+        call_command("build_nutrient_matrix", "--if-changed", stdout=StringIO())
+        self.assertEqual(NutrientMatrixVersion.objects.count(), 2)
+
+
+class AcceptsGzipTests(SimpleTestCase):
+    def test_q_values(self):
+        self.assertTrue(accepts_gzip("gzip, deflate, br"))
+        self.assertTrue(accepts_gzip("deflate;q=1.0, gzip;q=0.5"))
+        self.assertTrue(accepts_gzip("*"))
+        self.assertFalse(accepts_gzip(""))
+        self.assertFalse(accepts_gzip("gzip;q=0"))
+        self.assertFalse(accepts_gzip("GZIP; q=0.000, identity"))
+        self.assertFalse(accepts_gzip("*;q=1, gzip;q=0"))
+        self.assertFalse(accepts_gzip("x-gzip-like"))
+
+
+class CatalogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.onion = Ingredient.objects.create(name="onion", fdc_id=1)
+        self.shallot = Ingredient.objects.create(name="shallot", fdc_id=2)
+        self.unit = IngredientUnit.objects.create(name="gram", grams=1)
+        self.url = "/api/ingredients/ingredients/catalog/"
+
+    def deletions(self):
+        return set(CatalogDeletion.objects.values_list("kind", "object_id"))
+
+    def test_gzip_only_when_accepted(self):
+        self.assertEqual(self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")["Content-Encoding"], "gzip")
+        self.assertFalse(self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip;q=0").has_header("Content-Encoding"))
+
+    def test_deletions_are_recorded_however_made(self):
+        expected = {(CatalogDeletion.Kind.INGREDIENT, self.shallot.id), (CatalogDeletion.Kind.UNIT, self.unit.id)}
+
+        Ingredient.objects.filter(id=self.shallot.id).delete()
+        self.unit.delete()
+
+        self.assertEqual(self.deletions(), expected)
+
+    def test_api_deletion_is_recorded_once(self):
+        self.client.force_login(get_user_model().objects.create_user(username="cook", password="secret"))
+
+        self.assertEqual(self.client.delete(f"/api/ingredients/ingredients/{self.shallot.id}/").status_code, 204)
+
+        self.assertEqual(CatalogDeletion.objects.count(), 1)
+
+    def test_merged_ingredients_appear_as_deleted_in_deltas(self):
+        since = parse_version(get_catalog()["version"])
+
+        merge_ingredients({self.shallot.id: self.onion.id})
+
+        self.assertEqual(self.deletions(), {(CatalogDeletion.Kind.INGREDIENT, self.shallot.id)})
+        self.assertEqual(get_catalog_delta(since)["deleted"]["ingredients"], [self.shallot.id])
+
+
+class MergeTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="cook", password="secret")
+        self.unit = IngredientUnit.objects.create(name="gram", grams=1)
+        self.onion = Ingredient.objects.create(name="onion", fdc_id=1, priority=5)
+        self.onions = Ingredient.objects.create(name="Onions", fdc_id=2)
+        self.shallot = Ingredient.objects.create(name="shallot", fdc_id=3)
+        self.recipe = Recipe.objects.create(title="Soup", slug="soup", author=self.user, content="Cook.")
+        RecipeIngredient.objects.create(recipe=self.recipe, ingredient=self.shallot, unit=self.unit, quantity=50)
+        recipe_ingredients_changed([self.recipe.id])
+        Recipe.objects.filter(id=self.recipe.id).update(neighbours_stale=False)
+        self.grocery_list = GroceryList.objects.create(name="Week", user=self.user)
+
+    def plan_extras(self, checked):
+        """Plans 100 g of each ingredient in checked ({ingredient: is_checked}) and builds the list."""
+        for ingredient in checked:
+            PlannedExtra.objects.create(
+                grocery_list=self.grocery_list, ingredient=ingredient, unit=self.unit, quantity=100
+            )
+        update_grocery_list_items(self.grocery_list.id, self.user)
+        for ingredient, is_checked in checked.items():
+            GroceryListItem.objects.filter(ingredient=ingredient).update(is_checked=is_checked)
+
+    def test_foreign_keys_are_repointed(self):
+        self.plan_extras({self.shallot: False})
+
+        result = merge_ingredients({self.shallot.id: self.onion.id})
+
+        self.assertEqual(result["merged"], 1)
+        self.assertFalse(Ingredient.objects.filter(id=self.shallot.id).exists())
+        for model in (RecipeIngredient, PlannedExtra, GroceryListItem):
+            self.assertEqual(list(model.objects.values_list("ingredient_id", flat=True)), [self.onion.id])
+
+    def test_duplicate_grocery_items_are_collapsed(self):
+        self.plan_extras({self.onion: True, self.shallot: False})
+
+        result = merge_ingredients({self.shallot.id: self.onion.id})
+
+        item = GroceryListItem.objects.get()
+        self.assertEqual(result["collapsed_items"], 1)
+        self.assertEqual((item.ingredient_id, item.quantity, item.is_checked), (self.onion.id, 200, False))
+
+    def test_collapsed_items_stay_checked_when_all_were(self):
+        self.plan_extras({self.onion: True, self.shallot: True})
+
+        merge_ingredients({self.shallot.id: self.onion.id})
+
+        self.assertTrue(GroceryListItem.objects.get().is_checked)
+
+    def test_recipes_are_refreshed(self):
+        merge_ingredients({self.shallot.id: self.onion.id})
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.ingredient_ids, [self.onion.id])
+        self.assertTrue(self.recipe.neighbours_stale)
+
+    def test_chains_are_resolved(self):
+        merges = {self.shallot.id: self.onions.id, self.onions.id: self.onion.id}
+
+        self.assertEqual(resolve_merges(merges), {self.shallot.id: self.onion.id, self.onions.id: self.onion.id})
+
+        merge_ingredients(merges)
+        self.assertEqual(list(Ingredient.objects.values_list("id", flat=True)), [self.onion.id])
+        self.assertEqual(RecipeIngredient.objects.get().ingredient_id, self.onion.id)
+
+    def test_cycles_are_rejected(self):
+        with self.assertRaisesMessage(ValueError, "cycle"):
+            merge_ingredients({self.shallot.id: self.onion.id, self.onion.id: self.shallot.id})
+        with self.assertRaisesMessage(ValueError, "itself"):
+            merge_ingredients({self.shallot.id: self.shallot.id})
+
+        self.assertEqual(Ingredient.objects.count(), 3)
+
+    def test_candidates(self):
+        Ingredient.objects.create(name="mozzarella", fdc_id=4)
+        mozarella = Ingredient.objects.create(name="mozarella", fdc_id=5)
+
+        candidates = {(c["source_name"], c["target_name"]): c["reason"] for c in find_merge_candidates()}
+
+        # The most used ingredient is the target; the older one when usage ties
+        self.assertEqual(
+            candidates,
+            {("Onions", "onion"): "normalized name", (mozarella.name, "mozzarella"): "trigram similarity"},
+        )
+
+
+class FdcImportTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "food.csv")
+        with open(self.path, "w") as food:
+            food.write("fdc_id,data_type,description,food_category_id,publication_date\n")
+            food.writelines(f"{fdc_id},foundation_food,Food {fdc_id},,2024-04-18\n" for fdc_id in (1, 2, 3))
+
+    def test_interrupted_import_resumes_after_the_checkpoint(self):
+        def interrupt(source, rows_done, rows_per_second):
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            import_source(self.path, batch_size=2, progress=interrupt)
+
+        checkpoint = FdcImportCheckpoint.objects.get()
+        self.assertEqual((checkpoint.rows_done, checkpoint.completed_at), (2, None))
+        self.assertEqual(list(FdcFood.objects.order_by("fdc_id").values_list("fdc_id", flat=True)), [1, 2])
+
+        self.assertEqual(import_source(self.path, batch_size=2), 1)  # Only the row after the checkpoint
+        self.assertEqual(list(FdcFood.objects.order_by("fdc_id").values_list("fdc_id", flat=True)), [1, 2, 3])
+        self.assertEqual(import_source(self.path, batch_size=2), 0)
+
+
+class PriorityTests(TestCase):
+    def setUp(self):
+        author = get_user_model().objects.create_user(username="cook", password="secret")
+        unit = IngredientUnit.objects.create(name="gram", grams=1)
+        self.onion, self.carrot, self.leek = (
+            Ingredient.objects.create(name=name, fdc_id=index) for index, name in enumerate(["onion", "carrot", "leek"])
+        )
+        for title, ingredient, age in (("Soup", self.onion, 0), ("Stew", self.carrot, 30)):
+            recipe = Recipe.objects.create(title=title, slug=title.lower(), author=author, content="Cook.")
+            RecipeIngredient.objects.create(recipe=recipe, ingredient=ingredient, unit=unit, quantity=100)
+            Recipe.objects.filter(id=recipe.id).update(updated_on=timezone.now() - timedelta(days=age))
+
+    def priorities(self):
+        return dict(Ingredient.objects.values_list("name", "priority"))
+
+    def test_usage_decays_with_age(self):
+        self.assertEqual(recompute_ingredient_priorities(half_life_days=30), 2)
+
+        # A use one half-life old counts for half, unused ingredients stay at zero
+        self.assertEqual(self.priorities(), {"onion": 10, "carrot": 5, "leek": 0})
+
+    def test_only_changed_priorities_are_written(self):
+        leek_updated_at = self.leek.updated_at
+        recompute_ingredient_priorities(half_life_days=30)
+
+        self.leek.refresh_from_db()
+        self.assertEqual(self.leek.updated_at, leek_updated_at)
+        self.assertEqual(recompute_ingredient_priorities(half_life_days=30), 0)
@@ -1,13 +1,38 @@
 from django.db.models import Q, Case, When, Value, IntegerField
-from rest_framework import viewsets, permissions, filters
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from rest_framework import viewsets, permissions, filters, status
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
+from rest_framework.response import Response
 
+from apps.recipes.cache import invalidate_recipe_detail
+from apps.recipes.models import RecipeIngredient
+
+from .catalog import get_catalog, get_catalog_delta, parse_version
 from .models import Ingredient, IngredientUnit
 from .serializers import IngredientSerializer, IngredientUnitSerializer
 
 from rest_framework.pagination import PageNumberPagination
 
 
+def accepts_gzip(accept_encoding):
+    """Whether an Accept-Encoding header allows gzip, honouring q-values ("gzip;q=0" refuses it)."""
+    qualities = {}
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.strip().lower()] = quality
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+
 class PrioritizedSearchFilter(filters.SearchFilter):
     def filter_queryset(self, request, queryset, view):
         search_terms = self.get_search_terms(request)
@@ -48,6 +73,58 @@ class IngredientViewSet(viewsets.ModelViewSet):
     filter_backends = [PrioritizedSearchFilter]
     search_fields = ["name"]
 
+    def _invalidate_recipes_using(self, ingredient):
+        """Drops cached details of the recipes that embed this ingredient."""
+        recipe_ids = RecipeIngredient.objects.filter(ingredient=ingredient).values_list("recipe_id", flat=True)
+        invalidate_recipe_detail(set(recipe_ids))
+
+    def perform_update(self, serializer):
+        ingredient = serializer.save()
+        self._invalidate_recipes_using(ingredient)
+
+    def perform_destroy(self, instance):
+        self._invalidate_recipes_using(instance)
+        instance.delete()
+
+    @action(detail=False, methods=["get"], permission_classes=[permissions.AllowAny])
+    def catalog(self, request):
+        """
+        Returns all ingredients and units as column arrays, gzipped when the client accepts it.
+        The ETag is the catalog version. With ?version=<current version> the response may be cached forever.
+        Example: /api/ingredients/ingredients/catalog/
+        """
+        catalog = get_catalog()
+        etag = f'"{catalog["version"]}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            if accepts_gzip(request.META.get("HTTP_ACCEPT_ENCODING", "")):
+                response = HttpResponse(catalog["gzip"], content_type="application/json")
+                response["Content-Encoding"] = "gzip"
+            else:
+                response = HttpResponse(catalog["body"], content_type="application/json")
+        response["ETag"] = etag
+        if request.query_params.get("version") == catalog["version"]:
+            response["Cache-Control"] = "public, max-age=31536000, immutable"
+        else:
+            response["Cache-Control"] = "no-cache"
+        patch_vary_headers(response, ["Accept-Encoding"])
+        return response
+
+    @action(detail=False, methods=["get"], url_path="catalog/delta", permission_classes=[permissions.AllowAny])
+    def catalog_delta(self, request):
+        """
+        Returns the ingredients and units changed or deleted since a catalog version,
+        or 204 when the version is current.
+        Example: /api/ingredients/ingredients/catalog/delta/?since=1718000000000000.3f2a9c0d1e4b5a6f
+        """
+        since_version = request.query_params.get("since")
+        since = parse_version(since_version)
+        if since is None:
+            return Response({"error": "Invalid 'since' parameter."}, status=status.HTTP_400_BAD_REQUEST)
+        if since_version == get_catalog()["version"]:
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response(get_catalog_delta(since))
+
 
 class IngredientUnitViewSet(viewsets.ReadOnlyModelViewSet):
     """
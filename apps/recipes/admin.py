@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import Recipe, RecipeIngredient, RecipeRating
+from .services import recipe_ingredients_changed
 
 
 class RecipeIngredientInline(admin.TabularInline):
@@ -28,6 +29,11 @@ class RecipeAdmin(admin.ModelAdmin):
             obj.author = request.user
         super().save_model(request, obj, form, change)
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # The inline edits ingredients directly, keep the denormalized ids and similar recipes in sync
+        recipe_ingredients_changed([form.instance.id])
+
     def get_form(self, request, obj=None, **kwargs):
         form = super().get_form(request, obj, **kwargs)
         form.base_fields["author"].initial = request.user
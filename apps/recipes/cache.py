@@ -0,0 +1,121 @@
+import hashlib
+import json
+from dataclasses import dataclass, field
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Max, OuterRef, Subquery
+from django.db.models.functions import Greatest
+
+from apps.ingredients.models import NutrientMatrixVersion
+
+from .models import Recipe, RecipeIngredient
+
+RECIPE_DETAIL_CACHE_PREFIX = "recipe-detail"
+
+
+@dataclass(frozen=True)
+class RecipeVersion:
+    """Cheap fingerprint of everything a recipe detail response depends on."""
+
+    key: str
+    last_modified: datetime
+    viewer_state: dict = field(default_factory=dict)  # Values of the viewer annotations, if any
+
+
+def recipe_detail_cache_key(recipe_id) -> str:
+    return f"{RECIPE_DETAIL_CACHE_PREFIX}:{recipe_id}"
+
+
+def get_recipe_version(recipe_id, viewer_annotations=None) -> RecipeVersion | None:
+    """
+    Returns the current version of a recipe, derived from its update timestamp, rating
+    state, ingredient set, the update timestamps of its ingredients and units and the
+    nutrient matrix version its nutrition was computed with, or None
+    if the recipe does not exist. Costs one indexed query, which also evaluates the given
+    viewer annotations (see services.viewer_annotations).
+
+    As the version is read from the database, a cached response is never served after any
+    of these changed, even when the cache entry was not invalidated (e.g. because another
+    worker has its own LocMem cache).
+    """
+    viewer_annotations = viewer_annotations or {}
+    catalog_updated_on = (
+        RecipeIngredient.objects.filter(recipe=OuterRef("pk"))
+        .values("recipe")
+        .annotate(latest=Max(Greatest("ingredient__updated_at", "unit__updated_at")))
+        .values("latest")
+    )
+    nutrient_matrix_version = NutrientMatrixVersion.objects.order_by("-id").values("version")[:1]
+    row = (
+        Recipe.objects.filter(pk=recipe_id)
+        .annotate(
+            last_rated_on=Max("reciperating__updated_on"),
+            catalog_updated_on=Subquery(catalog_updated_on),
+            nutrient_matrix_version=Subquery(nutrient_matrix_version),
+            **viewer_annotations,
+        )
+        .values(
+            "updated_on",
+            "average_rating",
+            "rating_count",
+            "ingredient_ids",
+            "last_rated_on",
+            "catalog_updated_on",
+            "nutrient_matrix_version",
+            *viewer_annotations,
+        )
+        .first()
+    )
+    if row is None:
+        return None
+
+    last_modified = max(filter(None, [row["updated_on"], row["last_rated_on"], row["catalog_updated_on"]]))
+    key = ":".join(
+        str(part)
+        for part in (
+            row["updated_on"].timestamp(),
+            row["average_rating"],
+            row["rating_count"],
+            row["last_rated_on"].timestamp() if row["last_rated_on"] else "",
+            row["catalog_updated_on"].timestamp() if row["catalog_updated_on"] else "",
+            hashlib.md5(str(row["ingredient_ids"]).encode()).hexdigest()[:8],
+            row["nutrient_matrix_version"] or "",
+        )
+    )
+    viewer_state = {name: row[name] for name in viewer_annotations}
+    return RecipeVersion(key=key, last_modified=last_modified, viewer_state=viewer_state)
+
+
+def get_cached_recipe_detail(recipe_id, version: RecipeVersion) -> dict | None:
+    """Returns the cached {'etag', 'data'} entry for a recipe if it matches the given version."""
+    entry = cache.get(recipe_detail_cache_key(recipe_id))
+    if entry is None or entry["version"] != version.key:
+        return None
+    return entry
+
+
+def set_cached_recipe_detail(recipe_id, version: RecipeVersion, data) -> dict:
+    """Caches serialized recipe detail data with a content based ETag."""
+    payload = json.dumps(data, sort_keys=True, default=str).encode()
+    entry = {
+        "version": version.key,
+        "etag": f'"{hashlib.md5(payload).hexdigest()}"',
+        "data": data,
+    }
+    cache.set(recipe_detail_cache_key(recipe_id), entry, settings.RECIPE_DETAIL_CACHE_TIMEOUT)
+    return entry
+
+
+def viewer_etag(etag, viewer_state) -> str:
+    """ETag of a shared cached response personalized with the viewer's state."""
+    if not viewer_state:
+        return etag
+    payload = json.dumps([etag, viewer_state], sort_keys=True, default=str).encode()
+    return f'"{hashlib.md5(payload).hexdigest()}"'
+
+
+def invalidate_recipe_detail(recipe_ids) -> None:
+    """Drops cached detail responses for the given recipes."""
+    cache.delete_many([recipe_detail_cache_key(recipe_id) for recipe_id in recipe_ids])
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from apps.recipes.recommendations import refresh_recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the stored 'recommended for you' recipes from recipe ratings. "
+        "By default only users whose ratings changed since the last run are refreshed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top-n", type=int, default=20, help="Recommendations stored per user.")
+        parser.add_argument("--full", action="store_true", help="Recompute every user.")
+
+    def handle(self, *args, **options):
+        refreshed = refresh_recommendations(n=options["top_n"], full=options["full"])
+        self.stdout.write(self.style.SUCCESS(f"Refreshed recommendations for {refreshed} users"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from apps.recipes.similarity import METRICS, refresh_similar_recipes
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the stored 'similar recipes' from ingredient overlap. "
+        "By default only recipes affected by ingredient changes since the last run are refreshed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top-k", type=int, default=10, help="Neighbours stored per recipe.")
+        parser.add_argument("--metric", choices=METRICS, default="jaccard")
+        parser.add_argument("--full", action="store_true", help="Recompute every recipe.")
+
+    def handle(self, *args, **options):
+        refreshed = refresh_similar_recipes(k=options["top_k"], metric=options["metric"], full=options["full"])
+        self.stdout.write(self.style.SUCCESS(f"Refreshed similar recipes for {refreshed} recipes"))
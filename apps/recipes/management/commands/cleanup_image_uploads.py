@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.recipes.models import RecipeImageUpload
+from apps.recipes.uploads import delete_upload
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes image uploads that were not finished, or finished but not attached to a recipe, "
+        "within RECIPE_IMAGE_UPLOAD_EXPIRY_HOURS, with their partial files and stored images. Run it periodically."
+    )
+
+    def handle(self, *args, **options):
+        expired_before = timezone.now() - timedelta(hours=settings.RECIPE_IMAGE_UPLOAD_EXPIRY_HOURS)
+        uploads = RecipeImageUpload.objects.filter(
+            status__in=[RecipeImageUpload.Status.PENDING, RecipeImageUpload.Status.COMPLETE],
+            updated_at__lt=expired_before,
+        )
+        deleted = 0
+        for upload in uploads.iterator():
+            delete_upload(upload)
+            deleted += 1
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} expired image uploads"))
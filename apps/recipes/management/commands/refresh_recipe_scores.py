@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from apps.recipes.services import refresh_bayesian_scores
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the global mean rating and the Bayesian score of all recipes. "
+        "Rating changes update their recipe right away; run this periodically as the global mean drifts."
+    )
+
+    def handle(self, *args, **options):
+        updated = refresh_bayesian_scores()
+        self.stdout.write(self.style.SUCCESS(f"Updated the Bayesian score of {updated} recipes"))
@@ -0,0 +1,56 @@
+"""
+"Cook with what I have": ranks recipes by how well a set of available ingredients covers them.
+
+Every recipe stores its sorted, distinct ingredient ids in the GIN indexed `ingredient_ids`
+array, which serves as the inverted index from ingredients to recipes: one overlap query
+returns only the recipes using at least one available ingredient. The candidates are then
+scored together with numpy instead of recipe by recipe. The ranking is cached per ingredient
+set for RECIPE_MATCH_CACHE_SECONDS, so paging through it does not rank again.
+"""
+
+import hashlib
+from itertools import chain
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Recipe
+
+
+def match_recipes(available_ids, max_missing=None):
+    """
+    Returns (recipe id, matched count, missing count) for every recipe using at least one of
+    the available ingredients, best first: highest share of the recipe's ingredients available,
+    then fewest ingredients missing, then newest recipe.
+    """
+    available = np.unique(np.asarray(list(available_ids), dtype=np.int64))
+    rows = list(Recipe.objects.filter(ingredient_ids__overlap=available.tolist()).values_list("id", "ingredient_ids"))
+    if not rows:
+        return []
+
+    recipe_ids = np.fromiter((recipe_id for recipe_id, _ in rows), dtype=np.int64, count=len(rows))
+    sizes = np.fromiter((len(ids) for _, ids in rows), dtype=np.int64, count=len(rows))
+    flat = np.fromiter(chain.from_iterable(ids for _, ids in rows), dtype=np.int64, count=int(sizes.sum()))
+
+    # Candidates share at least one ingredient, so every recipe has a non-empty segment
+    hits = np.isin(flat, available, assume_unique=True).astype(np.int64)
+    matched = np.add.reduceat(hits, np.concatenate(([0], np.cumsum(sizes)[:-1])))
+    missing = sizes - matched
+    coverage = matched / sizes
+
+    order = np.lexsort((-recipe_ids, missing, -coverage))
+    if max_missing is not None:
+        order = order[missing[order] <= max_missing]
+    return list(zip(recipe_ids[order].tolist(), matched[order].tolist(), missing[order].tolist()))
+
+
+def cached_match_recipes(available_ids, max_missing=None):
+    """match_recipes, cached for RECIPE_MATCH_CACHE_SECONDS."""
+    available = ",".join(str(ingredient_id) for ingredient_id in sorted(set(available_ids)))
+    key = f"recipe-match:{hashlib.md5(available.encode()).hexdigest()}:{max_missing}"
+    matches = cache.get(key)
+    if matches is None:
+        matches = match_recipes(available_ids, max_missing)
+        cache.set(key, matches, settings.RECIPE_MATCH_CACHE_SECONDS)
+    return matches
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.20 on 2026-10-19 10:46
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0017_recipeimageupload"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RecipeNeighbour",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("rank", models.PositiveSmallIntegerField()),
+                ("score", models.FloatField()),
+            ],
+            options={
+                "ordering": ["recipe", "rank"],
+            },
+        ),
+        migrations.AddField(
+            model_name="recipe",
+            name="neighbours_stale",
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                condition=models.Q(("neighbours_stale", True)),
+                fields=["neighbours_stale"],
+                name="recipe_neighbours_stale_idx",
+            ),
+        ),
+        migrations.AddField(
+            model_name="recipeneighbour",
+            name="neighbour",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to="recipes.recipe",
+            ),
+        ),
+        migrations.AddField(
+            model_name="recipeneighbour",
+            name="recipe",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="neighbours",
+                to="recipes.recipe",
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="recipeneighbour",
+            unique_together={("recipe", "rank")},
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.20 on 2026-10-19 10:48
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+BACKFILL_INGREDIENT_IDS = """
+UPDATE recipes_recipe AS recipe
+SET ingredient_ids = COALESCE(
+    (
+        SELECT ARRAY_AGG(DISTINCT recipe_ingredient.ingredient_id ORDER BY recipe_ingredient.ingredient_id)
+        FROM recipes_recipeingredient AS recipe_ingredient
+        WHERE recipe_ingredient.recipe_id = recipe.id
+    ),
+    '{}'
+)
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0018_recipe_neighbours"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="ingredient_ids",
+            field=django.contrib.postgres.fields.ArrayField(
+                base_field=models.BigIntegerField(), blank=True, default=list, size=None
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=django.contrib.postgres.indexes.GinIndex(fields=["ingredient_ids"], name="recipe_ingredient_ids_gin"),
+        ),
+        migrations.RunSQL(BACKFILL_INGREDIENT_IDS, reverse_sql=migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.20 on 2026-10-19 10:53
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Avg, ExpressionWrapper, F, FloatField, Value
+
+
+def compute_bayesian_scores(apps, schema_editor):
+    Recipe = apps.get_model("recipes", "Recipe")
+    RecipeRating = apps.get_model("recipes", "RecipeRating")
+    db_alias = schema_editor.connection.alias
+    mean = RecipeRating.objects.using(db_alias).aggregate(average=Avg("rating"))["average"] or 0.0
+    weight = settings.RECIPE_RATING_PRIOR_WEIGHT
+    Recipe.objects.using(db_alias).update(
+        bayesian_score=ExpressionWrapper(
+            (Value(weight * mean) + F("average_rating") * F("rating_count")) / (Value(weight) + F("rating_count")),
+            output_field=FloatField(),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0020_recipe_recommendations"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipe",
+            name="bayesian_score",
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                condition=models.Q(("rating_count__gt", 0)),
+                fields=["-bayesian_score", "-id"],
+                name="recipe_bayesian_score_idx",
+            ),
+        ),
+        migrations.RunPython(compute_bayesian_scores, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.20 on 2026-10-19 10:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0021_recipe_bayesian_score"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="recipe",
+            index=models.Index(
+                fields=["author", "-created_on", "-id"],
+                name="recipe_author_created_idx",
+            ),
+        ),
+    ]
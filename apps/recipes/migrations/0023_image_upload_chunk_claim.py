@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-19 11:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipes", "0022_recipe_author_created_idx"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="recipeimageupload",
+            name="chunk_claimed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
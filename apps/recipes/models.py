@@ -1,6 +1,11 @@
+import uuid
+
 from django.contrib.auth.models import User
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils.translation import gettext_lazy as _
 
 
 class Recipe(models.Model):
@@ -14,9 +19,28 @@ class Recipe(models.Model):
     ingredients = models.ManyToManyField("ingredients.Ingredient", through="RecipeIngredient", related_name="recipes")
     average_rating = models.FloatField(default=0.0)  # Stored as 0-10 scale
     rating_count = models.PositiveIntegerField(default=0)
+    # Average shrunk towards the global mean for recipes with few ratings, 0-10 scale (see services.py)
+    bayesian_score = models.FloatField(default=0.0)
+    neighbours_stale = models.BooleanField(default=True)  # Similar recipes need recomputing
+    # Sorted distinct ingredient ids, denormalized from RecipeIngredient for set matching
+    ingredient_ids = ArrayField(models.BigIntegerField(), default=list, blank=True)
 
     class Meta:
         ordering = ["-created_on"]
+        indexes = [
+            models.Index(
+                fields=["neighbours_stale"],
+                name="recipe_neighbours_stale_idx",
+                condition=models.Q(neighbours_stale=True),
+            ),
+            GinIndex(fields=["ingredient_ids"], name="recipe_ingredient_ids_gin"),
+            models.Index(fields=["author", "-created_on", "-id"], name="recipe_author_created_idx"),
+            models.Index(
+                fields=["-bayesian_score", "-id"],
+                name="recipe_bayesian_score_idx",
+                condition=models.Q(rating_count__gt=0),
+            ),
+        ]
 
     def __str__(self):
         return self.title
@@ -42,3 +66,78 @@ class RecipeRating(models.Model):
 
     def __str__(self):
         return f"{self.author.username} - {self.recipe.title} - {self.rating}"
+
+
+class RecipeNeighbour(models.Model):
+    """A precomputed similar recipe, ranked by ingredient overlap (see similarity.py)."""
+
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name="neighbours")
+    neighbour = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name="+")
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ["recipe", "rank"]
+        unique_together = ("recipe", "rank")
+
+    def __str__(self):
+        return f"{self.recipe_id} ~ {self.neighbour_id} (#{self.rank}, {self.score:.2f})"
+
+
+class RecipeRecommendation(models.Model):
+    """A precomputed "recommended for you" recipe, ranked by predicted rating (see recommendations.py)."""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="recipe_recommendations")
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name="+")
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()  # Predicted rating, 0-10 scale
+
+    class Meta:
+        ordering = ["user", "rank"]
+        unique_together = ("user", "rank")
+
+    def __str__(self):
+        return f"{self.user_id} -> {self.recipe_id} (#{self.rank}, {self.score:.2f})"
+
+
+class RecommendationState(models.Model):
+    """When a user's recommendations were last computed; ratings updated since make them stale."""
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="recommendation_state")
+    computed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.user_id} @ {self.computed_at}"
+
+
+class RecipeImageUpload(models.Model):
+    """
+    A chunked, resumable upload of a recipe image.
+    Chunks are streamed to storage as they arrive; once complete, the upload is
+    attached to a recipe by passing its token to the recipe endpoint.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "pending", _("Pending")
+        COMPLETE = "complete", _("Complete")
+        ATTACHED = "attached", _("Attached")
+
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="recipe_image_uploads")
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    total_size = models.PositiveBigIntegerField()
+    received_size = models.PositiveBigIntegerField(default=0)
+    chunk_count = models.PositiveIntegerField(default=0)
+    storage_name = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    # Set while a request writes a chunk, so chunks are written one at a time without holding a row lock
+    chunk_claimed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.filename} ({self.received_size}/{self.total_size} bytes, {self.status})"
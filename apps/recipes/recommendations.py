@@ -0,0 +1,140 @@
+"""
+Batch "recommended for you" recipes, from collaborative filtering on recipe ratings.
+
+The ratings form a sparse user x recipe matrix. An item-item neighbour model is fitted on it:
+two recipes are similar when the same users rate them above or below their own average
+(adjusted cosine, shrunk towards zero for pairs with few common raters). A user's predicted
+rating of an unseen recipe is their average plus the similarity weighted deviation of their
+ratings of similar recipes. The top-N predictions per user are stored in RecipeRecommendation,
+so serving them is a single indexed lookup.
+"""
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from scipy import sparse
+
+from .models import Recipe, RecipeRating, RecipeRecommendation, RecommendationState
+from .similarity import top_k
+
+USER_BATCH_SIZE = 500
+
+
+def build_rating_matrix():
+    """Returns (sorted user ids, sorted recipe ids, sparse user x recipe CSR matrix of ratings)."""
+    rows = np.array(list(RecipeRating.objects.values_list("author_id", "recipe_id", "rating")), dtype=np.int64)
+    rows = rows.reshape(-1, 3)
+    user_ids, users = np.unique(rows[:, 0], return_inverse=True)
+    recipe_ids, recipes = np.unique(rows[:, 1], return_inverse=True)
+    ratings = sparse.csr_matrix(
+        (rows[:, 2].astype(np.float64), (users, recipes)), shape=(len(user_ids), len(recipe_ids))
+    )
+    return user_ids, recipe_ids, ratings
+
+
+def center_ratings(ratings):
+    """Returns (per user average rating, ratings minus the user's average as a CSR matrix)."""
+    counts = np.diff(ratings.indptr)
+    means = np.asarray(ratings.sum(axis=1)).ravel() / np.maximum(counts, 1)
+    centered = ratings.copy()
+    centered.data -= np.repeat(means, counts)
+    return means, centered
+
+
+def item_similarities(centered, rated, shrinkage=5):
+    """Adjusted cosine similarity between all rated recipes, as a sparse recipe x recipe CSR matrix."""
+    norms = np.sqrt(np.asarray(centered.multiply(centered).sum(axis=0)).ravel())
+    inverse_norms = sparse.diags(np.divide(1, norms, out=np.zeros_like(norms), where=norms > 0))
+    similarities = inverse_norms @ (centered.T @ centered) @ inverse_norms
+
+    common = (rated.T @ rated).tocsr()
+    common.data = common.data / (common.data + shrinkage)
+    similarities = sparse.csr_matrix(similarities.multiply(common))
+    similarities.setdiag(0)
+    similarities.eliminate_zeros()
+    return similarities
+
+
+def predict(rows, means, centered, rated, similarities):
+    """
+    Predicted ratings of the given user rows for recipes they have not rated, as a sparse COO
+    matrix. Only recipes predicted above the user's own average rating get an entry.
+    """
+    deviations = (centered[rows] @ similarities).tocsr()
+    weights = (rated[rows] @ abs(similarities)).tocsr()
+    deviations = deviations - deviations.multiply(rated[rows])  # Drop recipes already rated
+    deviations = deviations.tocoo()
+
+    weight = np.asarray(weights[deviations.row, deviations.col]).ravel()
+    positive = (deviations.data > 0) & (weight > 0)
+    row, col = deviations.row[positive], deviations.col[positive]
+    scores = np.clip(means[rows][row] + deviations.data[positive] / weight[positive], 0, 10)
+    return sparse.coo_matrix((scores, (row, col)), shape=(len(rows), rated.shape[1]))
+
+
+def stale_user_ids():
+    """Users who rated since their recommendations were computed, or whose ratings were removed."""
+    return set(
+        User.objects.filter(
+            Q(reciperating__updated_on__gt=F("recommendation_state__computed_at"))
+            | (
+                Q(recommendation_state__isnull=True)
+                & (Q(reciperating__isnull=False) | Q(recipe_recommendations__isnull=False))
+            )
+        ).values_list("id", flat=True)
+    )
+
+
+def refresh_recommendations(n=20, full=False):
+    """
+    Recomputes stored recommendations, for all users with ratings or only for the users whose
+    ratings changed since the last run. Returns the number of users refreshed.
+    """
+    started = timezone.now()
+    if full:
+        target_ids = set(RecipeRating.objects.values_list("author_id", flat=True))
+        target_ids |= set(RecipeRecommendation.objects.values_list("user_id", flat=True))
+    else:
+        target_ids = stale_user_ids()
+    if not target_ids:
+        return 0
+
+    user_ids, recipe_ids, ratings = build_rating_matrix()
+    means, centered = center_ratings(ratings)
+    rated = ratings.copy()
+    rated.data = np.ones_like(rated.data)
+    similarities = item_similarities(centered, rated)
+
+    recipe_authors = dict(Recipe.objects.filter(id__in=recipe_ids.tolist()).values_list("id", "author_id"))
+    authors = np.array([recipe_authors.get(recipe_id, 0) for recipe_id in recipe_ids.tolist()], dtype=np.int64)
+
+    target_rows = np.flatnonzero(np.isin(user_ids, list(target_ids)))
+    recommendations = []
+    for start in range(0, len(target_rows), USER_BATCH_SIZE):
+        rows = target_rows[start : start + USER_BATCH_SIZE]
+        predictions = predict(rows, means, centered, rated, similarities)
+        not_own = authors[predictions.col] != user_ids[rows][predictions.row]
+        predictions = sparse.coo_matrix(
+            (predictions.data[not_own], (predictions.row[not_own], predictions.col[not_own])), shape=predictions.shape
+        )
+        batch_rows, columns, scores, ranks = top_k(predictions, n)
+        recommendations.extend(
+            RecipeRecommendation(user_id=user_id, recipe_id=recipe_id, score=score, rank=rank)
+            for user_id, recipe_id, score, rank in zip(
+                user_ids[rows][batch_rows].tolist(), recipe_ids[columns].tolist(), scores.tolist(), ranks.tolist()
+            )
+        )
+
+    # Ratings written while computing are newer than `started`, so the next run picks them up
+    with transaction.atomic():
+        RecipeRecommendation.objects.filter(user_id__in=target_ids).delete()
+        RecipeRecommendation.objects.bulk_create(recommendations, batch_size=5000)
+        RecommendationState.objects.bulk_create(
+            [RecommendationState(user_id=user_id, computed_at=started) for user_id in target_ids],
+            update_conflicts=True,
+            unique_fields=["user"],
+            update_fields=["computed_at"],
+        )
+    return len(target_ids)
@@ -1,13 +1,16 @@
 import json
 import nh3
 
+from django.conf import settings
 from django.utils.text import slugify
 from rest_framework import serializers
 
 from apps.ingredients.models import IngredientUnit
+from apps.ingredients.nutrition import NutrientMatrixUnavailable, nutrition_for_items
 from apps.ingredients.serializers import IngredientSerializer, IngredientUnitSerializer
 
-from .models import Recipe, RecipeIngredient, RecipeRating
+from .models import Recipe, RecipeImageUpload, RecipeIngredient, RecipeRating
+from .services import recipe_ingredients_changed
 
 
 class RecipeIngredientSerializer(serializers.ModelSerializer):
@@ -35,6 +38,10 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
 class SimpleRecipeSerializer(serializers.ModelSerializer):
     author_username = serializers.CharField(source="author.username", read_only=True)
     average_rating = serializers.SerializerMethodField()
+    # Viewer state, only known when the queryset was annotated with services.viewer_annotations
+    my_rating = serializers.SerializerMethodField()
+    in_my_lists = serializers.SerializerMethodField()
+    follows_author = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -47,12 +54,24 @@ class SimpleRecipeSerializer(serializers.ModelSerializer):
             "image",
             "average_rating",
             "rating_count",
+            "my_rating",
+            "in_my_lists",
+            "follows_author",
         ]
         read_only_fields = ["slug", "author_username", "created_on"]
 
     def get_average_rating(self, obj):
         return obj.average_rating / 2 if obj.average_rating is not None else None
 
+    def get_my_rating(self, obj):
+        return getattr(obj, "my_rating", None)
+
+    def get_in_my_lists(self, obj):
+        return getattr(obj, "in_my_lists", None)
+
+    def get_follows_author(self, obj):
+        return getattr(obj, "follows_author", None)
+
 
 class SanitizedHtmlField(serializers.CharField):
     def to_internal_value(self, data):
@@ -62,6 +81,12 @@ class SanitizedHtmlField(serializers.CharField):
 
 class RecipeDetailSerializer(serializers.ModelSerializer):
     remove_image = serializers.BooleanField(required=False)
+    image_upload = serializers.SlugRelatedField(
+        slug_field="token",
+        queryset=RecipeImageUpload.objects.filter(status=RecipeImageUpload.Status.COMPLETE),
+        write_only=True,
+        required=False,
+    )
     author_username = serializers.CharField(source="author.username", read_only=True)
     recipe_ingredients = RecipeIngredientSerializer(
         many=True,
@@ -70,6 +95,7 @@ class RecipeDetailSerializer(serializers.ModelSerializer):
     )
     content = SanitizedHtmlField()
     average_rating = serializers.SerializerMethodField()
+    nutrition = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -85,20 +111,39 @@ class RecipeDetailSerializer(serializers.ModelSerializer):
             "recipe_ingredients",
             "average_rating",
             "rating_count",
+            "nutrition",
             "remove_image",
+            "image_upload",
         ]
         read_only_fields = ["slug", "author_username", "created_on", "updated_on"]
 
     def get_average_rating(self, obj):
         return obj.average_rating / 2 if obj.average_rating is not None else None
 
+    def get_nutrition(self, obj):
+        """Nutrients per serving (see the nutrition action for other guest counts), or None before the first build."""
+        try:
+            return nutrition_for_items(obj.recipeingredient_set.select_related("ingredient", "unit"))
+        except NutrientMatrixUnavailable:
+            return None
+
+    def validate_image_upload(self, value):
+        request = self.context.get("request")
+        if request is None or value.user_id != request.user.id:
+            raise serializers.ValidationError("Unknown image upload.")
+        return value
+
     def validate(self, data):
         # Parse and validate recipe_ingredients from initial_data (because data doesn't have it)
-        # This is due to having a multipart/form-data request for the image upload
+        # Multipart/form-data requests (legacy image upload) send it as a JSON string,
+        # JSON requests send the list itself
         ingredients_raw = self.initial_data.get("recipe_ingredients")
         if ingredients_raw:
             try:
-                ingredients_list = json.loads(ingredients_raw)
+                if isinstance(ingredients_raw, str):
+                    ingredients_list = json.loads(ingredients_raw)
+                else:
+                    ingredients_list = ingredients_raw
                 ingredient_serializer = RecipeIngredientSerializer(
                     data=ingredients_list, many=True, context=self.context
                 )
@@ -117,29 +162,79 @@ class RecipeDetailSerializer(serializers.ModelSerializer):
             validated_data["author"] = self.context["request"].user
         return validated_data
 
+    def _attach_image_upload(self, validated_data):
+        """Helper to swap a completed chunked upload for its stored image name."""
+        upload = validated_data.pop("image_upload", None)
+        if upload is not None:
+            validated_data["image"] = upload.storage_name
+        return upload
+
+    def _mark_upload_attached(self, upload):
+        if upload is not None:
+            upload.status = RecipeImageUpload.Status.ATTACHED
+            upload.save(update_fields=["status", "updated_at"])
+
     def create(self, validated_data):
         validated_data.pop("remove_image", None)
+        upload = self._attach_image_upload(validated_data)
         ingredients = validated_data.pop("recipeingredient_set", [])
         validated_data = self._set_author_and_slug(validated_data)
         recipe = Recipe.objects.create(**validated_data)
         for item in ingredients:
             RecipeIngredient.objects.create(recipe=recipe, **item)
+        if ingredients:
+            recipe_ingredients_changed([recipe.id])
+        self._mark_upload_attached(upload)
         return recipe
 
     def update(self, instance, validated_data):
         remove_image = validated_data.pop("remove_image", False)
-        if remove_image and instance.image:
+        upload = self._attach_image_upload(validated_data)
+        if (remove_image or upload is not None) and instance.image:
             instance.image.delete(save=False)
-            validated_data["image"] = None
+            if upload is None:
+                validated_data["image"] = None
         ingredients = validated_data.pop("recipeingredient_set", None)
         instance = super().update(instance, validated_data)
         if ingredients is not None:
             instance.recipeingredient_set.all().delete()
             for item in ingredients:
                 RecipeIngredient.objects.create(recipe=instance, **item)
+            recipe_ingredients_changed([instance.id])
+        self._mark_upload_attached(upload)
         return instance
 
 
+class RecipeImageUploadSerializer(serializers.ModelSerializer):
+    """Serializer for starting a chunked image upload and reporting its progress."""
+
+    ALLOWED_CONTENT_TYPES = ["image/jpeg", "image/png", "image/gif", "image/webp"]
+
+    class Meta:
+        model = RecipeImageUpload
+        fields = [
+            "token",
+            "filename",
+            "content_type",
+            "total_size",
+            "received_size",
+            "status",
+            "created_at",
+        ]
+        read_only_fields = ["token", "received_size", "status", "created_at"]
+
+    def validate_content_type(self, value):
+        if value not in self.ALLOWED_CONTENT_TYPES:
+            raise serializers.ValidationError(f"Unsupported image type '{value}'.")
+        return value
+
+    def validate_total_size(self, value):
+        max_size = settings.RECIPE_IMAGE_UPLOAD_MAX_SIZE
+        if value <= 0 or value > max_size:
+            raise serializers.ValidationError(f"Image size must be between 1 and {max_size} bytes.")
+        return value
+
+
 class RecipeRatingSerializer(serializers.ModelSerializer):
     author_username = serializers.CharField(source="author.username", read_only=True)
     # TODO check why using username instead of id
@@ -1,14 +1,115 @@
-from django.db.models import Avg, Count
-from .models import Recipe, RecipeRating
+from django.conf import settings
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.contrib.postgres.fields import ArrayField
+from django.core.cache import cache
+from django.db.models import (
+    Avg,
+    BigIntegerField,
+    Count,
+    Exists,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    OuterRef,
+    Subquery,
+    Value,
+)
+from django.db.models.functions import Coalesce
+from apps.core.models import Follow
+from apps.groceries.models import PlannedRecipe
+
+from .cache import invalidate_recipe_detail
+from .models import Recipe, RecipeIngredient, RecipeRating, RecommendationState
+
+GLOBAL_MEAN_RATING_CACHE_KEY = "recipe-rating-global-mean"
+
+
+def get_global_mean_rating(refresh=False) -> float:
+    """Average of all ratings (0-10 scale). Cached, as it drifts slowly and costs a full scan."""
+    mean = None if refresh else cache.get(GLOBAL_MEAN_RATING_CACHE_KEY)
+    if mean is None:
+        mean = RecipeRating.objects.aggregate(average=Avg("rating"))["average"] or 0.0
+        cache.set(GLOBAL_MEAN_RATING_CACHE_KEY, mean, settings.RECIPE_RATING_MEAN_CACHE_TIMEOUT)
+    return mean
+
+
+def bayesian_score_expression(mean):
+    """SQL expression of the Bayesian score of a recipe, see bayesian_score."""
+    weight = settings.RECIPE_RATING_PRIOR_WEIGHT
+    return ExpressionWrapper(
+        (Value(weight * mean) + F("average_rating") * F("rating_count")) / (Value(weight) + F("rating_count")),
+        output_field=FloatField(),
+    )
+
+
+def bayesian_score(average, count, mean) -> float:
+    """
+    Recipe average rating shrunk towards the global mean, as if every recipe also had
+    RECIPE_RATING_PRIOR_WEIGHT ratings at the mean. A single 10/10 vote no longer
+    outranks a recipe with hundreds of good ratings.
+    """
+    weight = settings.RECIPE_RATING_PRIOR_WEIGHT
+    return (weight * mean + average * count) / (weight + count)
 
 
 def update_recipe_ratings(recipe: Recipe):
     """
-    Calculates the average rating and count for a given recipe
+    Calculates the average rating, count and Bayesian score for a given recipe
     and updates its fields.
     """
     result = RecipeRating.objects.filter(recipe=recipe).aggregate(average=Avg("rating"), count=Count("id"))
 
     recipe.average_rating = result["average"] if result["average"] is not None else 0.0
     recipe.rating_count = result["count"]
-    recipe.save(update_fields=["average_rating", "rating_count"])
+    recipe.bayesian_score = bayesian_score(recipe.average_rating, recipe.rating_count, get_global_mean_rating())
+    recipe.save(update_fields=["average_rating", "rating_count", "bayesian_score"])
+    invalidate_recipe_detail([recipe.id])
+
+
+def recipe_ingredients_changed(recipe_ids):
+    """
+    Refreshes the denormalized ingredient ids of recipes whose ingredient set changed,
+    and flags them so derived data (similar recipes) is recomputed for them.
+    """
+    ingredient_ids = (
+        RecipeIngredient.objects.filter(recipe=OuterRef("pk"))
+        .values("recipe")
+        .annotate(ids=ArrayAgg("ingredient_id", distinct=True, ordering="ingredient_id"))
+        .values("ids")
+    )
+    Recipe.objects.filter(id__in=recipe_ids).update(
+        neighbours_stale=True,
+        ingredient_ids=Coalesce(Subquery(ingredient_ids), Value([], output_field=ArrayField(BigIntegerField()))),
+    )
+
+
+def user_ratings_removed(user_ids):
+    """
+    Marks the recommendations of users who deleted a rating as stale. New and updated
+    ratings are detected from their timestamps, deletions leave nothing to compare.
+    """
+    RecommendationState.objects.filter(user_id__in=user_ids).delete()
+
+
+def refresh_bayesian_scores() -> int:
+    """
+    Recomputes the global mean rating and the Bayesian score of every recipe whose score
+    drifted from it, in one UPDATE. Returns the number of recipes updated.
+    """
+    score = bayesian_score_expression(get_global_mean_rating(refresh=True))
+    return Recipe.objects.exclude(bayesian_score=score).update(bayesian_score=score)
+
+
+def viewer_annotations(user) -> dict:
+    """
+    Per-recipe annotations of the viewer's own state, evaluated as subqueries in the recipe query:
+    their rating (0-10, None if not rated), whether the recipe is planned in one of their grocery lists,
+    and whether they follow its author. Empty for anonymous users.
+    """
+    if not user.is_authenticated:
+        return {}
+    return {
+        "my_rating": Subquery(RecipeRating.objects.filter(recipe=OuterRef("pk"), author=user).values("rating")[:1]),
+        "in_my_lists": Exists(PlannedRecipe.objects.filter(recipe=OuterRef("pk"), grocery_list__user=user)),
+        "follows_author": Exists(Follow.objects.filter(follower=user, followed=OuterRef("author"))),
+    }
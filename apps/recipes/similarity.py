@@ -0,0 +1,144 @@
+"""
+Offline computation of "similar recipes" from ingredient overlap.
+
+Recipes are rows of a sparse binary recipe x ingredient matrix; the similarity of two
+recipes is the cosine or Jaccard index of their ingredient sets, computed for many recipes
+at once with a sparse matrix product, SIMILARITY_BLOCK_SIZE recipes at a time so memory stays
+bounded however many recipes there are. The top-k neighbours of each recipe are stored in
+RecipeNeighbour so serving them is a single indexed lookup.
+"""
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, Min
+from scipy import sparse
+
+from .models import Recipe, RecipeIngredient, RecipeNeighbour
+
+METRICS = ["jaccard", "cosine"]
+SIMILARITY_BLOCK_SIZE = 1000  # Rows multiplied against the whole matrix at once
+
+
+def build_recipe_matrix():
+    """Returns (sorted recipe ids, sparse binary recipe x ingredient CSR matrix)."""
+    pairs = np.array(
+        list(RecipeIngredient.objects.values_list("recipe_id", "ingredient_id").distinct()), dtype=np.int64
+    ).reshape(-1, 2)
+    recipe_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+    ingredient_ids, columns = np.unique(pairs[:, 1], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.float32), (rows, columns)), shape=(len(recipe_ids), len(ingredient_ids))
+    )
+    return recipe_ids, matrix
+
+
+def rows_of(recipe_ids, ids):
+    """Matrix rows of the given recipe ids, skipping recipes without ingredients."""
+    ids = np.unique(np.asarray(list(ids), dtype=np.int64))
+    if not len(recipe_ids) or not len(ids):
+        return np.array([], dtype=np.int64)
+    positions = np.minimum(np.searchsorted(recipe_ids, ids), len(recipe_ids) - 1)
+    return positions[recipe_ids[positions] == ids]
+
+
+def similarity_rows(matrix, rows, metric="jaccard"):
+    """
+    Similarity of the given matrix rows against all rows, as a sparse (len(rows) x n) COO matrix.
+    Only recipes sharing at least one ingredient get an entry; self-similarity is dropped.
+    """
+    sizes = np.asarray(matrix.sum(axis=1)).ravel()
+    shared = (matrix[rows] @ matrix.T).tocoo()  # Number of shared ingredients
+    row_sizes = sizes[rows][shared.row]
+    column_sizes = sizes[shared.col]
+    if metric == "cosine":
+        scores = shared.data / np.sqrt(row_sizes * column_sizes)
+    else:
+        scores = shared.data / (row_sizes + column_sizes - shared.data)
+
+    not_self = np.asarray(rows)[shared.row] != shared.col
+    return sparse.coo_matrix(
+        (scores[not_self], (shared.row[not_self], shared.col[not_self])), shape=(len(rows), matrix.shape[0])
+    )
+
+
+def row_blocks(rows):
+    """Splits matrix rows into blocks of SIMILARITY_BLOCK_SIZE."""
+    for start in range(0, len(rows), SIMILARITY_BLOCK_SIZE):
+        yield rows[start : start + SIMILARITY_BLOCK_SIZE]
+
+
+def top_k(similarities, k):
+    """Returns (row, column, score, rank) arrays of the k best entries of every row."""
+    order = np.lexsort((similarities.col, -similarities.data, similarities.row))
+    rows, columns, scores = similarities.row[order], similarities.col[order], similarities.data[order]
+    row_starts = np.searchsorted(rows, rows, side="left")
+    ranks = np.arange(len(rows)) - row_starts
+    keep = ranks < k
+    return rows[keep], columns[keep], scores[keep], ranks[keep]
+
+
+def _affected_by(stale_rows, recipe_ids, matrix, k, metric):
+    """
+    Recipes whose stored neighbour list may change because the stale recipes changed:
+    those currently listing a stale recipe, and those that now score a stale recipe
+    above their current k-th neighbour (or have fewer than k neighbours).
+    """
+    stale_ids = recipe_ids[stale_rows].tolist()
+    affected = set(RecipeNeighbour.objects.filter(neighbour_id__in=stale_ids).values_list("recipe_id", flat=True))
+
+    thresholds = {
+        row["recipe_id"]: row["lowest"] if row["count"] >= k else 0.0
+        for row in RecipeNeighbour.objects.values("recipe_id").annotate(lowest=Min("score"), count=Count("id"))
+    }
+    # Similarity is symmetric, so the stale rows also give each recipe's score for the stale recipes
+    for block in row_blocks(stale_rows):
+        similarities = similarity_rows(matrix, block, metric)
+        candidate_ids = recipe_ids[similarities.col]
+        lowest = np.array([thresholds.get(recipe_id, 0.0) for recipe_id in candidate_ids.tolist()])
+        affected.update(candidate_ids[similarities.data >= lowest].tolist())
+    return affected
+
+
+def refresh_similar_recipes(k=10, metric="jaccard", full=False):
+    """
+    Recomputes stored neighbours, for all recipes or only for the recipes affected by
+    ingredient changes since the last run. Returns the number of recipes refreshed.
+    """
+    if full:
+        stale_ids = list(Recipe.objects.values_list("id", flat=True))
+    else:
+        stale_ids = list(Recipe.objects.filter(neighbours_stale=True).values_list("id", flat=True))
+    if not stale_ids:
+        return 0
+
+    # Clear the flags first, so edits made while computing are picked up by the next run
+    Recipe.objects.filter(id__in=stale_ids).update(neighbours_stale=False)
+    try:
+        recipe_ids, matrix = build_recipe_matrix()
+        stale_rows = rows_of(recipe_ids, stale_ids)
+
+        target_ids = set(stale_ids)
+        if not full and len(stale_rows):
+            target_ids |= _affected_by(stale_rows, recipe_ids, matrix, k, metric)
+        target_rows = rows_of(recipe_ids, target_ids)
+
+        neighbours = []
+        for block in row_blocks(target_rows):
+            rows, columns, scores, ranks = top_k(similarity_rows(matrix, block, metric), k)
+            neighbours.extend(
+                RecipeNeighbour(recipe_id=recipe_id, neighbour_id=neighbour_id, score=score, rank=rank)
+                for recipe_id, neighbour_id, score, rank in zip(
+                    recipe_ids[block][rows].tolist(),
+                    recipe_ids[columns].tolist(),
+                    scores.tolist(),
+                    ranks.tolist(),
+                )
+            )
+
+        with transaction.atomic():
+            RecipeNeighbour.objects.filter(recipe_id__in=target_ids).delete()
+            RecipeNeighbour.objects.bulk_create(neighbours, batch_size=5000)
+    except Exception:
+        Recipe.objects.filter(id__in=stale_ids).update(neighbours_stale=True)
+        raise
+    return len(target_ids)
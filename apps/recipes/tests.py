@@ -1,3 +1,497 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from apps.core.models import Follow
+from apps.ingredients.models import Ingredient, IngredientUnit
+
+from .matching import cached_match_recipes, match_recipes
+from .models import Recipe, RecipeImageUpload, RecipeIngredient, RecipeNeighbour, RecipeRating, RecipeRecommendation
+from .recommendations import predict, refresh_recommendations, stale_user_ids
+from .services import bayesian_score, recipe_ingredients_changed, refresh_bayesian_scores, update_recipe_ratings
+from .similarity import refresh_similar_recipes
+from .uploads import LocalChunkedUploadBackend
+
+User = get_user_model()
+
+
+class RecipeTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username="author", password="secret")
+        self.unit = IngredientUnit.objects.create(name="gram", grams=1)
+        self.ingredients = {
+            name: Ingredient.objects.create(name=name, fdc_id=index)
+            for index, name in enumerate(["onion", "carrot", "leek", "potato", "rice"])
+        }
+
+    def create_recipe(self, title, ingredient_names):
+        recipe = Recipe.objects.create(title=title, slug=title.lower(), author=self.author, content="Cook.")
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=self.ingredients[name], unit=self.unit, quantity=100)
+            for name in ingredient_names
+        )
+        recipe_ingredients_changed([recipe.id])
+        return recipe
+
+
+class SimilarityTests(RecipeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.soup = self.create_recipe("Soup", ["onion", "carrot", "leek"])
+        self.stew = self.create_recipe("Stew", ["onion", "carrot", "potato"])
+        self.pilaf = self.create_recipe("Pilaf", ["onion", "rice"])
+
+    def neighbours(self, recipe):
+        return [
+            (neighbour.neighbour_id, round(neighbour.score, 3))
+            for neighbour in RecipeNeighbour.objects.filter(recipe=recipe).order_by("rank")
+        ]
+
+    def test_jaccard_scores(self):
+        refresh_similar_recipes(k=10, full=True)
+
+        # Soup and stew share 2 of 4 ingredients, soup and pilaf 1 of 4
+        self.assertEqual(self.neighbours(self.soup), [(self.stew.id, 0.5), (self.pilaf.id, 0.25)])
+
+    def test_cosine_scores(self):
+        refresh_similar_recipes(k=1, metric="cosine", full=True)
+
+        self.assertEqual(self.neighbours(self.pilaf), [(self.soup.id, round(1 / 6**0.5, 3))])
+
+    def test_blocks_give_the_same_neighbours(self):
+        refresh_similar_recipes(k=10, full=True)
+        expected = {recipe.id: self.neighbours(recipe) for recipe in (self.soup, self.stew, self.pilaf)}
+
+        with mock.patch("apps.recipes.similarity.SIMILARITY_BLOCK_SIZE", 1):
+            refresh_similar_recipes(k=10, full=True)
+
+        self.assertEqual(
+            {recipe.id: self.neighbours(recipe) for recipe in (self.soup, self.stew, self.pilaf)}, expected
+        )
+
+    def test_only_stale_recipes_are_refreshed(self):
+        refresh_similar_recipes(k=10, full=True)
+        self.assertEqual(refresh_similar_recipes(k=10), 0)
+
+        RecipeIngredient.objects.create(
+            recipe=self.pilaf, ingredient=self.ingredients["leek"], unit=self.unit, quantity=1
+        )
+        recipe_ingredients_changed([self.pilaf.id])
+        refresh_similar_recipes(k=10)
+
+        self.assertEqual(self.neighbours(self.pilaf)[0], (self.soup.id, 0.5))
+
+
+class SimilarRecipesViewTests(APITestCase, RecipeTestCase):
+    def test_unknown_recipe(self):
+        self.assertEqual(self.client.get("/api/recipes/recipes/999999/similar/").status_code, 404)
+        self.assertEqual(self.client.get("/api/recipes/recipes/soup/similar/").status_code, 404)
+
+    def test_similar_recipes(self):
+        soup = self.create_recipe("Soup", ["onion", "carrot"])
+        stew = self.create_recipe("Stew", ["onion", "carrot", "potato"])
+        refresh_similar_recipes(full=True)
+
+        response = self.client.get(f"/api/recipes/recipes/{soup.id}/similar/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(row["id"], row["similarity"]) for row in response.data["results"]], [(stew.id, 0.667)])
+
+    def test_similar_recipes_carry_the_viewer_state(self):
+        soup = self.create_recipe("Soup", ["onion", "carrot"])
+        self.create_recipe("Stew", ["onion", "carrot", "potato"])
+        refresh_similar_recipes(full=True)
+        self.client.force_login(User.objects.create_user(username="reader", password="secret"))
+
+        row = self.client.get(f"/api/recipes/recipes/{soup.id}/similar/").data["results"][0]
+
+        self.assertEqual((row["my_rating"], row["in_my_lists"], row["follows_author"]), (None, False, False))
+
+
+class MatchingTests(RecipeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.soup = self.create_recipe("Soup", ["onion", "carrot", "leek"])
+        self.stew = self.create_recipe("Stew", ["onion", "carrot", "potato", "rice"])
+        self.pilaf = self.create_recipe("Pilaf", ["onion", "rice"])
+
+    def test_ranked_by_coverage_then_missing(self):
+        available = [self.ingredients["onion"].id, self.ingredients["carrot"].id, self.ingredients["rice"].id]
+
+        self.assertEqual(
+            match_recipes(available),
+            [(self.pilaf.id, 2, 0), (self.stew.id, 3, 1), (self.soup.id, 2, 1)],
+        )
+        self.assertEqual(match_recipes(available, max_missing=0), [(self.pilaf.id, 2, 0)])
+
+    def test_results_are_cached(self):
+        available = [self.ingredients["leek"].id]
+        self.assertEqual(cached_match_recipes(available), [(self.soup.id, 1, 2)])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(cached_match_recipes(available), [(self.soup.id, 1, 2)])
+
+
+class RecipeAdminTests(RecipeTestCase):
+    def test_inline_edits_sync_ingredient_ids(self):
+        admin = User.objects.create_superuser(username="admin", password="secret")
+        recipe = self.create_recipe("Soup", ["onion"])
+        Recipe.objects.filter(id=recipe.id).update(neighbours_stale=False)
+        line = recipe.recipeingredient_set.get()
+        self.client.force_login(admin)
+
+        response = self.client.post(
+            f"/admin/recipes/recipe/{recipe.id}/change/",
+            {
+                "title": recipe.title,
+                "slug": recipe.slug,
+                "author": self.author.id,
+                "content": recipe.content,
+                "average_rating": 0,
+                "rating_count": 0,
+                "bayesian_score": 0,
+                "recipeingredient_set-TOTAL_FORMS": 2,
+                "recipeingredient_set-INITIAL_FORMS": 1,
+                "recipeingredient_set-0-id": line.id,
+                "recipeingredient_set-0-recipe": recipe.id,
+                "recipeingredient_set-0-ingredient": line.ingredient_id,
+                "recipeingredient_set-0-unit": self.unit.id,
+                "recipeingredient_set-0-quantity": 100,
+                "recipeingredient_set-1-recipe": recipe.id,
+                "recipeingredient_set-1-ingredient": self.ingredients["leek"].id,
+                "recipeingredient_set-1-unit": self.unit.id,
+                "recipeingredient_set-1-quantity": 50,
+            },
+        )
+
+        self.assertEqual(response.status_code, 302)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.ingredient_ids, sorted([self.ingredients["onion"].id, self.ingredients["leek"].id]))
+        self.assertTrue(recipe.neighbours_stale)
+
+
+class RecipeDetailCacheTests(APITestCase, RecipeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.recipe = self.create_recipe("Soup", ["onion", "carrot"])
+        self.url = f"/api/recipes/recipes/{self.recipe.id}/"
+
+    def ingredient_names(self, response):
+        return sorted(line["ingredient"]["name"] for line in response.data["recipe_ingredients"])
+
+    def test_revalidation(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_catalog_changes_change_the_version_without_invalidation(self):
+        first = self.client.get(self.url)
+        onion = self.ingredients["onion"]
+        onion.name = "shallot"
+        onion.save()  # Saved directly, as another worker would, without dropping this worker's cache
+
+        second = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second["ETag"], first["ETag"])
+        self.assertEqual(self.ingredient_names(second), ["carrot", "shallot"])
+
+    def test_unit_changes_change_the_version(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.unit.grams = 2
+        self.unit.save()
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ImageUploadTests(APITestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_override = override_settings(
+            MEDIA_ROOT=os.path.join(directory, "media"),
+            FILE_UPLOAD_TEMP_DIR=directory,
+            DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage",
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(username="cook", password="secret")
+        self.client.force_login(self.user)
+
+    def image(self, image_format="PNG", size=(4, 3)):
+        output = io.BytesIO()
+        Image.new("RGB", size, "red").save(output, image_format)
+        return output.getvalue()
+
+    def upload(self, data, content_type="image/png"):
+        response = self.client.post(
+            "/api/recipes/uploads/",
+            {"filename": "soup.png", "content_type": content_type, "total_size": len(data)},
+            format="json",
+        )
+        token = response.data["token"]
+        return self.client.put(
+            f"/api/recipes/uploads/{token}/",
+            data,
+            content_type="application/octet-stream",
+            HTTP_CONTENT_RANGE=f"bytes 0-{len(data) - 1}/{len(data)}",
+        )
+
+    def test_valid_image_completes(self):
+        response = self.upload(self.image())
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["status"], RecipeImageUpload.Status.COMPLETE)
+
+    def put_chunk(self, token, data, start, total):
+        return self.client.put(
+            f"/api/recipes/uploads/{token}/",
+            data,
+            content_type="application/octet-stream",
+            HTTP_CONTENT_RANGE=f"bytes {start}-{start + len(data) - 1}/{total}",
+        )
+
+    def create_upload(self, data):
+        return self.client.post(
+            "/api/recipes/uploads/",
+            {"filename": "soup.png", "content_type": "image/png", "total_size": len(data)},
+            format="json",
+        ).data["token"]
+
+    def test_chunks(self):
+        data = self.image()
+        token = self.create_upload(data)
+
+        self.assertEqual(self.put_chunk(token, data[:20], 0, len(data)).data["received_size"], 20)
+        self.assertEqual(self.put_chunk(token, data[:20], 0, len(data)).status_code, 409)  # Already received
+        response = self.put_chunk(token, data[20:], 20, len(data))
+
+        self.assertEqual(response.data["status"], RecipeImageUpload.Status.COMPLETE)
+        upload = RecipeImageUpload.objects.get()
+        self.assertEqual((upload.chunk_count, upload.chunk_claimed_at), (2, None))
+
+    def test_chunks_are_written_one_at_a_time(self):
+        data = self.image()
+        token = self.create_upload(data)
+        RecipeImageUpload.objects.update(chunk_claimed_at=timezone.now())
+
+        self.assertEqual(self.put_chunk(token, data, 0, len(data)).status_code, 409)
+
+        # The claim of a request that died expires
+        RecipeImageUpload.objects.update(chunk_claimed_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.put_chunk(token, data, 0, len(data)).status_code, 200)
+
+    def test_claim_taken_over_while_writing(self):
+        data = self.image()
+        token = self.create_upload(data)
+        write_chunk = LocalChunkedUploadBackend.write_chunk
+
+        def slow_write(backend, upload, stream, length):
+            # Another request takes over the claim while this one is receiving
+            RecipeImageUpload.objects.update(chunk_claimed_at=timezone.now() + timedelta(seconds=1))
+            return write_chunk(backend, upload, stream, length)
+
+        with mock.patch.object(LocalChunkedUploadBackend, "write_chunk", slow_write):
+            response = self.put_chunk(token, data[:20], 0, len(data))
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(RecipeImageUpload.objects.get().received_size, 0)
+
+    def test_content_must_match_the_claimed_type(self):
+        response = self.upload(self.image("JPEG"), content_type="image/png")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(RecipeImageUpload.objects.exists())
+        self.assertEqual(os.listdir(LocalChunkedUploadBackend().directory), [])
+
+    def test_non_images_are_rejected(self):
+        self.assertEqual(self.upload(b"<html>not an image</html>").status_code, 400)
+        self.assertFalse(RecipeImageUpload.objects.exists())
+
+    @override_settings(RECIPE_IMAGE_UPLOAD_MAX_PIXELS=100)
+    def test_pixel_cap(self):
+        self.assertEqual(self.upload(self.image(size=(20, 20))).status_code, 400)
+
+    def test_cleanup_deletes_expired_uploads(self):
+        data = self.image()
+        self.client.post(
+            "/api/recipes/uploads/",
+            {"filename": "soup.png", "content_type": "image/png", "total_size": len(data)},
+            format="json",
+        )
+        expired = RecipeImageUpload.objects.get()
+        self.client.put(
+            f"/api/recipes/uploads/{expired.token}/",
+            data[:10],
+            content_type="application/octet-stream",
+            HTTP_CONTENT_RANGE=f"bytes 0-9/{len(data)}",
+        )
+        RecipeImageUpload.objects.filter(id=expired.id).update(updated_at=timezone.now() - timedelta(days=2))
+        self.upload(data)
+
+        call_command("cleanup_image_uploads", stdout=StringIO())
+
+        self.assertEqual(list(RecipeImageUpload.objects.values_list("status", flat=True)), ["complete"])
+        self.assertEqual(os.listdir(LocalChunkedUploadBackend().directory), [])
+
+
+class RecommendationTests(APITestCase, RecipeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.users = {
+            name: User.objects.create_user(username=name, password="secret") for name in ("ann", "bob", "cat")
+        }
+        self.recipes = [self.create_recipe(title, ["onion"]) for title in ("Soup", "Stew", "Curry", "Pie")]
+        Recipe.objects.filter(id=self.recipes[3].id).update(author=self.users["cat"])
+        ratings = {"ann": [9, 2, 8, 9], "bob": [8, 1, 9, 8], "cat": [10, 1]}
+        for name, values in ratings.items():
+            for recipe, rating in zip(self.recipes, values):
+                RecipeRating.objects.create(author=self.users[name], recipe=recipe, rating=rating)
+
+    def recommended_ids(self, name):
+        return list(
+            RecipeRecommendation.objects.filter(user=self.users[name])
+            .order_by("rank")
+            .values_list("recipe_id", flat=True)
+        )
+
+    def test_rated_and_own_recipes_are_excluded(self):
+        self.assertEqual(refresh_recommendations(), 3)
+
+        # Pie would be predicted highly too, but cat wrote it
+        self.assertEqual(self.recommended_ids("cat"), [self.recipes[2].id])
+        self.assertEqual(self.recommended_ids("ann"), [])
+
+    def test_only_users_with_changed_ratings_are_recomputed(self):
+        refresh_recommendations()
+        self.assertEqual(stale_user_ids(), set())
+
+        RecipeRating.objects.filter(author=self.users["ann"], recipe=self.recipes[0]).update(
+            rating=3, updated_on=timezone.now()
+        )
+        self.client.force_login(self.users["bob"])
+        rating = RecipeRating.objects.get(author=self.users["bob"], recipe=self.recipes[0])
+        self.assertEqual(self.client.delete(f"/api/recipes/ratings/{rating.id}/").status_code, 204)
+
+        self.assertEqual(stale_user_ids(), {self.users["ann"].id, self.users["bob"].id})
+        with mock.patch("apps.recipes.recommendations.predict", wraps=predict) as predicted:
+            self.assertEqual(refresh_recommendations(), 2)
+        self.assertEqual(predicted.call_args.args[0].tolist(), [0, 1])  # Rows of ann and bob only
+        self.assertEqual(stale_user_ids(), set())
+
+    def test_recommended(self):
+        refresh_recommendations()
+        self.client.force_login(self.users["cat"])
+        url = "/api/recipes/recipes/recommended/"
+
+        results = self.client.get(url).data["results"]
+
+        self.assertEqual([row["id"] for row in results], [self.recipes[2].id])
+        self.assertGreater(results[0]["predicted_rating"], 2.75)  # Above cat's own average
+
+        # Recipes rated after the recommendations were computed are left out until the next run
+        RecipeRating.objects.create(author=self.users["cat"], recipe=self.recipes[2], rating=5)
+        self.assertEqual(self.client.get(url).data["results"], [])
+
+    def test_recommended_requires_login(self):
+        self.assertEqual(self.client.get("/api/recipes/recipes/recommended/").status_code, 403)
+
+
+@override_settings(RECIPE_RATING_PRIOR_WEIGHT=10)
+class TopRecipesTests(APITestCase, RecipeTestCase):
+    def setUp(self):
+        super().setUp()
+        raters = [User.objects.create_user(username=f"rater{index}", password="secret") for index in range(10)]
+        # One perfect vote, many good votes and many poor votes (which pull the global mean down)
+        self.single = self.create_rated_recipe("Single", raters[:1], 10)
+        self.good = self.create_rated_recipe("Good", raters, 9)
+        self.poor = self.create_rated_recipe("Poor", raters, 3)
+
+    def create_rated_recipe(self, title, raters, rating):
+        recipe = self.create_recipe(title, ["onion"])
+        RecipeRating.objects.bulk_create(RecipeRating(author=rater, recipe=recipe, rating=rating) for rater in raters)
+        update_recipe_ratings(recipe)
+        return recipe
+
+    def top_ids(self, **params):
+        return [row["id"] for row in self.client.get("/api/recipes/recipes/top/", params).data["results"]]
+
+    def test_refresh_repairs_drifted_scores(self):
+        Recipe.objects.update(bayesian_score=0)
+
+        self.assertEqual(refresh_bayesian_scores(), 3)
+        self.assertEqual(refresh_bayesian_scores(), 0)
+
+        self.good.refresh_from_db()
+        self.assertAlmostEqual(self.good.bayesian_score, bayesian_score(9, 10, 130 / 21))
+
+    def test_many_good_ratings_outrank_a_single_perfect_one(self):
+        refresh_bayesian_scores()
+
+        self.assertEqual(self.top_ids(), [self.good.id, self.single.id, self.poor.id])
+
+    def test_days_only_ranks_recent_recipes(self):
+        Recipe.objects.filter(id=self.good.id).update(created_on=timezone.now() - timedelta(days=60))
+
+        self.assertEqual(self.top_ids(days=30), [self.single.id, self.poor.id])
+        self.assertEqual(self.client.get("/api/recipes/recipes/top/", {"days": "soon"}).status_code, 400)
+
+
+class FollowingRecipesTests(APITestCase, RecipeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.reader = User.objects.create_user(username="reader", password="secret")
+        Follow.objects.create(follower=self.reader, followed=self.author)
+        self.recipes = [self.create_recipe(title, ["onion"]) for title in ("Soup", "Stew", "Curry")]
+        other = User.objects.create_user(username="other", password="secret")
+        Recipe.objects.create(title="Pie", slug="pie", author=other, content="Bake.")
+        self.url = "/api/recipes/recipes/"
+
+    def test_cursor_pages_only_have_followed_authors(self):
+        self.client.force_login(self.reader)
+
+        first = self.client.get(self.url, {"following": "true", "page_size": 2}).data
+        self.create_recipe("Salad", ["carrot"])  # Newer recipes do not shift the next page
+        second = self.client.get(first["next"]).data
+
+        newest_first = [recipe.id for recipe in reversed(self.recipes)]
+        self.assertEqual([row["id"] for row in first["results"]], newest_first[:2])
+        self.assertEqual([row["id"] for row in second["results"]], newest_first[2:])
+        self.assertIsNone(second["next"])
+
+    def test_anonymous_users_follow_nobody(self):
+        self.assertEqual(self.client.get(self.url, {"following": "true"}).data["results"], [])
+
+
+class IngredientFacetTests(APITestCase, RecipeTestCase):
+    def setUp(self):
+        super().setUp()
+        recipes = [("Soup", ["onion", "carrot"]), ("Stew", ["onion", "potato"]), ("Curry", ["onion", "rice"])]
+        for age, (title, ingredient_names) in enumerate(reversed(recipes)):
+            recipe = self.create_recipe(title, ingredient_names)
+            Recipe.objects.filter(id=recipe.id).update(created_on=timezone.now() - timedelta(days=age))
+
+    def facets(self, **params):
+        response = self.client.get("/api/recipes/recipes/", {"facets": "true", **params})
+        return [(facet["name"], facet["count"]) for facet in response.data["facets"]]
+
+    def test_counts_over_matching_recipes(self):
+        self.assertEqual(self.facets(), [("onion", 3), ("carrot", 1), ("potato", 1), ("rice", 1)])
+        self.assertEqual(self.facets(ingredients=self.ingredients["carrot"].id), [("onion", 1), ("carrot", 1)])
+
+    @override_settings(RECIPE_FACET_MAX_RECIPES=2)
+    def test_only_the_newest_recipes_are_counted(self):
+        self.assertEqual(self.facets(), [("onion", 2), ("potato", 1), ("rice", 1)])
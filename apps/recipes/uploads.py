@@ -0,0 +1,166 @@
+import base64
+import io
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from PIL import Image, UnidentifiedImageError
+from storages.backends.azure_storage import AzureStorage
+from azure.storage.blob import BlobBlock, ContentSettings
+
+from .models import Recipe, RecipeImageUpload
+
+STREAM_READ_SIZE = 64 * 1024
+IMAGE_HEADER_SIZE = 64 * 1024  # Bytes read to identify an uploaded image, enough for its header
+IMAGE_CONTENT_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "GIF": "image/gif", "WEBP": "image/webp"}
+
+
+class InvalidImageUpload(Exception):
+    """The uploaded file is not an acceptable image. Its data has been deleted."""
+
+
+def generate_storage_name(filename: str) -> str:
+    """Builds the storage name for an uploaded image, honouring Recipe.image's upload_to."""
+    return Recipe._meta.get_field("image").generate_filename(None, filename)
+
+
+def verify_image(upload: RecipeImageUpload, size: int, header: bytes) -> None:
+    """
+    Checks the stored size and the image header of a finished upload: the content must be an
+    image of the claimed type, within RECIPE_IMAGE_UPLOAD_MAX_SIZE and RECIPE_IMAGE_UPLOAD_MAX_PIXELS.
+    Raises InvalidImageUpload otherwise. Only the header is parsed, no pixel data is decoded.
+    """
+    if size != upload.total_size or size > settings.RECIPE_IMAGE_UPLOAD_MAX_SIZE:
+        raise InvalidImageUpload("The stored image does not have the announced size.")
+    try:
+        with Image.open(io.BytesIO(header)) as image:
+            image_format, (width, height) = image.format, image.size
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError):
+        raise InvalidImageUpload("The uploaded file is not a supported image.")
+    if IMAGE_CONTENT_TYPES.get(image_format) != upload.content_type:
+        raise InvalidImageUpload(f"The uploaded file is not of type '{upload.content_type}'.")
+    if width * height > settings.RECIPE_IMAGE_UPLOAD_MAX_PIXELS:
+        raise InvalidImageUpload(f"Images may have at most {settings.RECIPE_IMAGE_UPLOAD_MAX_PIXELS} pixels.")
+
+
+class LocalChunkedUploadBackend:
+    """
+    Appends chunks to a partial file on local disk and hands the finished file to
+    the default storage. Used when the media storage is not Azure (e.g. local development).
+    """
+
+    def __init__(self, storage=None):
+        self.storage = storage or default_storage
+        self.directory = os.path.join(settings.FILE_UPLOAD_TEMP_DIR or tempfile.gettempdir(), "recipe-uploads")
+
+    def _partial_path(self, upload: RecipeImageUpload) -> str:
+        return os.path.join(self.directory, f"{upload.token.hex}.part")
+
+    def write_chunk(self, upload: RecipeImageUpload, stream, length: int) -> int:
+        os.makedirs(self.directory, exist_ok=True)
+        written = 0
+        with open(self._partial_path(upload), "ab") as partial:
+            partial.truncate(upload.received_size)  # Drop leftovers of a previously interrupted chunk
+            while written < length:
+                data = stream.read(min(STREAM_READ_SIZE, length - written))
+                if not data:
+                    break
+                partial.write(data)
+                written += len(data)
+        return written
+
+    def finalize(self, upload: RecipeImageUpload) -> str:
+        """Verifies the partial file and moves it to the storage. Raises InvalidImageUpload."""
+        path = self._partial_path(upload)
+        with open(path, "rb") as partial:
+            try:
+                verify_image(upload, os.fstat(partial.fileno()).st_size, partial.read(IMAGE_HEADER_SIZE))
+            except InvalidImageUpload:
+                self.discard(upload)
+                raise
+            partial.seek(0)
+            name = self.storage.save(upload.storage_name, File(partial))
+        os.remove(path)
+        return name
+
+    def discard(self, upload: RecipeImageUpload) -> None:
+        try:
+            os.remove(self._partial_path(upload))
+        except FileNotFoundError:
+            pass
+
+
+class AzureChunkedUploadBackend:
+    """
+    Stages every chunk as a block of the target block blob and commits the block
+    list once all chunks arrived, so no chunk is ever held by the web worker.
+    Uncommitted blocks are garbage collected by Azure after a week.
+    """
+
+    def __init__(self, storage=None):
+        self.storage = storage or default_storage
+
+    def _blob_client(self, upload: RecipeImageUpload):
+        return self.storage.client.get_blob_client(self.storage._get_valid_path(upload.storage_name))
+
+    @staticmethod
+    def _block_id(index: int) -> str:
+        return base64.b64encode(f"{index:08d}".encode()).decode()
+
+    def write_chunk(self, upload: RecipeImageUpload, stream, length: int) -> int:
+        self._blob_client(upload).stage_block(
+            block_id=self._block_id(upload.chunk_count),
+            data=stream,
+            length=length,
+            timeout=self.storage.timeout,
+        )
+        return length
+
+    def finalize(self, upload: RecipeImageUpload) -> str:
+        """
+        Commits the blocks, then verifies the blob from its properties and first bytes, deleting
+        it when it is rejected (uncommitted blocks cannot be read). Raises InvalidImageUpload.
+        """
+        blob_client = self._blob_client(upload)
+        blocks = [BlobBlock(block_id=self._block_id(index)) for index in range(upload.chunk_count)]
+        blob_client.commit_block_list(
+            blocks,
+            content_settings=ContentSettings(
+                content_type=upload.content_type,
+                cache_control=self.storage.cache_control,
+            ),
+            timeout=self.storage.timeout,
+        )
+        try:
+            size = blob_client.get_blob_properties(timeout=self.storage.timeout).size
+            header = blob_client.download_blob(
+                offset=0, length=min(size, IMAGE_HEADER_SIZE), timeout=self.storage.timeout
+            ).readall()
+            verify_image(upload, size, header)
+        except InvalidImageUpload:
+            blob_client.delete_blob(timeout=self.storage.timeout)
+            raise
+        return upload.storage_name
+
+    def discard(self, upload: RecipeImageUpload) -> None:
+        # Nothing is visible until the block list is committed
+        pass
+
+
+def get_upload_backend():
+    """Returns the chunked upload backend matching the configured media storage."""
+    if isinstance(default_storage, AzureStorage):
+        return AzureChunkedUploadBackend()
+    return LocalChunkedUploadBackend()
+
+
+def delete_upload(upload: RecipeImageUpload) -> None:
+    """Deletes an upload that is not attached to a recipe, with its received data."""
+    if upload.status == RecipeImageUpload.Status.PENDING:
+        get_upload_backend().discard(upload)
+    elif upload.status == RecipeImageUpload.Status.COMPLETE:
+        # Completed but never attached to a recipe, the stored file is orphaned
+        default_storage.delete(upload.storage_name)
+    upload.delete()
@@ -5,6 +5,7 @@ from . import views
 router = DefaultRouter()
 router.register(r"recipes", views.RecipeViewSet, basename="recipe")
 router.register(r"ratings", views.RecipeRatingViewSet, basename="reciperating")
+router.register(r"uploads", views.RecipeImageUploadViewSet, basename="recipeimageupload")
 
 urlpatterns = [
     path("", include(router.urls)),
@@ -1,18 +1,49 @@
-from django.db.models import Case, IntegerField, Value, When
-from rest_framework import filters, permissions, serializers, status, viewsets
+import re
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, IntegerField, Prefetch, Value, When
+from django.utils.cache import get_conditional_response
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework import filters, mixins, permissions, serializers, status, viewsets
 from rest_framework.authentication import SessionAuthentication
 from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
 
+from apps.core.models import Follow
 from apps.core.views import IsAuthorOrSuperuser
 from apps.feed.models import FeedItem
-
-from .models import Recipe, RecipeRating
+from apps.feed.services import publish_feed_item, record_feed_item_update
+from apps.ingredients.models import Ingredient
+from apps.ingredients.nutrition import nutrition_for_items
+
+from .cache import (
+    get_cached_recipe_detail,
+    get_recipe_version,
+    invalidate_recipe_detail,
+    set_cached_recipe_detail,
+    viewer_etag,
+)
+from .facets import IngredientFilter, ingredient_facets
+from .matching import cached_match_recipes
+from .models import Recipe, RecipeImageUpload, RecipeNeighbour, RecipeRating, RecipeRecommendation
 from .permissions import IsAuthorOrReadOnly
-from .serializers import RecipeDetailSerializer, RecipeRatingSerializer, SimpleRecipeSerializer
-from .services import update_recipe_ratings
+from .serializers import (
+    RecipeDetailSerializer,
+    RecipeImageUploadSerializer,
+    RecipeRatingSerializer,
+    SimpleRecipeSerializer,
+)
+from .services import update_recipe_ratings, user_ratings_removed, viewer_annotations
+from .uploads import InvalidImageUpload, delete_upload, generate_storage_name, get_upload_backend
+
+CONTENT_RANGE_RE = re.compile(r"^bytes (?P<start>\d+)-(?P<end>\d+)/(?P<total>\d+)$")
 
 
 class PrioritizedSearchFilter(filters.SearchFilter):
@@ -42,16 +73,38 @@ class StandardResultsSetPagination(PageNumberPagination):
     max_page_size = 100
 
 
+class LeaderboardPagination(CursorPagination):
+    """Cursor paging over the Bayesian score index, stable while scores change between pages."""
+
+    page_size = 25
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = ("-bayesian_score", "-id")
+
+
+class NewestCursorPagination(CursorPagination):
+    """Keyset paging on creation time, cost per page does not grow with the page number."""
+
+    page_size = 25
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    ordering = ("-created_on", "-id")
+
+
 class RecipeViewSet(viewsets.ModelViewSet):
     """
     API endpoint that allows recipes to be viewed, created, updated and deleted.
     Regular users can only modify their own recipes, superusers can modify any.
-    Use ?mine=true to filter for the logged-in user's recipes.
+    Use ?mine=true to filter for the logged-in user's recipes,
+    or ?following=true for recipes by the authors they follow (newest first, cursor paging).
+    Use ?ingredients=1,2 and ?exclude_ingredients=3 to filter on ingredients,
+    and ?facets=true to add ingredient counts over the matching recipes to the list response
+    (the newest RECIPE_FACET_MAX_RECIPES of them).
     """
 
     authentication_classes = [SessionAuthentication]
     permission_classes = [IsAuthenticatedOrReadOnly, IsAuthorOrSuperuser]
-    filter_backends = [PrioritizedSearchFilter]
+    filter_backends = [PrioritizedSearchFilter, IngredientFilter]
     search_fields = ["title"]
     pagination_class = StandardResultsSetPagination
     serializer_class = SimpleRecipeSerializer
@@ -60,13 +113,21 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """
         Optionally restricts the returned recipes to the logged-in user's recipes,
         by filtering against a `mine=true` query parameter in the URL.
+        Recipes are annotated with the viewer's rating, grocery list and follow state.
         """
         user = self.request.user
-        base_queryset = Recipe.objects.select_related("author").prefetch_related(
-            "recipeingredient_set__ingredient", "reciperating_set"
+        base_queryset = (
+            Recipe.objects.select_related("author")
+            .prefetch_related("recipeingredient_set__ingredient", "reciperating_set")
+            .annotate(**viewer_annotations(user))
         )
 
         show_mine = self.request.query_params.get("mine", "").lower() == "true"
+        if self._show_following():
+            if not user.is_authenticated:
+                return base_queryset.none()
+            followed = Follow.objects.filter(follower=user).values("followed")
+            return base_queryset.filter(author__in=followed).order_by("-created_on", "-id")
         if show_mine and user.is_authenticated:
             queryset = base_queryset.filter(author=user)
         else:
@@ -74,6 +135,18 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         return queryset.order_by("-created_on")
 
+    def _show_following(self):
+        return self.action == "list" and self.request.query_params.get("following", "").lower() == "true"
+
+    @property
+    def paginator(self):
+        """Recipes by followed authors use keyset paging over the (author, created_on) index."""
+        if self._show_following():
+            if not hasattr(self, "_following_paginator"):
+                self._following_paginator = NewestCursorPagination()
+            return self._following_paginator
+        return super().paginator
+
     def get_serializer_class(self):
         if self.action == "list":
             return SimpleRecipeSerializer
@@ -84,9 +157,46 @@ class RecipeViewSet(viewsets.ModelViewSet):
         context.update({"request": self.request})
         return context
 
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        if request.query_params.get("facets", "").lower() == "true":
+            response.data["facets"] = ingredient_facets(self.filter_queryset(self.get_queryset()))
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Serves recipe details from a cache keyed on the recipe version
+        (see cache.get_recipe_version), with ETag/Last-Modified revalidation.
+        The viewer's own state is fetched with the version and merged into the shared cached data.
+        """
+        try:
+            recipe_id = int(kwargs["pk"])
+        except ValueError:
+            raise NotFound()
+
+        version = get_recipe_version(recipe_id, viewer_annotations(request.user))
+        if version is None:
+            raise NotFound()
+
+        entry = get_cached_recipe_detail(recipe_id, version)
+        if entry is None:
+            serializer = self.get_serializer(self.get_object())
+            entry = set_cached_recipe_detail(recipe_id, version, serializer.data)
+
+        etag = viewer_etag(entry["etag"], version.viewer_state)
+        last_modified = int(version.last_modified.timestamp())
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        response = Response({**entry["data"], **version.viewer_state})
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        return response
+
     def perform_create(self, serializer):
         recipe_instance = serializer.save(author=self.request.user)
-        FeedItem.objects.create(
+        publish_feed_item(
             user=recipe_instance.author,
             event_type=FeedItem.EventType.NEW_RECIPE,
             recipe=recipe_instance,
@@ -94,8 +204,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     def perform_update(self, serializer):
         recipe_instance = serializer.save()
-        FeedItem.objects.filter(recipe=recipe_instance, event_type=FeedItem.EventType.NEW_RECIPE).delete()
-        FeedItem.objects.create(
+        invalidate_recipe_detail([recipe_instance.id])
+        record_feed_item_update(
             user=recipe_instance.author,
             event_type=FeedItem.EventType.UPDATE_RECIPE,
             recipe=recipe_instance,
@@ -103,6 +213,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     def perform_destroy(self, instance):
         FeedItem.objects.filter(recipe=instance).delete()
+        invalidate_recipe_detail([instance.id])
         instance.delete()
 
     @action(detail=True, methods=["get"])
@@ -125,6 +236,254 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
         return Response({"ingredients": scaled_ingredients})
 
+    @action(detail=True, methods=["get"])
+    def similar(self, request, pk=None):
+        """
+        Returns the precomputed most similar recipes (by shared ingredients), best first.
+        Example: /api/recipes/1/similar/
+        """
+        recipe = self.get_object()
+        recipes = Recipe.objects.select_related("author").annotate(**viewer_annotations(request.user))
+        neighbours = (
+            RecipeNeighbour.objects.filter(recipe=recipe)
+            .prefetch_related(Prefetch("neighbour", queryset=recipes))
+            .order_by("rank")
+        )
+        results = []
+        for neighbour in neighbours:
+            data = SimpleRecipeSerializer(neighbour.neighbour, context=self.get_serializer_context()).data
+            data["similarity"] = round(neighbour.score, 3)
+            results.append(data)
+        return Response({"results": results})
+
+    @action(detail=False, methods=["get"], url_path="cook-with")
+    def cook_with(self, request):
+        """
+        Ranks recipes by how much of them can be cooked with the given ingredients:
+        highest share of their ingredients available first, then fewest missing.
+        Use max_missing to only list recipes needing at most that many extra ingredients.
+        Example: /api/recipes/cook-with/?ingredients=3,8,15&max_missing=2
+        """
+        try:
+            available = {
+                int(value) for value in request.query_params.get("ingredients", "").split(",") if value.strip()
+            }
+            max_missing = request.query_params.get("max_missing")
+            max_missing = int(max_missing) if max_missing not in (None, "") else None
+        except ValueError:
+            return Response(
+                {"error": "Invalid 'ingredients' or 'max_missing' parameter."}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if not available:
+            return Response({"error": "'ingredients' parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        page = self.paginate_queryset(cached_match_recipes(available, max_missing))
+        recipes = Recipe.objects.select_related("author").annotate(**viewer_annotations(request.user))
+        recipes = recipes.in_bulk([recipe_id for recipe_id, _, _ in page])
+        missing_ids = {
+            ingredient_id
+            for recipe in recipes.values()
+            for ingredient_id in recipe.ingredient_ids
+            if ingredient_id not in available
+        }
+        ingredient_names = dict(Ingredient.objects.filter(id__in=missing_ids).values_list("id", "name"))
+
+        results = []
+        for recipe_id, matched_count, missing_count in page:
+            recipe = recipes.get(recipe_id)
+            if recipe is None:  # Deleted since matching
+                continue
+            data = SimpleRecipeSerializer(recipe, context=self.get_serializer_context()).data
+            data["matched_count"] = matched_count
+            data["missing_count"] = missing_count
+            data["coverage"] = round(matched_count / (matched_count + missing_count), 3)
+            data["missing_ingredients"] = [
+                {"id": ingredient_id, "name": ingredient_names.get(ingredient_id)}
+                for ingredient_id in recipe.ingredient_ids
+                if ingredient_id not in available
+            ]
+            results.append(data)
+        return self.get_paginated_response(results)
+
+    @action(detail=False, methods=["get"], permission_classes=[permissions.IsAuthenticated])
+    def recommended(self, request):
+        """
+        Returns the logged-in user's precomputed recommendations, best predicted rating first.
+        Recipes rated since the recommendations were computed are left out.
+        Example: /api/recipes/recommended/
+        """
+        recipes = Recipe.objects.select_related("author").annotate(**viewer_annotations(request.user))
+        recommendations = (
+            RecipeRecommendation.objects.filter(user=request.user)
+            .exclude(recipe__reciperating__author=request.user)
+            .prefetch_related(Prefetch("recipe", queryset=recipes))
+            .order_by("rank")
+        )
+        results = []
+        for recommendation in recommendations:
+            data = SimpleRecipeSerializer(recommendation.recipe, context=self.get_serializer_context()).data
+            data["predicted_rating"] = round(recommendation.score / 2, 2)  # Same 0-5 scale as average_rating
+            results.append(data)
+        return Response({"results": results})
+
+    @action(detail=False, methods=["get"])
+    def top(self, request):
+        """
+        Returns rated recipes by Bayesian score (average rating weighted by the number of ratings),
+        with cursor paging. Use days to only rank recipes created in the last N days.
+        Example: /api/recipes/top/?days=30
+        """
+        queryset = (
+            Recipe.objects.filter(rating_count__gt=0)
+            .select_related("author")
+            .annotate(**viewer_annotations(request.user))
+        )
+        days = request.query_params.get("days")
+        if days:
+            try:
+                queryset = queryset.filter(created_on__gte=timezone.now() - timedelta(days=int(days)))
+            except (ValueError, OverflowError):
+                return Response({"error": "Invalid 'days' parameter."}, status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = LeaderboardPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        results = []
+        for recipe in page:
+            data = SimpleRecipeSerializer(recipe, context=self.get_serializer_context()).data
+            data["score"] = round(recipe.bayesian_score / 2, 2)  # Same 0-5 scale as average_rating
+            results.append(data)
+        return paginator.get_paginated_response(results)
+
+    @action(detail=True, methods=["get"])
+    def nutrition(self, request, pk=None):
+        """
+        Returns nutrient totals for a given recipe, per serving and for a number of guests.
+        Example: /api/recipes/1/nutrition/?guests=4
+        """
+        recipe = self.get_object()
+        try:
+            guests = int(request.query_params.get("guests", 1))
+        except ValueError:
+            return Response({"error": "Invalid 'guests' parameter."}, status=status.HTTP_400_BAD_REQUEST)
+
+        recipe_ingredients = recipe.recipeingredient_set.select_related("ingredient", "unit")
+        per_serving = nutrition_for_items(recipe_ingredients)
+        total = nutrition_for_items(recipe_ingredients, scale=guests)
+        return Response(
+            {
+                "guests": guests,
+                "per_serving": per_serving["nutrients"],
+                "total": total["nutrients"],
+                "missing_ingredients": per_serving["missing_ingredients"],
+            }
+        )
+
+
+class RecipeImageUploadViewSet(
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.DestroyModelMixin,
+    viewsets.GenericViewSet,
+):
+    """
+    API endpoint for chunked, resumable recipe image uploads.
+    POST starts an upload and returns its token, PUT appends the chunk described by
+    the 'Content-Range' header (e.g. 'bytes 0-1048575/5242880') with the raw bytes as body,
+    GET reports how many bytes were received so an interrupted upload can resume.
+    Completed uploads are attached to a recipe via its 'image_upload' field.
+    """
+
+    authentication_classes = [SessionAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = RecipeImageUploadSerializer
+    lookup_field = "token"
+    lookup_value_regex = "[0-9a-f-]{36}"
+
+    def get_queryset(self):
+        return RecipeImageUpload.objects.filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        upload = serializer.save(user=self.request.user)
+        upload.storage_name = generate_storage_name(f"{upload.token.hex[:12]}_{upload.filename}")
+        upload.save(update_fields=["storage_name"])
+
+    def update(self, request, *args, **kwargs):
+        match = CONTENT_RANGE_RE.match(request.headers.get("Content-Range", ""))
+        if not match:
+            return Response(
+                {"error": "A 'Content-Range: bytes <start>-<end>/<total>' header is required."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        start, end, total = (int(match.group(name)) for name in ("start", "end", "total"))
+        length = end - start + 1
+        if length <= 0 or length > settings.RECIPE_IMAGE_UPLOAD_MAX_CHUNK_SIZE:
+            return Response({"error": "Invalid chunk size."}, status=status.HTTP_400_BAD_REQUEST)
+        if int(request.headers.get("Content-Length") or 0) != length:
+            return Response(
+                {"error": "'Content-Length' does not match 'Content-Range'."}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        backend = get_upload_backend()
+        claimed_at = timezone.now()
+        with transaction.atomic():
+            # Short lock: check the offset and claim the upload for this chunk. The chunk is read and
+            # stored outside the transaction, so a slow client does not keep a transaction and row lock open.
+            upload = self.get_queryset().select_for_update().filter(token=kwargs["token"]).first()
+            if upload is None:
+                raise NotFound("Upload not found.")
+            if upload.status != RecipeImageUpload.Status.PENDING:
+                return Response({"error": "Upload is already complete."}, status=status.HTTP_409_CONFLICT)
+            if total != upload.total_size or end >= upload.total_size:
+                return Response({"error": "Chunk is outside the upload."}, status=status.HTTP_400_BAD_REQUEST)
+            if start != upload.received_size:
+                # Client is out of sync (e.g. resuming), tell it where to continue from
+                return Response(RecipeImageUploadSerializer(upload).data, status=status.HTTP_409_CONFLICT)
+            claim_expiry = claimed_at - timedelta(seconds=settings.RECIPE_IMAGE_UPLOAD_CHUNK_CLAIM_SECONDS)
+            if upload.chunk_claimed_at is not None and upload.chunk_claimed_at > claim_expiry:
+                return Response(
+                    {"error": "Another chunk of this upload is being received."}, status=status.HTTP_409_CONFLICT
+                )
+            upload.chunk_claimed_at = claimed_at
+            upload.save(update_fields=["chunk_claimed_at", "updated_at"])
+
+        # Only applies while this request's claim holds and no other chunk was stored meanwhile
+        claimed = RecipeImageUpload.objects.filter(id=upload.id, received_size=start, chunk_claimed_at=claimed_at)
+        try:
+            written = backend.write_chunk(upload, request.stream, length)
+            if written != length:
+                claimed.update(chunk_claimed_at=None)
+                return Response({"error": "Incomplete chunk received."}, status=status.HTTP_400_BAD_REQUEST)
+
+            upload.received_size += written
+            upload.chunk_count += 1
+            if upload.received_size == upload.total_size:
+                try:
+                    upload.storage_name = backend.finalize(upload)
+                except InvalidImageUpload as error:
+                    claimed.delete()
+                    return Response({"error": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+                upload.status = RecipeImageUpload.Status.COMPLETE
+        except BaseException:
+            claimed.update(chunk_claimed_at=None)
+            raise
+
+        upload.chunk_claimed_at = None
+        upload.updated_at = timezone.now()
+        stored = claimed.update(
+            received_size=upload.received_size,
+            chunk_count=upload.chunk_count,
+            storage_name=upload.storage_name,
+            status=upload.status,
+            chunk_claimed_at=None,
+            updated_at=upload.updated_at,
+        )
+        if not stored:  # The claim expired and another request took over
+            return Response({"error": "The upload changed while receiving the chunk."}, status=status.HTTP_409_CONFLICT)
+        return Response(RecipeImageUploadSerializer(upload).data)
+
+    def perform_destroy(self, instance):
+        delete_upload(instance)
+
 
 class RecipeRatingViewSet(viewsets.ModelViewSet):
     """
@@ -158,7 +517,7 @@ class RecipeRatingViewSet(viewsets.ModelViewSet):
 
         rating_instance = serializer.save(author=self.request.user)
         update_recipe_ratings(rating_instance.recipe)
-        FeedItem.objects.create(
+        publish_feed_item(
             user=rating_instance.author,
             event_type=FeedItem.EventType.NEW_RATING,
             rating=rating_instance,
@@ -168,8 +527,7 @@ class RecipeRatingViewSet(viewsets.ModelViewSet):
     def perform_update(self, serializer):
         instance = serializer.save()
         update_recipe_ratings(instance.recipe)
-        FeedItem.objects.filter(rating=instance).delete()
-        FeedItem.objects.create(
+        record_feed_item_update(
             user=instance.author,
             event_type=FeedItem.EventType.UPDATE_RATING,
             rating=instance,
@@ -180,4 +538,5 @@ class RecipeRatingViewSet(viewsets.ModelViewSet):
         recipe = instance.recipe
         instance.delete()
         update_recipe_ratings(recipe)
+        user_ratings_removed([instance.author_id])
         FeedItem.objects.filter(rating=instance).delete()
@@ -128,6 +128,31 @@ DATABASES = {
 # }
 
 
+# Cache
+# Defaults to a per-process cache, set CACHE_BACKEND/CACHE_LOCATION to share it between workers
+# (e.g. django.core.cache.backends.redis.RedisCache). Production with several workers needs a shared
+# cache: `manage.py check --deploy` warns otherwise (core.W001)
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+
+RECIPE_DETAIL_CACHE_TIMEOUT = int(os.getenv("RECIPE_DETAIL_CACHE_TIMEOUT", 60 * 60))
+
+# Bayesian recipe score: weight of the global mean rating, in number of ratings
+RECIPE_RATING_PRIOR_WEIGHT = float(os.getenv("RECIPE_RATING_PRIOR_WEIGHT", 10))
+RECIPE_RATING_MEAN_CACHE_TIMEOUT = int(os.getenv("RECIPE_RATING_MEAN_CACHE_TIMEOUT", 60 * 60))
+
+# "Cook with" results are cached per ingredient set, so paging through them does not rank again
+RECIPE_MATCH_CACHE_SECONDS = int(os.getenv("RECIPE_MATCH_CACHE_SECONDS", 60))
+
+# Ingredient facets are counted over at most this many of the newest matching recipes
+RECIPE_FACET_MAX_RECIPES = int(os.getenv("RECIPE_FACET_MAX_RECIPES", 5000))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -174,6 +199,57 @@ AZURE_CUSTOM_DOMAIN = f"{AZURE_ACCOUNT_NAME}.blob.core.windows.net"
 MEDIA_URL = f"https://{AZURE_CUSTOM_DOMAIN}/media/"
 MEDIA_ROOT = BASE_DIR / "mediafiles"
 
+# Chunked recipe image uploads (sizes in bytes)
+RECIPE_IMAGE_UPLOAD_MAX_SIZE = int(os.getenv("RECIPE_IMAGE_UPLOAD_MAX_SIZE", 20 * 1024 * 1024))
+RECIPE_IMAGE_UPLOAD_MAX_CHUNK_SIZE = int(os.getenv("RECIPE_IMAGE_UPLOAD_MAX_CHUNK_SIZE", 4 * 1024 * 1024))
+RECIPE_IMAGE_UPLOAD_MAX_PIXELS = int(os.getenv("RECIPE_IMAGE_UPLOAD_MAX_PIXELS", 40_000_000))
+# A chunk being received blocks other chunks of its upload for at most this many seconds (if its request died)
+RECIPE_IMAGE_UPLOAD_CHUNK_CLAIM_SECONDS = int(os.getenv("RECIPE_IMAGE_UPLOAD_CHUNK_CLAIM_SECONDS", 5 * 60))
+# Uploads not finished or not attached to a recipe within this many hours are deleted (cleanup_image_uploads)
+RECIPE_IMAGE_UPLOAD_EXPIRY_HOURS = int(os.getenv("RECIPE_IMAGE_UPLOAD_EXPIRY_HOURS", 24))
+
+# Memory-mapped ingredient x nutrient matrix, shared by the workers of a machine
+NUTRIENT_MATRIX_DIR = os.getenv("NUTRIENT_MATRIX_DIR", str(BASE_DIR / "var" / "nutrition"))
+
+# Home timelines: authors with at least this many followers are read on demand instead of fanned out
+FEED_CELEBRITY_FOLLOWER_THRESHOLD = int(os.getenv("FEED_CELEBRITY_FOLLOWER_THRESHOLD", 5000))
+FEED_CELEBRITY_CACHE_TIMEOUT = int(os.getenv("FEED_CELEBRITY_CACHE_TIMEOUT", 10 * 60))
+FEED_FANOUT_BATCH_SIZE = int(os.getenv("FEED_FANOUT_BATCH_SIZE", 1000))
+FEED_BACKFILL_LIMIT = int(os.getenv("FEED_BACKFILL_LIMIT", 200))  # Items added to a timeline on follow
+# Edits within this many seconds of a feed item's last change update it in place instead of publishing a new one
+FEED_COALESCE_WINDOW_SECONDS = int(os.getenv("FEED_COALESCE_WINDOW_SECONDS", 15 * 60))
+FEED_COMMENT_PREVIEW_SIZE = int(os.getenv("FEED_COMMENT_PREVIEW_SIZE", 3))  # Latest comments embedded per item
+# "Top" feed ordering: the newest candidates within the window are ranked, and cached per user
+FEED_TOP_WINDOW_DAYS = int(os.getenv("FEED_TOP_WINDOW_DAYS", 7))
+FEED_TOP_CANDIDATES = int(os.getenv("FEED_TOP_CANDIDATES", 500))
+FEED_TOP_HALF_LIFE_HOURS = float(os.getenv("FEED_TOP_HALF_LIFE_HOURS", 24))
+FEED_TOP_CACHE_SECONDS = int(os.getenv("FEED_TOP_CACHE_SECONDS", 60))
+# Grouped feed (?group=true): ratings of a recipe within the same window of hours form one card
+FEED_GROUP_WINDOW_HOURS = int(os.getenv("FEED_GROUP_WINDOW_HOURS", 6))
+FEED_GROUP_CANDIDATES = int(os.getenv("FEED_GROUP_CANDIDATES", 500))  # Newest items grouped per page
+# Unread badge: counts stop at the limit ("9+"); cached per user until the timeline or the read marker changes
+FEED_UNREAD_COUNT_LIMIT = int(os.getenv("FEED_UNREAD_COUNT_LIMIT", 9))
+FEED_UNREAD_CACHE_SECONDS = int(os.getenv("FEED_UNREAD_CACHE_SECONDS", 60))
+# Retention (apply_feed_retention): age of the feed items and timeline partitions deleted
+FEED_RETENTION_DAYS = int(os.getenv("FEED_RETENTION_DAYS", 365))
+FEED_RETENTION_KEEP_COMMENTED = os.getenv("FEED_RETENTION_KEEP_COMMENTED", "1").lower() in ["true", "t", "1"]
+
+# Feed push notifications (Server-Sent Events, streamed only by the ASGI app; WSGI workers answer with a heartbeat)
+# The Postgres broker reaches every worker process; apps.feed.events.InProcessBroker only suits a single process
+FEED_EVENT_BROKER = os.getenv("FEED_EVENT_BROKER", "apps.feed.events.PostgresNotifyBroker")
+FEED_EVENTS_HEARTBEAT_SECONDS = int(os.getenv("FEED_EVENTS_HEARTBEAT_SECONDS", 15))
+# Streams end after this long and clients reconnect, picking up follows made in the meantime
+FEED_EVENTS_STREAM_SECONDS = int(os.getenv("FEED_EVENTS_STREAM_SECONDS", 5 * 60))
+
+# Ingredient priority (autocomplete ordering): age at which a use counts for half
+INGREDIENT_PRIORITY_HALF_LIFE_DAYS = float(os.getenv("INGREDIENT_PRIORITY_HALF_LIFE_DAYS", 90))
+
+# Meal-plan optimizer search limits (time budget in seconds)
+MEAL_PLAN_OPTIMIZER_BEAM_WIDTH = int(os.getenv("MEAL_PLAN_OPTIMIZER_BEAM_WIDTH", 8))
+MEAL_PLAN_OPTIMIZER_TIME_BUDGET = float(os.getenv("MEAL_PLAN_OPTIMIZER_TIME_BUDGET", 0.5))
+# Best scored recipes considered per run (required recipes come on top)
+MEAL_PLAN_OPTIMIZER_MAX_CANDIDATES = int(os.getenv("MEAL_PLAN_OPTIMIZER_MAX_CANDIDATES", 5000))
+
 # Cookie settings
 COOKIES_SAMESITE = os.getenv("COOKIES_SAMESITE", "Lax")
 